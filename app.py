@@ -1,34 +1,74 @@
-from flask import Flask, render_template, jsonify, request
-import google.generativeai as genai # Assuming this is how you use the SDK
-import os
 import dotenv
+# Before any module below reads its settings from the environment at import time.
+dotenv.load_dotenv()
+
+from flask import Blueprint, Flask, render_template, jsonify, request, Response, stream_with_context
+import os
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import json 
 import traceback 
 
-from find_places import find_gluten_free_restaurants_places_api, get_gemini_description
+import find_places
+from find_places import (
+    find_gluten_free_restaurants_places_api,
+    classify_establishments,
+    start_find_and_describe,
+    submit_classification,
+    provisional_establishments,
+    find_gluten_free_establishments_batch,
+    stream_find_and_describe,
+    find_gluten_free_nearby,
+    gemini_response_text,
+    GEMINI_MODEL,
+)
+from classification import PRODUCT_RESPONSE_SCHEMA, GeminiError, parse_product, no_matches_message
+from cache import search_cache, normalize_search_key
+import http_client
+import tracing
+from audit_log import audit_log
+from product_index import product_index
+from news_aggregator import news_aggregator, NEWS_REFRESH_INTERVAL_SECONDS
+from news_data import news_articles
+from single_flight import SingleFlight, SINGLE_FLIGHT_ENABLED
+from refresh import BackgroundRefresher, REFRESH_ENABLED, SEARCH_CACHE_SWR_SECONDS
+from deadline import search_deadline
+import http_cache
+from http_cache import cache_control, NO_STORE, HTTP_CACHE_MAX_AGE_SECONDS
+from http_client import get_upstream_stats, CircuitOpenError
+from llm import get_backend, get_backend_stats
+from rate_limit import get_circuit_breaker, get_rate_limit_stats
+from venue_index import (
+    venue_index,
+    coverage_regions,
+    region_center,
+    NEARBY_DEFAULT_RADIUS_METERS,
+    NEARBY_MAX_RADIUS_METERS,
+)
 
-dotenv.load_dotenv()
-
-app = Flask(__name__)
+# Routes are registered on this blueprint; create_app() builds the Flask app around it.
+routes = Blueprint('routes', __name__)
 
 GEMINI_API_KEY_FROM_ENV = os.getenv('GEMINI_API_KEY')
 if not GEMINI_API_KEY_FROM_ENV:
     raise ValueError("GEMINI_API_KEY not found in environment variables.")
 
-# Configure Gemini API (using the SDK method if that's your primary way)
-# If find_places.py makes direct REST calls, this configuration here is for other app parts
-# genai.configure(api_key=GEMINI_API_KEY_FROM_ENV)
-# gemini_model = genai.GenerativeModel(model_name='gemini-1.0-pro-flash') # Or gemini-1.5-flash if SDK supports
-
 GOOGLE_PLACES_API_KEY_FROM_ENV = os.getenv('GOOGLE_PLACES_API_KEY')
 if not GOOGLE_PLACES_API_KEY_FROM_ENV:
     raise ValueError("GOOGLE_PLACES_API_KEY not found in environment variables.")
 
-@app.route('/')
+# Classify page 1 of the Places results while page 2 is still being fetched.
+PIPELINED_PAGINATION = os.getenv('PIPELINED_PAGINATION', 'True').lower() not in ['false', '0', 'no']
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 500))
+# Concurrent identical /get-restaurants searches share one Places + Gemini run.
+search_flight = SingleFlight() if SINGLE_FLIGHT_ENABLED else None
+
+@routes.route('/')
 def home():
     return render_template('index.html')
 
-@app.route('/news')
+@routes.route('/news')
 def news():
     example_news_articles = [
         {"title": "Example News 1", "content": "Content for news 1...", "date": "2025-05-21"},
@@ -36,90 +76,385 @@ def news():
     ]
     return render_template('news.html', articles=example_news_articles)
 
-@app.route('/apps')
+@routes.route('/apps')
 def apps():
     return render_template('apps.html')
 
-@app.route('/scanner')
+@routes.route('/scanner')
 def scanner():
     return render_template('scanner.html') 
 
-@app.route('/check-product', methods=['POST'])
-def check_product():
-    data = request.get_json()
-    if not data or 'barcode' not in data:
-        return jsonify({"error": "Barcode not provided"}), 400
-    barcode = data.get('barcode')
-    
-    try:
-        # This part uses the Gemini SDK, ensure genai and gemini_model are configured above
-        # For consistency, you might want all Gemini calls (SDK or REST) to use the same model.
-        # This uses an SDK model instance which might be different from find_places.py's REST call.
-        if 'gemini_model' not in globals(): # Basic check if model is initialized
-             genai.configure(api_key=GEMINI_API_KEY_FROM_ENV)
-             # Choose a model consistent with what you expect, e.g., 'gemini-1.5-flash-latest' via SDK
-             # Check SDK documentation for available model names.
-             # Using 'gemini-pro' as a placeholder if specific flash model isn't via this SDK path.
-             current_gemini_model = genai.GenerativeModel(model_name='gemini-pro')
-        else:
-            current_gemini_model = gemini_model
+PRODUCT_GEMINI_MODEL = os.getenv('PRODUCT_GEMINI_MODEL', GEMINI_MODEL)
+PRODUCT_GENERATION_CONFIG = {
+    "temperature": 0.2,
+    "response_mime_type": "application/json",
+    "response_schema": PRODUCT_RESPONSE_SCHEMA,
+}
+PRODUCT_FALLBACK_RESULT = {
+    "isGlutenFree": "Cannot Determine",
+    "productName": None,
+    "brand": None,
+    "suggestion": "Could not reliably determine product status from barcode. Please check ingredients manually."
+}
 
+def lookup_known_product(barcode):
+    """Returns (answer, known_product): answer is set when the product index can respond without Gemini."""
+    if product_index is None:
+        return None, None
+    with tracing.span("product_index") as span_attributes:
+        known_product = product_index.lookup(barcode)
+        span_attributes["hit"] = known_product is not None
+    # Gemini's own answers, "Cannot Determine" included, are served until their TTL runs out;
+    # an undecided dump row is only prompt context for a fresh Gemini call.
+    if known_product is not None and (known_product["source"] == "gemini" or known_product["isGlutenFree"] != "Cannot Determine"):
+        print(f"✅ Product index hit for barcode {barcode} ({known_product['source']})")
+        return known_product, known_product
+    return None, known_product
 
-        current_generation_config = genai.types.GenerationConfig(temperature=0.2) 
-        prompt = f"""Given this product barcode: {barcode}
+def build_product_prompt(barcode, known_product=None):
+    # A dump row without allergen data still gives Gemini the name and brand to go on.
+    known_details = ""
+    if known_product is not None and known_product.get("productName"):
+        known_details = f" (product name: {known_product['productName']}, brand: {known_product.get('brand') or 'unknown'})"
+    return f"""Given this product barcode: {barcode}{known_details}
         1. Is this product gluten-free? Yes/No/Cannot Determine
         2. What is the product name? (If known)
         3. What is the brand? (If known)
         4. Provide a brief suggestion for gluten-free alternatives if not gluten-free or if status is 'Cannot Determine'.
-        
-        Respond ONLY in JSON format like this:
-        {{
-            "isGlutenFree": "Yes" | "No" | "Cannot Determine",
-            "productName": "string or null",
-            "brand": "string or null",
-            "suggestion": "string or null"
-        }}
+
+        Answer with isGlutenFree ("Yes", "No" or "Cannot Determine"), productName, brand and suggestion.
         If you cannot find information for the barcode, respond with "Cannot Determine" for isGlutenFree and null for other fields.
         """
-        
-        response = current_gemini_model.generate_content(prompt, generation_config=current_generation_config)
-        result_text = response.text
-        
-        try:
-            if result_text.strip().startswith("```json"):
-                result_text = result_text.strip()[7:-3].strip()
-            elif result_text.strip().startswith("```"):
-                 result_text = result_text.strip()[3:-3].strip()
-
-            result_dict = json.loads(result_text)
-            return jsonify(result_dict)
-        except json.JSONDecodeError as e:
-            print(f"JSONDecodeError from Gemini response in /check-product: {e}")
-            print(f"Problematic Gemini response text: {result_text}")
-            return jsonify({
-                "isGlutenFree": "Cannot Determine",
-                "productName": None,
-                "brand": None,
-                "suggestion": "Could not reliably determine product status from barcode. Please check ingredients manually."
-            }), 200 
+
+def parse_product_response(barcode, result_text):
+    """Validates Gemini's product JSON and writes it back to the product index."""
+    try:
+        result_dict = parse_product(result_text)
+    except GeminiError as e:
+        print(f"Invalid Gemini response in /check-product: {e}")
+        print(f"Problematic Gemini response text: {result_text}")
+        return dict(PRODUCT_FALLBACK_RESULT)
+    if product_index is not None:
+        product_index.store_gemini_result(barcode, result_dict)
+    return result_dict
+
+@routes.route('/check-product', methods=['POST'])
+def check_product():
+    data = request.get_json()
+    if not data or 'barcode' not in data:
+        return jsonify({"error": "Barcode not provided"}), 400
+    barcode = data.get('barcode')
+
+    try:
+        answer, known_product = lookup_known_product(barcode)
+        if answer is not None:
+            return jsonify(answer)
+
+        prompt = build_product_prompt(barcode, known_product)
+        gemini_data = get_backend(GEMINI_API_KEY_FROM_ENV, PRODUCT_GEMINI_MODEL).generate(prompt, PRODUCT_GENERATION_CONFIG)
+        return jsonify(parse_product_response(barcode, gemini_response_text(gemini_data))), 200
+    except GeminiError as e:
+        print(f"Error in /check-product: {e}")
+        return jsonify(dict(PRODUCT_FALLBACK_RESULT)), 200
     except Exception as e:
         print(f"Error in /check-product: {e}")
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
-@app.route('/get-news')
+@routes.route('/get-news')
 def get_news_api(): 
+    """Articles from the configured feeds, served from memory (see news_aggregator.py)."""
     try:
-        example_news_articles = [
-            {"id": 1, "title": "Understanding Gluten Sensitivity", "summary": "Learn the difference...", "date": "2025-05-20"},
-            {"id": 2, "title": "New GF Products on the Market", "summary": "Discover exciting new options...", "date": "2025-05-18"}
-        ]
-        return jsonify({"articles": example_news_articles})
+        articles = news_aggregator.articles()
+        if not articles:
+            # Nothing fetched yet in this process: show the curated list until the first refresh lands.
+            articles = news_articles
+        return jsonify({"articles": articles}), 200, {
+            "Cache-Control": cache_control(HTTP_CACHE_MAX_AGE_SECONDS, int(NEWS_REFRESH_INTERVAL_SECONDS))
+        }
     except Exception as e:
         print(f"Error in /get-news: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/get-restaurants')
+@routes.route('/cache-stats')
+def cache_stats():
+    stats = search_cache.stats()
+    stats["places"] = find_places.place_store.stats() if find_places.place_store is not None else None
+    stats["products"] = product_index.stats() if product_index is not None else None
+    stats["refresh"] = refresher.stats() if refresher is not None else None
+    stats["venues"] = venue_index.stats() if venue_index is not None else None
+    stats["region_refresh"] = region_refresher.stats() if region_refresher is not None else None
+    stats["news"] = news_aggregator.stats()
+    return jsonify(stats)
+
+@routes.route('/upstream-stats')
+def upstream_stats():
+    stats = get_upstream_stats()
+    stats["llm"] = get_backend_stats()
+    return jsonify(stats)
+
+@routes.route('/metrics')
+def metrics():
+    gauges = {}
+    memory_cache = search_cache.memory.stats()
+    for key in ("hits", "misses", "evictions", "expirations", "size"):
+        gauges[f"search_cache_memory_{key}"] = memory_cache[key]
+    if find_places.place_store is not None:
+        place_stats = find_places.place_store.stats()
+        gauges["place_cache_hits"] = place_stats["hits"]
+        gauges["place_cache_misses"] = place_stats["misses"]
+    if product_index is not None:
+        gauges["product_index_hits"] = product_index.hits
+        gauges["product_index_misses"] = product_index.misses
+    for key, value in audit_log.stats().items():
+        gauges[f"audit_log_{key}"] = value
+    if search_flight is not None:
+        gauges["single_flight_in_flight"] = search_flight.stats()["in_flight"]
+    if refresher is not None:
+        for key, value in refresher.stats().items():
+            gauges[f"refresh_{key}"] = value
+    if venue_index is not None:
+        venue_stats = venue_index.stats()
+        for key in ("venues", "covered_regions", "queries"):
+            if venue_stats[key] is not None:
+                gauges[f"venue_index_{key}"] = venue_stats[key]
+    if region_refresher is not None:
+        for key, value in region_refresher.stats().items():
+            gauges[f"region_refresh_{key}"] = value
+    news_stats = news_aggregator.stats()
+    for key in ("articles", "refreshes", "fetched", "not_modified", "failed"):
+        gauges[f"news_{key}"] = news_stats[key]
+    for upstream, limits in get_rate_limit_stats().items():
+        for key in ("rate", "throttled", "rate_decreases"):
+            if key in limits:
+                gauges[f"upstream_{upstream}_rate_limit_{key}"] = limits[key]
+        circuit = limits.get("circuit")
+        if circuit is not None:
+            for key in ("opened", "rejected", "half_open_probes"):
+                gauges[f"upstream_{upstream}_circuit_{key}"] = circuit[key]
+            gauges[f"upstream_{upstream}_circuit_open"] = circuit["state"] != "closed"
+    for upstream, count in http_client.retry_counts.items():
+        gauges[f"upstream_{upstream}_retries"] = count
+    body = tracing.render_prometheus(upstream_histograms=dict(http_client.latency_histograms), gauges=gauges)
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+def establishments_payload(cache_key, city, type_, country, places_list, establishments):
+    """
+    Builds the /get-restaurants response body from the classified establishment
+    records, caching it unless Gemini failed (`establishments` is None).
+    """
+    if not places_list: 
+        print(f"No establishments found for {type_} in {city} (country: {country}) by Google Places API.")
+
+    if establishments is None:
+        print(f"\n❌ Gemini could not classify the establishments for city: {city}, type: {type_}.")
+        return {
+            "establishments": [],
+            "message": f"Could not retrieve a detailed summary for {type_} in {city}.",
+            "raw_data": places_list if places_list else [],
+            # Not cached here, and marked so browsers and CDNs do not keep it either.
+            "partial": True,
+        }
+
+    response_payload = {
+        "establishments": establishments,
+        "raw_data": places_list 
+    }
+    if not establishments:
+        response_payload["message"] = no_matches_message(type_, city)
+    search_cache.set(cache_key, response_payload)
+    if venue_index is not None:
+        venue_index.record(places_list or [], establishments, type_)
+    return response_payload
+
+def refresh_search(cache_key, city, type_, country):
+    """Background refresh job: re-runs a search so its cache entry is renewed."""
+    breaker = unavailable_upstream()
+    if breaker is not None:
+        print(f"ℹ️ Skipping refresh of '{cache_key}': {breaker.name} is unavailable.")
+        return
+    if search_flight is None:
+        search_establishments(cache_key, city, type_, country)
+    else:
+        search_flight.do(cache_key, lambda: search_establishments(cache_key, city, type_, country))
+
+def cache_expiry(cache_key):
+    entry = search_cache.get_entry(cache_key)
+    return entry[1] if entry is not None else None
+
+refresher = BackgroundRefresher(refresh_search, cache_expiry) if REFRESH_ENABLED else None
+
+def cached_search_response(cache_key, city, type_, country):
+    """
+    Cached /get-restaurants body, or None. An entry that expired less than
+    SEARCH_CACHE_SWR_SECONDS ago is still returned, and a background refresh is queued for it.
+    """
+    if refresher is not None:
+        refresher.record_request(cache_key, city, type_, country)
+    with tracing.span("cache") as span_attributes:
+        cached_response = search_cache.get(cache_key)
+        span_attributes["hit"] = cached_response is not None
+        if cached_response is None and refresher is not None:
+            entry = search_cache.get_entry(cache_key)
+            if entry is not None and time.time() - entry[1] < SEARCH_CACHE_SWR_SECONDS:
+                cached_response = entry[0]
+                span_attributes["stale_while_revalidate"] = True
+                refresher.schedule(cache_key, city, type_, country)
+                tracing.increment("stale_while_revalidate_served")
+    if cached_response is not None:
+        print(f"✅ Serving cached result for '{cache_key}'")
+    return cached_response
+
+SEARCH_UPSTREAMS = ("places", "gemini")
+
+def unavailable_upstream():
+    """Returns the breaker of the first search upstream whose circuit is open, or None."""
+    for upstream in SEARCH_UPSTREAMS:
+        breaker = get_circuit_breaker(upstream)
+        if not breaker.available():
+            return breaker
+    return None
+
+def unavailable_payload(cache_key, upstream, retry_after):
+    """(body, status, headers) while an upstream is down: the stale cached result if there is one, else 503."""
+    stale = search_cache.get_stale(cache_key)
+    if stale is not None:
+        print(f"⚠️ {upstream} is unavailable. Serving stale result for '{cache_key}'")
+        tracing.increment("stale_served")
+        stale = dict(stale, stale=True)
+        return stale, 200, search_response_headers(stale)
+    tracing.increment("unavailable_rejected")
+    message = "Search is temporarily unavailable because an upstream service is over its quota. Please try again shortly."
+    return {"error": message}, 503, {"Retry-After": str(max(1, round(retry_after)))}
+
+def partial_payload(city, type_, places_list):
+    """
+    The /get-restaurants body when the deadline passes before Gemini answers:
+    the Places results plus the establishments already known locally. Not cached.
+    """
+    tracing.increment("deadline_partial_responses")
+    return {
+        "establishments": provisional_establishments(places_list, type_),
+        "raw_data": places_list,
+        "partial": True,
+        "message": f"Still checking the gluten-free options for {type_} in {city}. Try again in a few seconds for the full list.",
+    }
+
+def in_flight_payload(cache_key, city, type_):
+    """
+    The /get-restaurants body when the deadline passes while another request or
+    worker is running the same search: its stale cached result if there is one,
+    else a partial body without places. Not cached.
+    """
+    stale = search_cache.get_stale(cache_key)
+    if stale is not None:
+        tracing.increment("stale_served")
+        return dict(stale, stale=True)
+    return partial_payload(city, type_, [])
+
+# Searches answered with a partial body whose classification is still running: cache_key -> (places_list, Future).
+_unfinished_searches = {}
+_unfinished_lock = threading.Lock()
+
+def finish_in_background(unfinished, cache_key, city, type_, country, places_list, classification, run_callback=None):
+    """
+    Lets a classification the request stopped waiting for run to completion and
+    cache its result. `unfinished` holds it meanwhile, so repeated requests for
+    the same search wait on it instead of starting another Places + Gemini run.
+    Works with concurrent.futures Futures and asyncio Tasks alike; for a Task,
+    `run_callback(fn, future)` moves the caching off the event loop.
+    """
+    with _unfinished_lock:
+        if cache_key in unfinished:
+            return
+        unfinished[cache_key] = (places_list, classification)
+
+    def on_done(future):
+        establishments = None
+        if not future.cancelled() and future.exception() is None:
+            establishments = future.result()
+        elif not future.cancelled():
+            print(f"❌ Background classification for '{cache_key}' failed: {future.exception()}")
+        try:
+            establishments_payload(cache_key, city, type_, country, places_list, establishments)
+            if establishments is not None:
+                tracing.increment("deadline_background_completions")
+                print(f"✅ Background classification for '{cache_key}' finished and was cached.")
+        finally:
+            with _unfinished_lock:
+                unfinished.pop(cache_key, None)
+
+    if run_callback is None:
+        classification.add_done_callback(on_done)
+    else:
+        classification.add_done_callback(lambda future: run_callback(on_done, future))
+
+def unfinished_search(unfinished, cache_key):
+    with _unfinished_lock:
+        return unfinished.get(cache_key)
+
+def start_search(city, type_, country, deadline=None):
+    """Runs the Places stage of a search. Returns (places_list, Future of the establishment records)."""
+    if PIPELINED_PAGINATION:
+        return start_find_and_describe(
+            city,
+            GOOGLE_PLACES_API_KEY_FROM_ENV,
+            GEMINI_API_KEY_FROM_ENV,
+            type_=type_,
+            country_filter=country,
+            deadline=deadline,
+        )
+    places_list = find_gluten_free_restaurants_places_api(
+        city, 
+        GOOGLE_PLACES_API_KEY_FROM_ENV,
+        type_=type_,
+        country_filter=country, # MODIFIED: Pass country to the function
+        deadline=deadline,
+    )
+    if places_list:
+        print(f"ℹ️ Found {len(places_list)} unique places from Places API. Sending all to Gemini.")
+    # If Google Places API found nothing there is nothing to classify and the
+    # payload carries the standard "No type_ found..." message.
+    return places_list, submit_classification(places_list, city, GEMINI_API_KEY_FROM_ENV, type_)
+
+# Complete results may be reused by browsers and CDNs, and served stale while they refetch.
+SEARCH_CACHE_CONTROL = cache_control(HTTP_CACHE_MAX_AGE_SECONDS, SEARCH_CACHE_SWR_SECONDS)
+
+def search_response_headers(body):
+    """Cache-Control for a /get-restaurants body: partial ones are never stored, stale ones always revalidated."""
+    if body.get("partial"):
+        return {"Cache-Control": NO_STORE}
+    if body.get("stale"):
+        return {"Cache-Control": "no-cache"}
+    return {"Cache-Control": SEARCH_CACHE_CONTROL}
+
+def search_establishments(cache_key, city, type_, country, deadline=None):
+    """
+    Runs the Places + Gemini pipeline for one search and returns the response body.
+    With a `deadline`, a classification that is still running when it passes is
+    left to finish in the background and a partial body is returned instead.
+    """
+    unfinished = unfinished_search(_unfinished_searches, cache_key) if deadline is not None else None
+    if unfinished is not None:
+        print(f"ℹ️ Classification for '{cache_key}' is still running in the background. Waiting for it.")
+        places_list, classification = unfinished
+    else:
+        places_list, classification = start_search(city, type_, country, deadline)
+
+    if deadline is None:
+        establishments = classification.result()
+    else:
+        try:
+            with tracing.span("deadline_wait"):
+                establishments = classification.result(timeout=deadline.remaining())
+        except FutureTimeoutError:
+            print(f"⏱️ Deadline of {deadline.seconds:.1f}s reached for '{cache_key}'. Answering with the Places results.")
+            finish_in_background(_unfinished_searches, cache_key, city, type_, country, places_list, classification)
+            return partial_payload(city, type_, places_list)
+
+    return establishments_payload(cache_key, city, type_, country, places_list, establishments)
+
+@routes.route('/get-restaurants')
 def get_establishments_route():
     try:
         city = request.args.get('city')
@@ -132,54 +467,217 @@ def get_establishments_route():
             
         print(f"Received request for city: {city}, type: {type_}, country: {country}")
 
-        places_list = find_gluten_free_restaurants_places_api(
-            city, 
-            GOOGLE_PLACES_API_KEY_FROM_ENV,
-            type_=type_,
-            country_filter=country # MODIFIED: Pass country to the function
-        )
-        
-        if not places_list: 
-            # If Google Places API found nothing, Gemini will be called with an empty list
-            # and should return a "No type_ found..." message based on its prompt.
-            print(f"No establishments found for {type_} in {city} (country: {country}) by Google Places API.")
-            # Call Gemini with empty list to get the standard "no results" message
-            description = get_gemini_description(
-                [], 
-                city, 
-                GEMINI_API_KEY_FROM_ENV, # Use the globally loaded key for find_places.py
-                type_=type_
-                # country_context=country # Optionally pass country to Gemini for context if its prompt uses it
+        cache_key = normalize_search_key(city, country, type_)
+        cached_response = cached_search_response(cache_key, city, type_, country)
+        if cached_response is not None:
+            return jsonify(cached_response), 200, search_response_headers(cached_response)
+
+        breaker = unavailable_upstream()
+        if breaker is not None:
+            body, status, headers = unavailable_payload(cache_key, breaker.name, breaker.retry_after())
+            return jsonify(body), status, headers
+
+        deadline = search_deadline()
+        if search_flight is None:
+            body = search_establishments(cache_key, city, type_, country, deadline)
+        else:
+            body = search_flight.do(
+                cache_key,
+                lambda: search_establishments(cache_key, city, type_, country, deadline),
+                recheck=lambda: search_cache.get(cache_key),
+                deadline=deadline,
+                on_timeout=lambda: in_flight_payload(cache_key, city, type_),
             )
-            return jsonify({"result": description, "raw_data": []})
+        return jsonify(body), 200, search_response_headers(body)
+    except CircuitOpenError as e:
+        body, status, headers = unavailable_payload(cache_key, e.upstream, e.retry_after)
+        return jsonify(body), status, headers
+    except Exception as e:
+        print(f"Critical error in /get-establishments route: {e}")
+        traceback.print_exc()
+        return jsonify({"error": "An unexpected server error occurred. Please try again later."}), 500
 
-        print(f"ℹ️ Found {len(places_list)} unique places from Places API. Sending all to Gemini.")
-        
-        description = get_gemini_description(
-            places_list, 
-            city, 
-            GEMINI_API_KEY_FROM_ENV, # Use the globally loaded key for find_places.py
-            type_=type_
-            # country_context=country # Optionally pass country to Gemini for context if its prompt uses it
+def region_key(type_, cell):
+    return f"{type_}|{cell}"
+
+def fill_region(key, type_, cell):
+    """Background job: a Places location search over one coverage cell, classified and stored in the venue index."""
+    breaker = unavailable_upstream()
+    if breaker is not None:
+        print(f"ℹ️ Skipping search of region '{key}': {breaker.name} is unavailable.")
+        return
+    lat, lng, radius = region_center(cell)
+    places_list = find_gluten_free_nearby(lat, lng, radius, GOOGLE_PLACES_API_KEY_FROM_ENV, type_=type_)
+    establishments = classify_establishments(
+        places_list, f"the area around {lat:.4f}, {lng:.4f}", GEMINI_API_KEY_FROM_ENV, type_=type_
+    )
+    if establishments is None:
+        raise GeminiError(f"Gemini could not classify the {type_} in region {cell}.")
+    venue_index.record(places_list, establishments, type_)
+    venue_index.mark_covered(cell, type_)
+
+def region_expiry(key):
+    type_, cell = key.split("|", 1)
+    return venue_index.coverage_expiry(cell, type_)
+
+# Regions are searched off the request path; popular ones are re-searched before their coverage expires.
+region_refresher = BackgroundRefresher(fill_region, region_expiry) if venue_index is not None else None
+
+def _float_arg(name):
+    try:
+        value = float(request.args.get(name, ''))
+    except ValueError:
+        return None
+    return value if value == value and abs(value) != float('inf') else None
+
+@routes.route('/nearby')
+def nearby_route():
+    """
+    Known gluten-free venues within `radius` meters of `lat`,`lng`, nearest first,
+    answered from the venue index. Regions around the point that were never
+    searched, or not recently, are searched in the background; until then
+    "coverage" is "refreshing" and the client may ask again.
+    """
+    if venue_index is None:
+        return jsonify({"error": "Nearby search is not enabled on this server"}), 404
+    lat, lng = _float_arg('lat'), _float_arg('lng')
+    if lat is None or lng is None or not -90 <= lat <= 90 or not -180 <= lng <= 180:
+        return jsonify({"error": "Please provide 'lat' and 'lng' coordinates"}), 400
+    radius = _float_arg('radius') if request.args.get('radius') else NEARBY_DEFAULT_RADIUS_METERS
+    if radius is None or not 0 < radius <= NEARBY_MAX_RADIUS_METERS:
+        return jsonify({"error": f"'radius' must be between 0 and {NEARBY_MAX_RADIUS_METERS} meters"}), 400
+    type_ = request.args.get('type', 'restaurants')
+
+    venues = venue_index.nearby(lat, lng, radius, type_=type_)
+    regions = coverage_regions(lat, lng, radius)
+    for cell in regions:
+        region_refresher.record_request(region_key(type_, cell), type_, cell)
+    stale = venue_index.stale_regions(regions, type_)
+    if stale and unavailable_upstream() is None:
+        for cell in stale:
+            region_refresher.schedule(region_key(type_, cell), type_, cell)
+    # While regions are refreshing the answer changes soon, so clients revalidate (cheap with the ETag).
+    return jsonify({
+        "venues": venues,
+        "coverage": "refreshing" if stale else "complete",
+        "stale_regions": len(stale),
+    }), 200, {"Cache-Control": "no-cache" if stale else cache_control()}
+
+@routes.route('/get-restaurants/batch', methods=['POST'])
+def batch_establishments_route():
+    """
+    Body: {"searches": [{"city": ..., "country": ..., "type": ...}, ...]}
+    Returns {"results": [...]} with one entry per search, in request order.
+    Cached searches are answered directly; the rest run concurrently.
+    """
+    data = request.get_json(silent=True)
+    searches = data.get('searches') if isinstance(data, dict) else None
+    if not isinstance(searches, list) or not all(isinstance(item, dict) for item in searches):
+        return jsonify({"error": "Please provide a 'searches' list of {city, country, type} objects"}), 400
+    if len(searches) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"A batch may contain at most {BATCH_MAX_ITEMS} searches"}), 400
+
+    try:
+        results = [None] * len(searches)
+        pending_indexes = []
+        for i, search in enumerate(searches):
+            cached_response = search_cache.get(normalize_search_key(search.get('city'), search.get('country'), search.get('type') or 'restaurants'))
+            if cached_response is not None and search.get('city'):
+                results[i] = dict(cached_response, city=search.get('city'), country=search.get('country'), type=search.get('type') or 'restaurants')
+            else:
+                pending_indexes.append(i)
+
+        print(f"Received batch of {len(searches)} searches ({len(searches) - len(pending_indexes)} cached).")
+        batch_results = find_gluten_free_establishments_batch(
+            [searches[i] for i in pending_indexes],
+            GOOGLE_PLACES_API_KEY_FROM_ENV,
+            GEMINI_API_KEY_FROM_ENV
         )
-        
-        # This fallback logic might need adjustment based on how Gemini's "no results" vs. error messages are structured
-        if not description or description.strip() == "" or description.startswith("Error:") or "Gemini API blocked" in description:
-            print(f"\n❌ Gemini returned an empty or error description for city: {city}, type: {type_}. Description: '{description}'")
-            fallback_message = f"Could not retrieve a detailed summary for {type_} in {city}."
-            if description and ("No " in description and " found matching" in description): # Check if it's a Gemini "no results"
-                 fallback_message = description # Use Gemini's "no results" message
-            return jsonify({"result": fallback_message, "raw_data": places_list if places_list else []})
-            
-        return jsonify({
-            "result": description,
-            "raw_data": places_list 
-        })
+        for i, item in zip(pending_indexes, batch_results):
+            results[i] = item
+            if 'error' not in item:
+                search_cache.set(
+                    normalize_search_key(item['city'], item['country'], item['type']),
+                    {key: item[key] for key in ("establishments", "message", "raw_data") if key in item}
+                )
+                if venue_index is not None:
+                    venue_index.record(item['raw_data'], item['establishments'], item['type'])
+        return jsonify({"results": results})
     except Exception as e:
-        print(f"Critical error in /get-establishments route: {e}")
+        print(f"Critical error in /get-restaurants/batch route: {e}")
         traceback.print_exc()
         return jsonify({"error": "An unexpected server error occurred. Please try again later."}), 500
 
+@routes.route('/get-restaurants/stream')
+def stream_establishments_route():
+    """
+    Streaming variant of /get-restaurants. Emits newline-delimited JSON events
+    (see find_places.stream_find_and_describe) so the page can render places
+    while Gemini is still classifying them.
+    """
+    city = request.args.get('city')
+    type_ = request.args.get('type', 'restaurants')
+    country = request.args.get('country', None)
+
+    if not city:
+        return jsonify({"error": "Please provide a city name"}), 400
+
+    print(f"Received streaming request for city: {city}, type: {type_}, country: {country}")
+    cache_key = normalize_search_key(city, country, type_)
+
+    def generate():
+        cached_response = search_cache.get(cache_key)
+        if cached_response is not None:
+            print(f"✅ Streaming cached result for '{cache_key}'")
+            yield json.dumps({"event": "places", "raw_data": cached_response["raw_data"]}) + "\n"
+            for record in cached_response["establishments"]:
+                yield json.dumps(dict(record, event="establishment")) + "\n"
+            done = {key: value for key, value in cached_response.items() if key != "raw_data"}
+            yield json.dumps(dict(done, event="done")) + "\n"
+            return
+
+        try:
+            for event in stream_find_and_describe(
+                city,
+                GOOGLE_PLACES_API_KEY_FROM_ENV,
+                GEMINI_API_KEY_FROM_ENV,
+                type_=type_,
+                country_filter=country
+            ):
+                if event["event"] != "done":
+                    yield json.dumps(event) + "\n"
+                    continue
+                payload = establishments_payload(cache_key, city, type_, country, event["raw_data"], event["establishments"])
+                done = {key: value for key, value in payload.items() if key != "raw_data"}
+                yield json.dumps(dict(done, event="done")) + "\n"
+        except Exception as e:
+            print(f"Critical error in /get-restaurants/stream route: {e}")
+            traceback.print_exc()
+            yield json.dumps({"event": "error", "error": "An unexpected server error occurred. Please try again later."}) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def create_app():
+    """
+    Builds the Flask app. Importing this module only defines routes and
+    lightweight state: caches, stores and SQLite connections, HTTP sessions,
+    background threads and LLM backends are all created on first use in the
+    process that needs them. That makes the module safe to load once in a
+    gunicorn --preload master and share copy-on-write with the forked workers.
+    """
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(routes)
+    tracing.init_app(flask_app)
+    # Registered after tracing so it runs first and its counters land on the request's trace.
+    http_cache.init_app(flask_app)
+    return flask_app
+
+app = create_app()
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5007))
     flask_debug_env = os.environ.get('FLASK_DEBUG', 'False') 
@@ -0,0 +1,288 @@
+import asyncio
+import contextvars
+import io
+import json
+import sys
+import traceback
+from urllib.parse import parse_qs
+
+# First: importing app loads .env before the modules below read their settings.
+from app import (
+    app as flask_app,
+    GEMINI_API_KEY_FROM_ENV,
+    GOOGLE_PLACES_API_KEY_FROM_ENV,
+    PIPELINED_PAGINATION,
+    PRODUCT_GEMINI_MODEL,
+    PRODUCT_FALLBACK_RESULT,
+    PRODUCT_GENERATION_CONFIG,
+    establishments_payload,
+    unavailable_upstream,
+    cached_search_response,
+    unavailable_payload,
+    lookup_known_product,
+    build_product_prompt,
+    parse_product_response,
+    partial_payload,
+    in_flight_payload,
+    finish_in_background,
+    unfinished_search,
+    search_response_headers,
+)
+import async_http_client
+from http_client import CircuitOpenError
+import tracing
+from http_cache import prepare_response
+from cache import search_cache, normalize_search_key
+from find_places import gemini_response_text
+from classification import GeminiError
+from llm import get_backend
+import find_places_async
+from single_flight import AsyncSingleFlight, SINGLE_FLIGHT_ENABLED
+from deadline import search_deadline
+
+# Async serving mode: `uvicorn asgi:app` (or gunicorn with -k uvicorn.workers.UvicornWorker).
+# /get-restaurants and /check-product run on the event loop, so one process
+# holds many in-flight Places/Gemini waits; every other route is the Flask
+# app, run on a worker thread.
+
+search_flight = AsyncSingleFlight() if SINGLE_FLIGHT_ENABLED else None
+# Like app._unfinished_searches, but holding asyncio Tasks of this process's event loop.
+_unfinished_searches = {}
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def _prepare_json(status, body, headers=None, method="GET", request_headers=None):
+    """(status, data, headers) of a JSON response, with the same ETag / 304 and compression handling as the Flask routes."""
+    return prepare_response(
+        method, status, json.dumps(body).encode(), "application/json", request_headers or {}, headers
+    )
+
+
+async def _send_prepared(send, status, data, headers):
+    response_headers = [(b"content-length", str(len(data)).encode())]
+    if status != 304:
+        response_headers.append((b"content-type", b"application/json"))
+    for name, value in headers.items():
+        response_headers.append((name.lower().encode(), value.encode()))
+    await send({"type": "http.response.start", "status": status, "headers": response_headers})
+    await send({"type": "http.response.body", "body": data})
+
+
+async def get_establishments(query):
+    city = (query.get('city') or [None])[0]
+    type_ = (query.get('type') or ['restaurants'])[0]
+    country = (query.get('country') or [None])[0]
+    if not city:
+        return {"error": "Please provide a city name"}, 400, {}
+
+    print(f"Received request for city: {city}, type: {type_}, country: {country}")
+    cache_key = normalize_search_key(city, country, type_)
+    # The search cache, place store, venue index and product index are SQLite
+    # files; a locked one must not stall every request on the loop, so they are
+    # read and written on worker threads.
+    cached_response = await asyncio.to_thread(cached_search_response, cache_key, city, type_, country)
+    if cached_response is not None:
+        return cached_response, 200, search_response_headers(cached_response)
+
+    breaker = unavailable_upstream()
+    if breaker is not None:
+        return await asyncio.to_thread(unavailable_payload, cache_key, breaker.name, breaker.retry_after())
+
+    deadline = search_deadline()
+    try:
+        if search_flight is None:
+            result = await search_establishments(cache_key, city, type_, country, deadline)
+        else:
+            result = await search_flight.do(
+                cache_key,
+                lambda: search_establishments(cache_key, city, type_, country, deadline),
+                recheck=lambda: search_cache.get(cache_key),
+                deadline=deadline,
+                on_timeout=lambda: in_flight_payload(cache_key, city, type_),
+            )
+        return result, 200, search_response_headers(result)
+    except CircuitOpenError as e:
+        return await asyncio.to_thread(unavailable_payload, cache_key, e.upstream, e.retry_after)
+
+
+async def search_establishments(cache_key, city, type_, country, deadline=None):
+    """Async app.search_establishments, including the partial answer when `deadline` passes."""
+    unfinished = unfinished_search(_unfinished_searches, cache_key) if deadline is not None else None
+    if unfinished is not None:
+        print(f"ℹ️ Classification for '{cache_key}' is still running in the background. Waiting for it.")
+        places_list, classification = unfinished
+    elif PIPELINED_PAGINATION:
+        places_list, classification = await find_places_async.start_find_and_describe(
+            city, GOOGLE_PLACES_API_KEY_FROM_ENV, GEMINI_API_KEY_FROM_ENV, type_=type_, country_filter=country,
+            deadline=deadline,
+        )
+    else:
+        places_list = await find_places_async.find_gluten_free_restaurants_places_api(
+            city, GOOGLE_PLACES_API_KEY_FROM_ENV, type_=type_, country_filter=country, deadline=deadline
+        )
+        classification = asyncio.create_task(find_places_async.classify_establishments(
+            places_list, city, GEMINI_API_KEY_FROM_ENV, type_=type_
+        ))
+
+    if deadline is not None:
+        with tracing.span("deadline_wait"):
+            done, _ = await asyncio.wait({classification}, timeout=deadline.remaining())
+        if not done:
+            print(f"⏱️ Deadline of {deadline.seconds:.1f}s reached for '{cache_key}'. Answering with the Places results.")
+            finish_in_background(
+                _unfinished_searches, cache_key, city, type_, country, places_list, classification,
+                run_callback=_off_loop,
+            )
+            return await asyncio.to_thread(partial_payload, city, type_, places_list)
+    establishments = await classification
+    return await asyncio.to_thread(establishments_payload, cache_key, city, type_, country, places_list, establishments)
+
+
+def _off_loop(callback, *args):
+    """Runs a done-callback that writes to SQLite on a worker thread instead of the event loop."""
+    asyncio.get_running_loop().run_in_executor(None, callback, *args)
+
+
+async def check_product(body):
+    try:
+        data = json.loads(body or b"null")
+    except json.JSONDecodeError:
+        data = None
+    if not isinstance(data, dict) or 'barcode' not in data:
+        return {"error": "Barcode not provided"}, 400, {}
+    barcode = data.get('barcode')
+
+    answer, known_product = await asyncio.to_thread(lookup_known_product, barcode)
+    if answer is not None:
+        return answer, 200, {}
+
+    prompt = build_product_prompt(barcode, known_product)
+    try:
+        gemini_data = await get_backend(GEMINI_API_KEY_FROM_ENV, PRODUCT_GEMINI_MODEL).agenerate(prompt, PRODUCT_GENERATION_CONFIG)
+        text = gemini_response_text(gemini_data)
+    except GeminiError as e:
+        print(f"Error in /check-product: {e}")
+        return dict(PRODUCT_FALLBACK_RESULT), 200, {}
+    # Writes Gemini's answer back to the product index.
+    return await asyncio.to_thread(parse_product_response, barcode, text), 200, {}
+
+
+ASYNC_ROUTES = {
+    ("GET", "/get-restaurants"): lambda query, body: get_establishments(query),
+    ("POST", "/check-product"): lambda query, body: check_product(body),
+}
+
+
+async def _handle_async_route(handler, scope, receive, send):
+    request_headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+    token = tracing.begin_request(request_headers.get("x-request-id", ""), scope["path"])
+    try:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        body = await _read_body(receive) if scope["method"] == "POST" else b""
+        headers = {}
+        try:
+            result, status, headers = await handler(query, body)
+        except Exception as e:
+            print(f"Critical error in {scope['path']} route: {e}")
+            traceback.print_exc()
+            status, result = 500, {"error": "An unexpected server error occurred. Please try again later."}
+        # The trace records the status actually sent, e.g. a 304 rather than the handler's 200.
+        status, data, headers = _prepare_json(status, result, headers, scope["method"], request_headers)
+        headers.update(tracing.finish_request(scope["method"], scope["path"], status))
+        await _send_prepared(send, status, data, headers)
+    finally:
+        tracing.end_request(token)
+
+
+def _wsgi_environ(scope, body):
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE" or name == "CONTENT_LENGTH":
+            environ[name] = value
+        else:
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _handle_wsgi(scope, receive, send):
+    """Runs the Flask app on a worker thread, forwarding body chunks as they are produced."""
+    environ = _wsgi_environ(scope, await _read_body(receive))
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+    # Every step runs in one shared context: stream_with_context generators keep
+    # Flask's request context in context variables between chunks.
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+
+    def in_context(fn, *args):
+        return loop.run_in_executor(None, context.run, fn, *args)
+
+    body_iter = await in_context(flask_app, environ, start_response)
+    iterator = iter(body_iter)
+    try:
+        await send({"type": "http.response.start", "status": started["status"], "headers": started["headers"]})
+        while True:
+            chunk = await in_context(next, iterator, None)
+            if chunk is None:
+                break
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        if hasattr(body_iter, "close"):
+            await in_context(body_iter.close)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_http_client.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    handler = ASYNC_ROUTES.get((scope["method"], scope["path"]))
+    if handler is not None:
+        return await _handle_async_route(handler, scope, receive, send)
+    return await _handle_wsgi(scope, receive, send)
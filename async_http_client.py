@@ -0,0 +1,114 @@
+import asyncio
+import os
+import time
+import weakref
+
+import httpx
+
+from http_client import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_MAX_RETRIES,
+    HTTP_POOL_MAXSIZE,
+    RETRYABLE_STATUS_CODES,
+    UPSTREAM_READ_TIMEOUTS,
+    DEFAULT_READ_TIMEOUT,
+    _backoff_delay,
+    _histogram_for,
+    _stats_lock,
+    retry_counts,
+    record_outcome,
+    CircuitOpenError,
+)
+from rate_limit import get_rate_limiter, get_circuit_breaker
+from tracing import span, increment
+
+# In-flight upstream requests per event loop, across all hosts (httpx's pool
+# limit is not per host). Requests beyond it wait for a free connection.
+HTTP_ASYNC_MAX_CONNECTIONS = int(os.getenv('HTTP_ASYNC_MAX_CONNECTIONS', 100))
+
+# httpx clients are bound to the event loop they were first used on.
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """Returns the pooled AsyncClient for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        # HTTP_POOL_MAXSIZE idle connections are kept for reuse, as in the sync per-host pools.
+        limits = httpx.Limits(max_connections=HTTP_ASYNC_MAX_CONNECTIONS, max_keepalive_connections=HTTP_POOL_MAXSIZE)
+        client = httpx.AsyncClient(limits=limits)
+        _clients[loop] = client
+    return client
+
+
+async def aclose():
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def request(method, url, upstream, timeout=None, max_retries=HTTP_MAX_RETRIES, **kwargs):
+    """
+    Async counterpart of http_client.request with the same retry, backoff,
+    rate-limit and metrics behaviour. Waiting (rate limits, backoff, the
+    upstream itself) yields to the event loop instead of holding a worker.
+    Returns an httpx.Response; failures raise httpx exceptions, or
+    http_client.CircuitOpenError when the upstream's circuit is open.
+    """
+    if timeout is None:
+        timeout = httpx.Timeout(UPSTREAM_READ_TIMEOUTS.get(upstream, DEFAULT_READ_TIMEOUT), connect=HTTP_CONNECT_TIMEOUT)
+    client = get_client()
+    histogram = _histogram_for(upstream)
+    limiter = get_rate_limiter(upstream)
+    breaker = get_circuit_breaker(upstream)
+    if not breaker.allow():
+        raise CircuitOpenError(upstream, breaker.retry_after())
+
+    attempt = 0
+    while True:
+        if limiter is not None:
+            await limiter.acquire_async()
+        started = time.perf_counter()
+        increment(f"{upstream}_requests")
+        try:
+            with span(upstream, attempt=attempt) as span_attributes:
+                try:
+                    response = await client.request(method, url, timeout=timeout, **kwargs)
+                except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError):
+                    span_attributes["status"] = "connection_error"
+                    raise
+                span_attributes["status"] = response.status_code
+                span_attributes["response_bytes"] = len(response.content)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError):
+            histogram.observe(time.perf_counter() - started)
+            if attempt >= max_retries:
+                breaker.record_failure()
+                raise
+            delay = _backoff_delay(attempt)
+        except httpx.HTTPError:
+            histogram.observe(time.perf_counter() - started)
+            breaker.record_failure()
+            raise
+        else:
+            histogram.observe(time.perf_counter() - started)
+            if response.status_code == 429 and limiter is not None:
+                limiter.on_rate_limited()
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= max_retries:
+                record_outcome(upstream, response)
+                return response
+            delay = _backoff_delay(attempt, response)
+            print(f"⚠️ {upstream} returned HTTP {response.status_code}. Retrying in {delay:.2f}s (attempt {attempt + 1}/{max_retries})...")
+
+        with _stats_lock:
+            retry_counts[upstream] = retry_counts.get(upstream, 0) + 1
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def get(url, upstream, **kwargs):
+    return await request("GET", url, upstream, **kwargs)
+
+
+async def post(url, upstream, **kwargs):
+    return await request("POST", url, upstream, **kwargs)
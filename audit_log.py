@@ -0,0 +1,123 @@
+import atexit
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+AUDIT_LOG_PATH = os.getenv('AUDIT_LOG_PATH', 'google_places_output.jsonl')
+AUDIT_LOG_ENABLED = os.getenv('AUDIT_LOG_ENABLED', 'True').lower() not in ['false', '0', 'no']
+# Fraction of searches written to the log (1.0 = all).
+AUDIT_LOG_SAMPLE_RATE = float(os.getenv('AUDIT_LOG_SAMPLE_RATE', 1.0))
+AUDIT_LOG_MAX_BYTES = int(os.getenv('AUDIT_LOG_MAX_BYTES', 10 * 1024 * 1024))
+AUDIT_LOG_BACKUP_COUNT = int(os.getenv('AUDIT_LOG_BACKUP_COUNT', 3))
+AUDIT_LOG_QUEUE_SIZE = int(os.getenv('AUDIT_LOG_QUEUE_SIZE', 1000))
+
+
+class AuditLog:
+    """
+    Append-only JSON-lines sink written by a background thread.
+
+    log() never blocks the request: entries go onto a bounded queue and are
+    dropped (and counted) when it is full. Each gunicorn worker writes its own
+    file (the pid is added to the path) so workers never interleave lines, and
+    files are rotated once they exceed `max_bytes`.
+    """
+
+    def __init__(self, path=AUDIT_LOG_PATH, enabled=AUDIT_LOG_ENABLED, sample_rate=AUDIT_LOG_SAMPLE_RATE,
+                 max_bytes=AUDIT_LOG_MAX_BYTES, backup_count=AUDIT_LOG_BACKUP_COUNT, queue_size=AUDIT_LOG_QUEUE_SIZE):
+        self.path = path
+        self.enabled = enabled and bool(path)
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = None
+        self._writer_pid = None
+        self._writer_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+
+    def _ensure_writer(self):
+        # The writer thread is (re)started lazily per process so a gunicorn
+        # --preload master never hands a dead thread to its forked workers.
+        if self._writer_pid == os.getpid() and self._writer.is_alive():
+            return
+        with self._writer_lock:
+            if self._writer_pid != os.getpid() or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+                self._writer_pid = os.getpid()
+                self._writer.start()
+
+    def log(self, event, **fields):
+        if not self.enabled:
+            return
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return
+        self._ensure_writer()
+        entry = {"ts": round(time.time(), 3), "event": event}
+        entry.update(fields)
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _file_path(self):
+        root, ext = os.path.splitext(self.path)
+        return f"{root}.{os.getpid()}{ext}"
+
+    def _rotate(self, path):
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{path}.{i}"):
+                os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(path, f"{path}.1")
+        else:
+            os.remove(path)
+
+    def _run(self):
+        path = self._file_path()
+        while True:
+            entries = [self._queue.get()]
+            # Drain whatever else is waiting so bursts become one write.
+            while True:
+                try:
+                    entries.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if os.path.exists(path) and os.path.getsize(path) >= self.max_bytes:
+                    self._rotate(path)
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n" for entry in entries))
+                self.written += len(entries)
+            except OSError as e:
+                self.dropped += len(entries)
+                print(f"⚠️ Could not write audit log {path}: {e}")
+            finally:
+                for _ in entries:
+                    self._queue.task_done()
+
+    def flush(self, timeout=2.0):
+        """Waits (up to `timeout` seconds) for queued entries to reach disk."""
+        if self._writer is None or self._writer_pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+        }
+
+
+audit_log = AuditLog()
+atexit.register(audit_log.flush)
@@ -0,0 +1,267 @@
+"""
+Local stand-ins for Google Places Text Search and Gemini generateContent /
+streamGenerateContent, for benchmarks and load tests that must not touch the
+real APIs.
+
+Point the app at it with:
+    PLACES_TEXT_SEARCH_URL=http://127.0.0.1:8900/maps/api/place/textsearch/json
+    GEMINI_API_ROOT=http://127.0.0.1:8900
+
+Run standalone:
+    python -m benchmarks.fake_upstreams --port 8900 --gemini-latency-ms 1500
+GET /stats returns per-endpoint call counts; POST /reset clears them.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+GF_STATUS_CODES = ["D", "O", "U"]
+NAME_WORDS = ["Glutenfrei", "Trattoria", "Bistro", "Kitchen", "Cafe", "Bakery", "Pizzeria", "Diner", "Garden", "Corner"]
+
+
+class FakeUpstreamConfig:
+    def __init__(self, places_latency_ms=120, gemini_latency_ms=1200, gemini_ms_per_place=15,
+                 results_per_page=20, pages=2, token_delay_ms=1500, error_rate=0.0,
+                 over_query_limit_rate=0.0, stream_chunks=8, seed=None):
+        self.places_latency_ms = places_latency_ms
+        self.gemini_latency_ms = gemini_latency_ms
+        self.gemini_ms_per_place = gemini_ms_per_place
+        self.results_per_page = results_per_page
+        self.pages = pages
+        self.token_delay_ms = token_delay_ms
+        self.error_rate = error_rate
+        self.over_query_limit_rate = over_query_limit_rate
+        self.stream_chunks = stream_chunks
+        self.random = random.Random(seed)
+
+
+def _fake_places(query, page, count):
+    """Deterministic places for a query, so repeated searches return the same venues."""
+    results = []
+    for i in range(count):
+        digest = hashlib.sha1(f"{query}|{page}|{i}".encode()).hexdigest()
+        words = [NAME_WORDS[int(digest[j:j + 2], 16) % len(NAME_WORDS)] for j in (0, 2)]
+        results.append({
+            "name": f"{words[0]} {words[1]} {digest[:4]}",
+            "formatted_address": f"{int(digest[4:6], 16)} Example Street, {query.split(' in ')[-1]}",
+            "place_id": f"fake-{digest[:16]}",
+            "business_status": "OPERATIONAL",
+            "types": ["restaurant", "food", "point_of_interest"] if int(digest[6], 16) % 3 else ["cafe", "bakery", "food"],
+            "rating": round(3 + int(digest[7], 16) / 8, 1),
+            "user_ratings_total": int(digest[8:11], 16),
+            "geometry": {"location": {"lat": 48 + int(digest[11:13], 16) / 1000, "lng": 11 + int(digest[13:15], 16) / 1000}},
+        })
+    return results
+
+
+def _fake_classification(prompt):
+    """Answers the single-request or batched JSON-mode classification prompt the way Gemini would."""
+    place_ids = re.findall(r"^- ((?:r\d+\.)?\d+) \|", prompt, re.M)
+    records = [
+        {"id": place_id, "gf": GF_STATUS_CODES[int(hashlib.sha1(place_id.encode()).hexdigest(), 16) % 3], "match": True}
+        for place_id in place_ids
+    ]
+    return json.dumps(records), len(place_ids)
+
+
+def make_handler(config, stats, stats_lock):
+    tokens_issued = {}
+
+    class FakeUpstreamHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _count(self, key):
+            with stats_lock:
+                stats[key] = stats.get(key, 0) + 1
+
+        def _send_json(self, body, status=200):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _maybe_fail(self):
+            if config.error_rate and config.random.random() < config.error_rate:
+                self._count("injected_errors")
+                self._send_json({"error": {"code": 503, "message": "fake upstream error"}}, status=503)
+                return True
+            return False
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == "/stats":
+                with stats_lock:
+                    return self._send_json(dict(stats))
+            if url.path != "/maps/api/place/textsearch/json":
+                return self._send_json({"error": "not found"}, status=404)
+
+            self._count("places_calls")
+            time.sleep(config.places_latency_ms / 1000.0)
+            if self._maybe_fail():
+                return
+            if config.over_query_limit_rate and config.random.random() < config.over_query_limit_rate:
+                self._count("places_over_query_limit")
+                return self._send_json({"status": "OVER_QUERY_LIMIT", "results": [], "error_message": "fake quota"})
+
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            if "pagetoken" in params:
+                token = params["pagetoken"]
+                issued = tokens_issued.get(token)
+                if issued is None:
+                    return self._send_json({"status": "INVALID_REQUEST", "results": []})
+                query, page, issued_at = issued
+                if time.monotonic() - issued_at < config.token_delay_ms / 1000.0:
+                    self._count("places_token_not_ready")
+                    return self._send_json({"status": "INVALID_REQUEST", "results": []})
+            else:
+                query, page = params.get("query", ""), 0
+
+            body = {"status": "OK", "results": _fake_places(query, page, config.results_per_page)}
+            if page + 1 < config.pages:
+                token = hashlib.sha1(f"{query}|{page + 1}|{time.monotonic()}".encode()).hexdigest()
+                tokens_issued[token] = (query, page + 1, time.monotonic())
+                body["next_page_token"] = token
+            self._send_json(body)
+
+        def do_POST(self):
+            url = urlsplit(self.path)
+            if url.path == "/reset":
+                with stats_lock:
+                    stats.clear()
+                return self._send_json({"ok": True})
+            if not url.path.startswith("/v1beta/models/"):
+                return self._send_json({"error": "not found"}, status=404)
+
+            streaming = ":streamGenerateContent" in url.path
+            self._count("gemini_stream_calls" if streaming else "gemini_calls")
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            prompt = payload["contents"][0]["parts"][0]["text"]
+            text, place_count = _fake_classification(prompt)
+            usage = {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4}
+            usage["totalTokenCount"] = usage["promptTokenCount"] + usage["candidatesTokenCount"]
+            with stats_lock:
+                stats["gemini_prompt_tokens"] = stats.get("gemini_prompt_tokens", 0) + usage["promptTokenCount"]
+                stats["gemini_output_tokens"] = stats.get("gemini_output_tokens", 0) + usage["candidatesTokenCount"]
+
+            total_latency = (config.gemini_latency_ms + config.gemini_ms_per_place * place_count) / 1000.0
+            if self._maybe_fail():
+                return
+            if not streaming:
+                time.sleep(total_latency)
+                return self._send_json({"candidates": [{"content": {"parts": [{"text": text}]}}], "usageMetadata": usage})
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            chunk_size = max(1, len(text) // config.stream_chunks + 1)
+            for start in range(0, len(text), chunk_size):
+                time.sleep(total_latency / config.stream_chunks)
+                event = {"candidates": [{"content": {"parts": [{"text": text[start:start + chunk_size]}]}}]}
+                data = f"data: {json.dumps(event)}\r\n\r\n".encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+    return FakeUpstreamHandler
+
+
+class FakeUpstreams:
+    """Runs the fake Places + Gemini server on a background thread."""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or FakeUpstreamConfig()
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), make_handler(self.config, self.stats, self._stats_lock))
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-upstreams", daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def app_env(self):
+        """Environment variables that point find_places.py at this server."""
+        return {
+            "PLACES_TEXT_SEARCH_URL": f"{self.base_url}/maps/api/place/textsearch/json",
+            "GEMINI_API_ROOT": self.base_url,
+            "GOOGLE_PLACES_API_KEY": "fake-places-key",
+            "GEMINI_API_KEY": "fake-gemini-key",
+        }
+
+    def snapshot(self):
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def reset(self):
+        with self._stats_lock:
+            self.stats.clear()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def add_config_arguments(parser):
+    parser.add_argument("--places-latency-ms", type=float, default=120)
+    parser.add_argument("--gemini-latency-ms", type=float, default=1200)
+    parser.add_argument("--gemini-ms-per-place", type=float, default=15)
+    parser.add_argument("--results-per-page", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=2)
+    parser.add_argument("--token-delay-ms", type=float, default=1500)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--over-query-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args):
+    return FakeUpstreamConfig(
+        places_latency_ms=args.places_latency_ms,
+        gemini_latency_ms=args.gemini_latency_ms,
+        gemini_ms_per_place=args.gemini_ms_per_place,
+        results_per_page=args.results_per_page,
+        pages=args.pages,
+        token_delay_ms=args.token_delay_ms,
+        error_rate=args.error_rate,
+        over_query_limit_rate=args.over_query_limit_rate,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    upstreams = FakeUpstreams(config_from_args(args), host=args.host, port=args.port)
+    print(f"Fake Places + Gemini listening on {upstreams.base_url}")
+    for key, value in upstreams.app_env().items():
+        print(f"  export {key}={value}")
+    try:
+        upstreams.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Compares Gemini token usage and wall time per establishment between the
+one-prompt-per-city path (classify_establishments) and the micro-batched
+structured-output path (gemini_batcher).
+
+Usage (needs GOOGLE_PLACES_API_KEY and GEMINI_API_KEY in .env):
+    python -m benchmarks.gemini_batching Berlin Munich Vienna Zurich --type restaurants
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import http_client
+from find_places import (
+    GEMINI_API_KEY,
+    GOOGLE_PLACES_API_KEY,
+    GEMINI_API_BASE,
+    GEMINI_GENERATION_CONFIG,
+    build_gemini_prompt,
+    find_gluten_free_restaurants_places_api,
+)
+from gemini_batcher import GeminiClassificationBatcher
+
+
+def run_single_prompt(places_by_city, type_):
+    """One Gemini call per city, as classify_establishments makes them, run concurrently."""
+    def classify(city):
+        payload = {
+            "contents": [{"parts": [{"text": build_gemini_prompt(places_by_city[city], city, type_)}]}],
+            "generationConfig": GEMINI_GENERATION_CONFIG
+        }
+        response = http_client.post(
+            f"{GEMINI_API_BASE}:generateContent?key={GEMINI_API_KEY}",
+            "gemini",
+            headers={"Content-Type": "application/json"},
+            json=payload,
+        )
+        response.raise_for_status()
+        return response.json().get("usageMetadata", {})
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(places_by_city)) as executor:
+        usages = list(executor.map(classify, places_by_city))
+    return {
+        "calls": len(usages),
+        "prompt_tokens": sum(usage.get("promptTokenCount", 0) for usage in usages),
+        "output_tokens": sum(usage.get("candidatesTokenCount", 0) for usage in usages),
+        "wall_seconds": time.perf_counter() - started,
+    }
+
+
+def run_batched(places_by_city, type_):
+    """All cities submitted concurrently so they land in the same micro-batching window."""
+    batcher = GeminiClassificationBatcher(GEMINI_API_KEY)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(places_by_city)) as executor:
+        list(executor.map(lambda city: batcher.classify(places_by_city[city], city, type_), places_by_city))
+    return dict(batcher.stats, wall_seconds=time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cities", nargs="+")
+    parser.add_argument("--type", default="restaurants", choices=["restaurants", "cafes", "bakery"])
+    args = parser.parse_args()
+
+    if not GOOGLE_PLACES_API_KEY or not GEMINI_API_KEY:
+        raise SystemExit("API keys missing. Please set them in .env.")
+
+    places_by_city = {}
+    for city in args.cities:
+        places = find_gluten_free_restaurants_places_api(city, GOOGLE_PLACES_API_KEY, type_=args.type)
+        if places:
+            places_by_city[city] = places
+    establishment_count = sum(len(places) for places in places_by_city.values())
+    if not establishment_count:
+        raise SystemExit("Places returned no establishments for the given cities.")
+
+    print(f"\n--- {len(places_by_city)} cities, {establishment_count} establishments ---")
+    for label, run in (("single prompt per city", run_single_prompt), ("micro-batched JSON", run_batched)):
+        stats = run(places_by_city, args.type)
+        total_tokens = stats["prompt_tokens"] + stats["output_tokens"]
+        print(
+            f"{label:>24}: {stats['calls']} calls, "
+            f"{total_tokens / establishment_count:.1f} tokens/establishment "
+            f"({stats['prompt_tokens']} prompt + {stats['output_tokens']} output), "
+            f"{stats['wall_seconds'] * 1000 / establishment_count:.1f} ms wall/establishment"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Cold-start budget: imports the app in a fresh interpreter under
+`python -X importtime` and reports the total and the slowest top-level
+imports. Exits non-zero if the import takes longer than --budget-ms or
+pulls in a module that must stay lazy (httpx, feedparser).
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --module asgi --budget-ms 800 --runs 5
+
+Needs no API keys or .env; fake keys are set for the child process.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Libraries each entry point only needs on first use: the Flask app makes no
+# httpx calls of its own, and feeds are parsed by the background refresh.
+LAZY_MODULES = {
+    "app": ["httpx", "feedparser"],
+    "asgi": ["feedparser"],
+}
+DEFAULT_BUDGET_MS = 600
+
+
+def measure(module):
+    """{top_level_module: cumulative_microseconds} for one cold import of `module`."""
+    env = dict(
+        os.environ,
+        GEMINI_API_KEY=os.environ.get("GEMINI_API_KEY", "import-time-benchmark"),
+        GOOGLE_PLACES_API_KEY=os.environ.get("GOOGLE_PLACES_API_KEY", "import-time-benchmark"),
+        PYTHONDONTWRITEBYTECODE="",
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{result.stderr[-2000:]}")
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # One space follows the separator; nested imports are indented further.
+        imports[name[1:].rstrip()] = int(cumulative)
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=3, help="the median run is reported")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.runs)]
+    totals = [run[args.module] for run in runs]
+    median_total = statistics.median(totals)
+    imports = runs[totals.index(median_total)] if median_total in totals else runs[0]
+
+    # Modules imported directly by the target are indented one level (two spaces).
+    direct = {name.strip(): micros for name, micros in imports.items() if name.startswith("  ") and not name.startswith("   ")}
+    print(f"import {args.module}: {median_total / 1000:.0f} ms (median of {args.runs}, budget {args.budget_ms:.0f} ms)")
+    for name, micros in sorted(direct.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {micros / 1000:>7.1f} ms  {name}")
+
+    failures = []
+    if median_total / 1000 > args.budget_ms:
+        failures.append(f"import took {median_total / 1000:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+    for lazy_module in LAZY_MODULES.get(args.module, []):
+        if any(name.strip() == lazy_module for name in imports):
+            failures.append(f"{lazy_module} is imported at startup; it should be imported on first use")
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
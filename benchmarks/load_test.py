@@ -0,0 +1,149 @@
+"""
+Load test for /get-restaurants against local fake upstreams.
+
+Starts benchmarks.fake_upstreams in-process, launches `gunicorn app:app` pointed
+at it, drives the endpoint with a fixed number of concurrent clients and reports
+latency percentiles, throughput and upstream calls per request.
+
+    python -m benchmarks.load_test --concurrency 16 --requests 200 --workers 2
+    python -m benchmarks.load_test --repeat-ratio 0.8        # 80% of searches hit popular cities
+    python -m benchmarks.load_test --gunicorn-args="--worker-class gthread --threads 8"
+"""
+import argparse
+import math
+import os
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.fake_upstreams import FakeUpstreams, add_config_arguments, config_from_args
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POPULAR_CITIES = ["Berlin", "Munich", "Vienna", "Rome", "Paris", "London", "Helsinki", "Barcelona"]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"gunicorn exited with code {process.returncode}")
+        try:
+            requests.get(url, timeout=5)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    raise SystemExit(f"gunicorn did not start within {timeout}s")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank method.
+    index = max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def build_searches(count, repeat_ratio, types, seed):
+    rng = random.Random(seed)
+    searches = []
+    for i in range(count):
+        if rng.random() < repeat_ratio:
+            city = rng.choice(POPULAR_CITIES)
+        else:
+            city = f"Testville {i}"
+        searches.append({"city": city, "type": rng.choice(types)})
+    return searches
+
+
+def run_load(base_url, searches, concurrency, path):
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+    def one(search):
+        started = time.perf_counter()
+        try:
+            response = session.get(f"{base_url}{path}", params=search, timeout=300)
+            response.content
+            ok = response.status_code == 200
+        except requests.exceptions.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, searches))
+    return results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--repeat-ratio", type=float, default=0.0,
+                        help="share of requests that reuse a popular city (exercises caching)")
+    parser.add_argument("--types", default="restaurants,cafes,bakery")
+    parser.add_argument("--path", default="/get-restaurants")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--gunicorn-args", default="", help="extra arguments passed to gunicorn")
+    parser.add_argument("--app", default="app:app", help="WSGI/ASGI application to serve")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the app, e.g. --app-env PIPELINED_PAGINATION=False")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    upstreams = FakeUpstreams(config_from_args(args)).start()
+    port = _free_port()
+    env = dict(os.environ)
+    env.update(upstreams.app_env())
+    # Start every run cold unless the caller opts back in to persistent caches.
+    env.setdefault("PLACE_CACHE_DB_PATH", "")
+    env.setdefault("AUDIT_LOG_ENABLED", "False")
+    for item in args.app_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+
+    command = [sys.executable, "-m", "gunicorn", args.app, "--bind", f"127.0.0.1:{port}",
+               "--workers", str(args.workers), "--timeout", "300", "--log-level", "warning"]
+    command += shlex.split(args.gunicorn_args)
+    server = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_until_up(f"{base_url}/apps", server)
+        upstreams.reset()
+        searches = build_searches(args.requests, args.repeat_ratio, args.types.split(","), args.seed)
+        results, elapsed = run_load(base_url, searches, args.concurrency, args.path)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        upstreams.stop()
+
+    latencies = sorted(latency for latency, _ in results)
+    failures = sum(1 for _, ok in results if not ok)
+    upstream_stats = upstreams.snapshot()
+    count = len(results)
+
+    print(f"\n--- {count} requests, concurrency {args.concurrency}, {args.workers} gunicorn workers ---")
+    print(f"throughput: {count / elapsed:.2f} req/s over {elapsed:.1f}s ({failures} failed)")
+    print(f"latency ms: p50 {percentile(latencies, 50) * 1000:.0f}  "
+          f"p95 {percentile(latencies, 95) * 1000:.0f}  "
+          f"p99 {percentile(latencies, 99) * 1000:.0f}  "
+          f"max {latencies[-1] * 1000:.0f}")
+    print("upstream counters per request:")
+    for key in sorted(upstream_stats):
+        print(f"  {key:<26} {upstream_stats[key] / count:.2f}")
+
+
+if __name__ == "__main__":
+    main()
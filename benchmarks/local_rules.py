@@ -0,0 +1,81 @@
+"""
+Checks the local pre-classification rules (gf_rules.py) against a labelled
+corpus and reports how many places they keep away from Gemini.
+
+    python -m benchmarks.local_rules                                 # benchmarks/gf_rules_corpus.jsonl
+    python -m benchmarks.local_rules --audit-log google_places_output.jsonl
+
+Each corpus line is a place ({"place_id", "name", "types"}) with the
+requested "type" and the "expected" local verdict: a GF status, null for a
+place that cannot match the type, or "gemini" for places the rules must not
+decide. Exits non-zero if any verdict differs. With --audit-log it also
+reports the share of real Places results decided locally.
+"""
+import argparse
+import json
+import os
+import time
+
+from gf_rules import classify_locally
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "gf_rules_corpus.jsonl")
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check_corpus(corpus):
+    mismatches = []
+    for case in corpus:
+        verdicts, _ = classify_locally([case], case["type"])
+        actual = verdicts[case["place_id"]] if case["place_id"] in verdicts else "gemini"
+        if actual != case["expected"]:
+            mismatches.append((case, actual))
+    return mismatches
+
+
+def audit_log_searches(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            event = json.loads(line)
+            if event.get("event") == "places_search" and event.get("places"):
+                yield event["type"], event["places"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--audit-log", help="JSON-lines audit log whose searches are run through the rules")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    mismatches = check_corpus(corpus)
+    for case, actual in mismatches:
+        print(f"❌ {case['name']!r} ({case['type']}): expected {case['expected']!r}, got {actual!r} — {case['note']}")
+    decided = sum(1 for case in corpus if case["expected"] != "gemini")
+    print(f"corpus: {len(corpus) - len(mismatches)}/{len(corpus)} verdicts as expected, {decided} decided locally")
+
+    rounds = 200
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for case in corpus:
+            classify_locally([case], case["type"])
+    print(f"rule engine: {(time.perf_counter() - started) * 1e6 / (rounds * len(corpus)):.1f} µs per place")
+
+    if args.audit_log:
+        places = local = 0
+        for type_, search_places in audit_log_searches(args.audit_log):
+            verdicts, _ = classify_locally(search_places, type_)
+            places += len(search_places)
+            local += len(verdicts)
+        if places:
+            print(f"audit log: {local}/{places} places ({local / places:.0%}) decided without Gemini")
+
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
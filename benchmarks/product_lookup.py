@@ -0,0 +1,109 @@
+"""
+Memory and lookup latency of the packed (mmap) product index against a plain
+Python dict holding the same products.
+
+Each measurement runs in a fresh subprocess so RSS is not polluted by the
+other variant. The packed file is built once per size in --workdir.
+
+    python -m benchmarks.product_lookup                       # 1M and 10M products
+    python -m benchmarks.product_lookup --counts 200000 --lookups 50000
+
+RSS for the packed index counts the file pages a process has touched; those
+pages live in the shared page cache, so N gunicorn workers pay for them once.
+The dict's RSS is private and is paid again by every worker.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from product_pack import PackedProductIndex, build_packed_index
+
+STATUSES = ["Yes", "No", "Cannot Determine"]
+
+
+def synthetic_rows(count, seed=1):
+    rng = random.Random(seed)
+    for i in range(count):
+        barcode = f"{4000000000000 + i * 7:013d}"
+        yield barcode, STATUSES[i % 3], f"Product {i} {rng.choice(['Crackers', 'Pasta', 'Bread', 'Oats'])}", f"Brand {i % 5000}"
+
+
+def _rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def _measure(mode, count, pack_path, lookups):
+    """Runs inside the child process and prints one JSON line."""
+    baseline_kb = _rss_kb()
+    started = time.perf_counter()
+    if mode == "dict":
+        products = {barcode: {"isGlutenFree": status, "productName": name, "brand": brand}
+                    for barcode, status, name, brand in synthetic_rows(count)}
+        lookup = products.get
+    else:
+        products = PackedProductIndex(pack_path)
+        lookup = products.lookup
+    load_seconds = time.perf_counter() - started
+
+    rng = random.Random(2)
+    barcodes = [f"{4000000000000 + rng.randrange(count) * 7:013d}" for _ in range(lookups)]
+    started = time.perf_counter()
+    for barcode in barcodes:
+        lookup(barcode)
+    lookup_seconds = time.perf_counter() - started
+
+    print(json.dumps({
+        "mode": mode,
+        "count": count,
+        "load_seconds": load_seconds,
+        "rss_mb": (_rss_kb() - baseline_kb) / 1024,
+        "lookup_us": lookup_seconds / lookups * 1e6,
+    }))
+
+
+def _run_child(mode, count, pack_path, lookups):
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.product_lookup", "--child", mode,
+         "--counts", str(count), "--pack-path", pack_path, "--lookups", str(lookups)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--counts", default="1000000,10000000", help="comma-separated product counts")
+    parser.add_argument("--lookups", type=int, default=200000)
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    parser.add_argument("--child", choices=["dict", "packed"], help=argparse.SUPPRESS)
+    parser.add_argument("--pack-path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _measure(args.child, int(args.counts), args.pack_path, args.lookups)
+        return
+
+    for count in (int(value) for value in args.counts.split(",")):
+        pack_path = os.path.join(args.workdir, f"products-{count}.gfpk")
+        if not os.path.exists(pack_path):
+            started = time.perf_counter()
+            build_packed_index(synthetic_rows(count), pack_path)
+            print(f"built {pack_path} ({os.path.getsize(pack_path) / 1e6:.0f} MB) in {time.perf_counter() - started:.1f}s")
+        print(f"\n--- {count:,} products, {args.lookups:,} random lookups ---")
+        for mode in ("dict", "packed"):
+            result = _run_child(mode, count, pack_path, args.lookups)
+            print(f"{mode:<7} load {result['load_seconds']:7.2f}s  "
+                  f"RSS +{result['rss_mb']:8.1f} MB  lookup {result['lookup_us']:6.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Estimated Gemini tokens per classification request: the original prose
+prompt (every place as 'Name: ..., Address: ..., Google Types: [...]',
+answered with a numbered text list) against the compact JSON-mode prompt
+built by prompts.build_classification_prompt.
+
+    python -m benchmarks.prompt_tokens                          # synthetic corpus (the fake Places results)
+    python -m benchmarks.prompt_tokens --audit-log google_places_output.jsonl
+
+With --audit-log the corpus is the places_search events recorded by
+audit_log.py, i.e. real Places results. Token counts use the same
+chars-per-token estimate the app budgets with, not Gemini's tokenizer.
+"""
+import argparse
+import json
+
+from benchmarks.fake_upstreams import _fake_places
+from find_places import _parse_places_page, GEMINI_MAX_OUTPUT_TOKENS, GEMINI_PROMPT_TOKEN_BUDGET
+from prompts import (
+    GF_STATUS_DEFINITIONS,
+    ESTABLISHMENT_TYPE_FILTERING_INSTRUCTIONS,
+    DEFAULT_TYPE_FILTERING_INSTRUCTIONS,
+    GF_STATUS_LABELS,
+    OUTPUT_TOKENS_PER_ESTABLISHMENT,
+    build_classification_prompt,
+    estimate_tokens,
+    split_for_token_budget,
+)
+
+SYNTHETIC_CITIES = [
+    ("Berlin", "Germany"), ("Munich", "Germany"), ("Vienna", "Austria"), ("Zurich", "Switzerland"),
+    ("Paris", "France"), ("Rome", "Italy"), ("Madrid", "Spain"), ("Helsinki", "Finland"),
+]
+
+
+def legacy_prompt(establishments_list, city_name, type_):
+    """The prose prompt the app sent before JSON mode, kept here as the baseline."""
+    details = "\n".join(
+        f"- Name: {place.get('name', 'N/A')}, Address: {place.get('address', 'N/A')}, "
+        f"Google Types: [{', '.join(place.get('types') or [])}]"
+        for place in establishments_list
+    )
+    type_rules = ESTABLISHMENT_TYPE_FILTERING_INSTRUCTIONS.get(type_, DEFAULT_TYPE_FILTERING_INSTRUCTIONS)
+    return (
+        f"You are a meticulous gluten-free dining investigator for users in {city_name}.\n"
+        f"The user has specifically requested establishments of type: '{type_}'.\n"
+        f"The initial list of places was found using a 'gluten-free' keyword search.\n\n"
+        f"Here is a list of potential establishments. Each item includes its 'Name', 'Address', and 'Google Types' array:\n"
+        f"{details}\n\n"
+        f"Your multi-step task for EACH establishment is:\n"
+        f"1. Assess Gluten-Free (GF) Status: Based on its Name, Address, and Google Types, and using your knowledge, classify its likely GF status according to the definitions below.\n"
+        f"{GF_STATUS_DEFINITIONS}\n\n"
+        f"2. Match Establishment Type: After determining the GF status, check if the establishment matches the user's requested primary establishment type ('{type_}') using the category-specific rules below.\n"
+        f"--- Rules for Matching Establishment Type: '{type_}' ---\n"
+        f"{type_rules}\n"
+        f"--- End of Establishment Type Rules ---\n\n"
+        f"Output Formatting:\n"
+        f"Create a numbered list. For EACH establishment that you determine matches the requested establishment type ('{type_}'), provide its Name and your assessed GF Status in the format: '[Number]. [Establishment Name] - [[Assessed GF Status]]'.\n"
+        f"For example:\n"
+        f"1. Purely GF Eats - [Dedicated GF]\n"
+        f"2. City Pizzeria - [Offers GF Menu]\n"
+        f"3. The Corner Cafe - [Offers GF Menu]\n"
+        f"4. Old Mill Bakery - [Unclear - Verify Directly]\n\n"
+        f"IMPORTANT: SORT by GF Status. List all establishments with 'Dedicated GF' first, then 'Offers GF Menu', and finally 'Unclear - Verify Directly'.\n"
+        f"IMPORTANT: Only include establishments that match the requested type ('{type_}'). List all such matches with their GF status, including those classified as 'Unclear - Verify Directly'.\n"
+        f"If, after your detailed assessment, no establishments match the requested type OR if all potential matches have an 'Unclear - Verify Directly' status but you still listed them, that's fine. If there are truly no type matches at all, then return ONLY the message: 'No {type_} found matching your criteria in {city_name} after detailed review.'"
+    )
+
+
+def legacy_output(establishments_list):
+    return "\n".join(
+        f"{i}. {place.get('name')} - [{GF_STATUS_LABELS[i % 3]}]"
+        for i, place in enumerate(establishments_list, start=1)
+    )
+
+
+def compact_output(establishments_list):
+    return json.dumps([
+        {"id": str(i), "gf": "DOU"[i % 3], "match": True}
+        for i in range(len(establishments_list))
+    ])
+
+
+def synthetic_corpus(types):
+    for city, country in SYNTHETIC_CITIES:
+        for type_ in types:
+            query = f"gluten-free {type_} in {city}"
+            places = []
+            for page in range(2):
+                results = _fake_places(query, page, 20)
+                for result in results:
+                    street = result["formatted_address"].split(",")[0]
+                    postcode = 10000 + int(result["place_id"][-4:], 16) % 900
+                    result["formatted_address"] = f"{street}, {postcode} {city}, {country}"
+                places.extend(_parse_places_page({"results": results}))
+            yield city, type_, places
+
+
+def audit_log_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            event = json.loads(line)
+            if event.get("event") == "places_search" and event.get("places"):
+                yield event["city"], event["type"], event["places"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--audit-log", help="JSON-lines audit log to use as the corpus instead of synthetic places")
+    parser.add_argument("--types", nargs="+", default=["restaurants", "cafes", "bakery"])
+    parser.add_argument("--budget", type=int, default=GEMINI_PROMPT_TOKEN_BUDGET, help="prompt token budget per call")
+    args = parser.parse_args()
+
+    corpus = audit_log_corpus(args.audit_log) if args.audit_log else synthetic_corpus(args.types)
+    totals = {"requests": 0, "places": 0, "legacy": 0, "compact": 0, "legacy_output": 0, "compact_output": 0, "calls": 0}
+    print(f"{'request':<28} {'places':>6} {'legacy in/out':>14} {'compact in/out':>15} {'saved':>6} {'calls':>5}")
+    for city, type_, places in corpus:
+        legacy_in = estimate_tokens(legacy_prompt(places, city, type_))
+        legacy_out = estimate_tokens(legacy_output(places))
+        chunks = split_for_token_budget(places, type_, args.budget, GEMINI_MAX_OUTPUT_TOKENS)
+        compact_in = sum(estimate_tokens(build_classification_prompt(chunk, city, type_)) for chunk in chunks)
+        compact_out = sum(estimate_tokens(compact_output(chunk)) for chunk in chunks)
+        saved = 1 - (compact_in + compact_out) / (legacy_in + legacy_out)
+        print(f"{city + ' / ' + type_:<28} {len(places):>6} {f'{legacy_in}/{legacy_out}':>14} {f'{compact_in}/{compact_out}':>15} {saved:>6.0%} {len(chunks):>5}")
+        totals["requests"] += 1
+        totals["places"] += len(places)
+        totals["legacy"] += legacy_in + legacy_out
+        totals["compact"] += compact_in + compact_out
+        totals["legacy_output"] += legacy_out
+        totals["compact_output"] += compact_out
+        totals["calls"] += len(chunks)
+
+    if not totals["requests"]:
+        raise SystemExit("The corpus contains no searches with places.")
+    requests = totals["requests"]
+    print(
+        f"\n{requests} requests, {totals['places']} places, {totals['calls']} compact Gemini calls "
+        f"(budget {args.budget} prompt tokens, ~{OUTPUT_TOKENS_PER_ESTABLISHMENT} output tokens/place)\n"
+        f"tokens saved per request: {(totals['legacy'] - totals['compact']) / requests:.0f} "
+        f"({1 - totals['compact'] / totals['legacy']:.0%}), "
+        f"of which output: {(totals['legacy_output'] - totals['compact_output']) / requests:.0f}"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Common spellings users type into the optional country box. Anything not listed
+# here is simply lower-cased and whitespace-collapsed. Apart from US and UK,
+# two-letter codes are not aliased: they double as state and province codes
+# ("CA" means California as often as Canada, "DE" is also Delaware), and
+# merging them would serve one place's results for another.
+COUNTRY_ALIASES = {
+    "us": "united states",
+    "usa": "united states",
+    "u.s.": "united states",
+    "u.s.a.": "united states",
+    "america": "united states",
+    "united states of america": "united states",
+    "uk": "united kingdom",
+    "u.k.": "united kingdom",
+    "great britain": "united kingdom",
+    "deutschland": "germany",
+    "österreich": "austria",
+    "osterreich": "austria",
+    "schweiz": "switzerland",
+    "suisse": "switzerland",
+    "italia": "italy",
+    "españa": "spain",
+    "espana": "spain",
+    "the netherlands": "netherlands",
+    "holland": "netherlands",
+    "suomi": "finland",
+}
+
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv('SEARCH_CACHE_TTL_SECONDS', 6 * 60 * 60))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', 512))
+# Leave empty to keep the cache purely in-process.
+SEARCH_CACHE_DB_PATH = os.getenv('SEARCH_CACHE_DB_PATH', '')
+# Expired entries are kept this much longer so they can be served while an upstream is down.
+SEARCH_CACHE_STALE_SECONDS = int(os.getenv('SEARCH_CACHE_STALE_SECONDS', 24 * 60 * 60))
+# Leads every search key. Bump it when the cached /get-restaurants body changes
+# shape or keys stop meaning the same thing, so entries written by older code in
+# the SQLite tier are never served.
+SEARCH_RESULT_FORMAT = "v3"
+
+
+def _normalize_text(value):
+    return " ".join((value or "").split()).lower()
+
+
+def normalize_country(country):
+    country = _normalize_text(country)
+    return COUNTRY_ALIASES.get(country, country)
+
+
+def normalize_search_key(city, country, type_):
+    """
+    Builds the cache key for a /get-restaurants search. Case and whitespace
+    are ignored ('Berlin', ' BERLIN '), and the country filter goes through
+    COUNTRY_ALIASES ('Deutschland', 'DE' and 'Germany' share an entry). The
+    city is not parsed, so 'Berlin, Deutschland' is a different key from 'Berlin'.
+    """
+    return "|".join([SEARCH_RESULT_FORMAT, _normalize_text(city), normalize_country(country), _normalize_text(type_)])
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache whose entries expire after `ttl` seconds.
+    Expired entries stay readable through get_stale() for `stale_ttl` more seconds.
+    """
+
+    def __init__(self, maxsize=SEARCH_CACHE_MAX_ENTRIES, ttl=SEARCH_CACHE_TTL_SECONDS, stale_ttl=SEARCH_CACHE_STALE_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                if expires_at + self.stale_ttl <= time.time():
+                    del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_stale(self, key):
+        """Returns the value even if expired, as long as it is within the stale window."""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key):
+        """(value, expires_at) for a fresh or stale entry, without touching the hit/miss counters."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] + self.stale_ttl <= time.time():
+                return None
+            return entry[1], entry[0]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "max_size": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SQLiteCache:
+    """
+    On-disk cache tier. SQLite in WAL mode lets every gunicorn worker on the
+    host read and write the same file, and entries survive restarts.
+    Values must be JSON-serialisable.
+    """
+
+    def __init__(self, db_path, ttl=SEARCH_CACHE_TTL_SECONDS, stale_ttl=SEARCH_CACHE_STALE_SECONDS):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.errors = 0
+        # The table is created on first use, so a preloading gunicorn master
+        # never opens a connection its forked workers would inherit.
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                with conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS search_cache ("
+                        " key TEXT PRIMARY KEY,"
+                        " value TEXT NOT NULL,"
+                        " expires_at REAL NOT NULL)"
+                    )
+                self._initialized = True
+        return conn
+
+    def get(self, key):
+        try:
+            row = self._connect().execute(
+                "SELECT value, expires_at FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"⚠️ Search cache read failed for '{key}': {e}")
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        value, expires_at = row
+        if expires_at <= time.time():
+            self.expirations += 1
+            self.misses += 1
+            if expires_at + self.stale_ttl <= time.time():
+                self.delete(key)
+            return None
+        self.hits += 1
+        return json.loads(value), expires_at
+
+    def get_stale(self, key):
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key):
+        try:
+            row = self._connect().execute(
+                "SELECT value, expires_at FROM search_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time() - self.stale_ttl),
+            ).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"⚠️ Search cache read failed for '{key}': {e}")
+            return None
+        return (json.loads(row[0]), row[1]) if row is not None else None
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at),
+                )
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"⚠️ Search cache write failed for '{key}': {e}")
+
+    def delete(self, key):
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"⚠️ Search cache delete failed for '{key}': {e}")
+
+    def purge_expired(self):
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM search_cache WHERE expires_at <= ?", (time.time() - self.stale_ttl,)).rowcount
+
+    def stats(self):
+        return {
+            "path": self.db_path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expirations": self.expirations,
+            "errors": self.errors,
+        }
+
+
+class SearchResultCache:
+    """
+    Two-tier cache: the in-process LRU answers hot keys, the optional SQLite
+    tier is consulted on a memory miss and back-fills the LRU.
+    """
+
+    def __init__(self, maxsize=SEARCH_CACHE_MAX_ENTRIES, ttl=SEARCH_CACHE_TTL_SECONDS, db_path=SEARCH_CACHE_DB_PATH):
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.disk = SQLiteCache(db_path, ttl=ttl) if db_path else None
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return value
+        disk_entry = self.disk.get(key)
+        if disk_entry is None:
+            return None
+        value, expires_at = disk_entry
+        self.memory.set(key, value, ttl=max(expires_at - time.time(), 0))
+        return value
+
+    def get_stale(self, key):
+        """Fallback for when fresh results cannot be produced: an expired entry still in its stale window."""
+        value = self.memory.get_stale(key)
+        if value is not None or self.disk is None:
+            return value
+        return self.disk.get_stale(key)
+
+    def get_entry(self, key):
+        """
+        (value, expires_at) for a fresh or stale entry, or None. Lets callers
+        decide how old a result they are willing to serve.
+        """
+        entry = self.memory.get_entry(key)
+        if self.disk is None or (entry is not None and entry[1] > time.time()):
+            return entry
+        disk_entry = self.disk.get_entry(key)
+        if disk_entry is None or (entry is not None and entry[1] >= disk_entry[1]):
+            return entry
+        # Another worker refreshed it: back-fill the LRU.
+        if disk_entry[1] > time.time():
+            self.memory.set(key, disk_entry[0], ttl=disk_entry[1] - time.time())
+        return disk_entry
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def delete(self, key):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def stats(self):
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
+
+
+search_cache = SearchResultCache()
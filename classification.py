@@ -0,0 +1,215 @@
+import json
+
+from prompts import GF_STATUS_LABELS, GF_STATUS_CODES
+from tracing import increment
+
+PRODUCT_GF_VALUES = ["Yes", "No", "Cannot Determine"]
+
+# Gemini JSON mode: passed as generationConfig.responseSchema with
+# responseMimeType "application/json", so the model answers with data
+# instead of prose that has to be scanned.
+CLASSIFICATION_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "id": {"type": "STRING"},
+            "gf": {"type": "STRING", "enum": list(GF_STATUS_CODES)},
+            "match": {"type": "BOOLEAN"},
+        },
+        "required": ["id", "gf", "match"],
+    },
+}
+
+PRODUCT_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "isGlutenFree": {"type": "STRING", "enum": PRODUCT_GF_VALUES},
+        "productName": {"type": "STRING", "nullable": True},
+        "brand": {"type": "STRING", "nullable": True},
+        "suggestion": {"type": "STRING", "nullable": True},
+    },
+    "required": ["isGlutenFree", "productName", "brand", "suggestion"],
+}
+
+_STATUS_RANK = {label: rank for rank, label in enumerate(GF_STATUS_LABELS)}
+_decoder = json.JSONDecoder()
+
+
+class GeminiError(Exception):
+    """Gemini could not be reached, blocked the prompt, or answered with output that does not fit the schema."""
+
+
+class PartialClassificationError(GeminiError):
+    """Some chunks of a split list failed; `verdicts` holds what the other chunks returned."""
+
+    def __init__(self, message, verdicts):
+        super().__init__(message)
+        self.verdicts = verdicts
+
+
+def _decode(text):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        raise GeminiError(f"Gemini returned invalid JSON: {e}") from e
+
+
+def validate_classification(item):
+    """Returns (id, status label, matches_type) for a well-formed classification object, else None."""
+    if not isinstance(item, dict):
+        return None
+    item_id, code, matches_type = item.get("id"), item.get("gf"), item.get("match")
+    if not isinstance(item_id, (str, int)) or code not in GF_STATUS_CODES or not isinstance(matches_type, bool):
+        return None
+    return str(item_id), GF_STATUS_CODES[code], matches_type
+
+
+def verdicts_from_items(items, places_by_id):
+    """
+    Maps classification objects back to place_ids. `places_by_id` maps the
+    short IDs used in the prompt to Places results. Returns {place_id: status},
+    with None for places that do not match the requested type. Places Gemini
+    did not answer for, and malformed or unknown entries, are left out.
+    """
+    verdicts = {}
+    for item in items:
+        validated = validate_classification(item)
+        place = places_by_id.get(validated[0]) if validated else None
+        if place is None:
+            increment("gemini_invalid_records")
+            continue
+        _, status, matches_type = validated
+        verdicts[place['place_id']] = status if matches_type else None
+    return verdicts
+
+
+def decode_classifications(text):
+    """Decodes a CLASSIFICATION_RESPONSE_SCHEMA answer into its list of objects."""
+    items = _decode(text)
+    if not isinstance(items, list):
+        raise GeminiError("Gemini returned JSON that is not a list of classifications.")
+    return items
+
+
+def parse_classifications(text, places_by_id):
+    """Decodes a CLASSIFICATION_RESPONSE_SCHEMA answer into verdicts (see verdicts_from_items)."""
+    return verdicts_from_items(decode_classifications(text), places_by_id)
+
+
+class JSONArrayReader:
+    """
+    Incremental reader for a streamed top-level JSON array: feed() takes the
+    next chunk of text and returns the elements completed by it.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._started = False
+
+    def feed(self, text):
+        self._buffer += text
+        items = []
+        position = 0
+        while True:
+            while position < len(self._buffer) and self._buffer[position] in " \t\r\n,":
+                position += 1
+            if position >= len(self._buffer):
+                break
+            if not self._started:
+                if self._buffer[position] != "[":
+                    raise GeminiError("Gemini's streamed output is not a JSON array.")
+                self._started = True
+                position += 1
+                continue
+            if self._buffer[position] == "]":
+                position = len(self._buffer)
+                break
+            try:
+                item, position = _decoder.raw_decode(self._buffer, position)
+            except json.JSONDecodeError:
+                # The element is not complete yet.
+                break
+            items.append(item)
+        self._buffer = self._buffer[position:]
+        return items
+
+
+def establishment_record(place, status):
+    return {
+        "place_id": place['place_id'],
+        "name": place.get('name'),
+        "address": place.get('address'),
+        "status": status,
+    }
+
+
+def sort_establishments(establishments):
+    """Dedicated GF first, then Offers GF Menu, then Unclear, as the frontend lists them."""
+    return sorted(establishments, key=lambda record: _STATUS_RANK.get(record["status"], len(_STATUS_RANK)))
+
+
+def establishment_records(establishments_list, verdicts):
+    """Records for the places whose verdict says they match the requested type, sorted by GF status."""
+    return sort_establishments(
+        establishment_record(place, verdicts[place['place_id']])
+        for place in establishments_list
+        if verdicts.get(place['place_id'])
+    )
+
+
+def merge_establishments(results):
+    """
+    Merges the establishment lists of several classification calls, dropping
+    duplicate place_ids. None entries are calls that failed; the merge is None
+    only if every call failed.
+    """
+    succeeded = [establishments for establishments in results if establishments is not None]
+    if not succeeded:
+        return None
+    merged = {}
+    for establishments in succeeded:
+        for record in establishments:
+            merged.setdefault(record["place_id"], record)
+    return sort_establishments(merged.values())
+
+
+def merge_chunk_verdicts(results):
+    """
+    Combines the verdicts of the chunks one list was split into. Entries are
+    verdict dicts or the GeminiError a chunk failed with. If any chunk failed
+    the list is incomplete, so PartialClassificationError is raised with the
+    verdicts that did arrive instead of a result that would be cached as whole.
+    """
+    verdicts = {}
+    errors = [result for result in results if isinstance(result, GeminiError)]
+    if errors and len(errors) == len(results):
+        raise errors[0]
+    for result in results:
+        if not isinstance(result, GeminiError):
+            verdicts.update(result)
+    if errors:
+        raise PartialClassificationError(
+            f"{len(errors)} of {len(results)} Gemini chunks failed: {errors[0]}", verdicts
+        )
+    return verdicts
+
+
+def no_matches_message(type_, city):
+    return f"No {type_} found matching your criteria in {city} after detailed review."
+
+
+def parse_product(text):
+    """Decodes and validates a PRODUCT_RESPONSE_SCHEMA answer."""
+    product = _decode(text)
+    if not isinstance(product, dict) or product.get("isGlutenFree") not in PRODUCT_GF_VALUES:
+        raise GeminiError("Gemini's product answer does not match the schema.")
+    for field in ("productName", "brand", "suggestion"):
+        if not isinstance(product.get(field), (str, type(None))):
+            raise GeminiError(f"Gemini's product answer has an invalid '{field}'.")
+    return {
+        "isGlutenFree": product["isGlutenFree"],
+        "productName": product.get("productName"),
+        "brand": product.get("brand"),
+        "suggestion": product.get("suggestion"),
+    }
@@ -0,0 +1,30 @@
+import os
+import time
+
+# /get-restaurants answers within roughly this many seconds: a classification
+# still running by then finishes in the background and the response carries
+# the Places results with whatever is already known. 0 disables the deadline.
+SEARCH_DEADLINE_SECONDS = float(os.getenv('SEARCH_DEADLINE_SECONDS', 5))
+
+
+class Deadline:
+    """The point in time a request has to answer by, passed down through each search stage."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def cap(self, seconds):
+        """`seconds`, shortened to what is left of the budget."""
+        return min(seconds, self.remaining())
+
+
+def search_deadline():
+    """A fresh Deadline for one search request, or None when SEARCH_DEADLINE_SECONDS is 0."""
+    return Deadline(SEARCH_DEADLINE_SECONDS) if SEARCH_DEADLINE_SECONDS > 0 else None
@@ -2,22 +2,56 @@ import requests
 import json
 import os
 import time 
-from dotenv import load_dotenv
-
-load_dotenv()
-
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import http_client
+from http_client import CircuitOpenError, HTTP_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUTS
+from rate_limit import report_quota_exceeded
+import tracing
+from tracing import span, increment
+from audit_log import audit_log
+from prompts import build_classification_prompt, estimate_tokens, split_for_token_budget
+from cache import normalize_search_key
+from place_cache import PlaceClassificationStore, PLACE_CACHE_DB_PATH
+from gf_rules import classify_locally
+from classification import (
+    CLASSIFICATION_RESPONSE_SCHEMA,
+    GeminiError,
+    JSONArrayReader,
+    PartialClassificationError,
+    establishment_record,
+    establishment_records,
+    merge_chunk_verdicts,
+    merge_establishments,
+    no_matches_message,
+    parse_classifications,
+    verdicts_from_items,
+)
+from llm import GEMINI_MODEL, get_backend
+
+# app.py (and asgi.py through it) loads .env before importing this module.
 GOOGLE_PLACES_API_KEY = os.getenv('GOOGLE_PLACES_API_KEY')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
-# MODIFIED function signature
-def find_gluten_free_restaurants_places_api(city_name, api_key, type_, country_filter=None):
-    """
-    Searches for gluten-free establishments in a given city and optional country using Google Places API.
-    """
-    if not api_key:
-        print("Google Places API key is missing. Cannot perform search.")
-        return [] 
+_pipeline_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('PIPELINE_MAX_WORKERS', 8)),
+    thread_name_prefix="places-pipeline",
+)
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', 8))
 
+# Both upstream locations can be overridden, e.g. to point at benchmarks/fake_upstreams.py.
+PLACES_TEXT_SEARCH_URL = os.getenv('PLACES_TEXT_SEARCH_URL', "https://maps.googleapis.com/maps/api/place/textsearch/json")
+PLACES_MAX_PAGES = 2
+# A fresh next_page_token is rejected with INVALID_REQUEST until Google has
+# prepared the next page. Instead of a fixed 2s sleep we poll with a short,
+# growing delay and stop as soon as the token is accepted.
+NEXT_PAGE_TOKEN_INITIAL_DELAY = float(os.getenv('NEXT_PAGE_TOKEN_INITIAL_DELAY', 0.3))
+NEXT_PAGE_TOKEN_MAX_DELAY = float(os.getenv('NEXT_PAGE_TOKEN_MAX_DELAY', 1.5))
+NEXT_PAGE_TOKEN_MAX_WAIT = float(os.getenv('NEXT_PAGE_TOKEN_MAX_WAIT', 6.0))
+
+
+def _build_places_query(city_name, type_, country_filter=None):
     text_query_base = "" # Base for text query before city/country
     google_api_type_param = None 
     query_location_part = city_name
@@ -25,7 +59,6 @@ def find_gluten_free_restaurants_places_api(city_name, api_key, type_, country_f
     # NEW: Incorporate country_filter into the query_location_part
     if country_filter and country_filter.strip():
         query_location_part = f"{city_name}, {country_filter.strip()}"
-        print(f"ℹ️ Applying country filter: {country_filter.strip()}")
 
     if type_ == 'restaurants':
         text_query_base = "gluten-free restaurants in"
@@ -37,14 +70,84 @@ def find_gluten_free_restaurants_places_api(city_name, api_key, type_, country_f
         text_query_base = "gluten-free bakeries in"
         google_api_type_param = 'bakery'
     else: 
-        print(f"⚠️ Unexpected type_ value: '{type_}'. Falling back to general search.")
         text_query_base = "gluten-free establishments in"
     
     text_query = f"{text_query_base} {query_location_part}"
+    return text_query, google_api_type_param
+
+
+def _parse_location(place_result):
+    location = (place_result.get('geometry') or {}).get('location') or {}
+    if not isinstance(location.get('lat'), (int, float)) or not isinstance(location.get('lng'), (int, float)):
+        return None
+    return {"lat": location['lat'], "lng": location['lng']}
+
+
+def _parse_places_page(places_data):
+    page_results = []
+    for place_result in places_data.get("results", []):
+        google_types_from_api = place_result.get('types', [])
+        if not isinstance(google_types_from_api, list): 
+            google_types_from_api = []
+        
+        if place_result.get('business_status') == 'OPERATIONAL' and place_result.get('place_id'):
+            page_results.append({
+                "name": place_result.get("name"),
+                "address": place_result.get("formatted_address"),
+                "rating": place_result.get("rating", "N/A"),
+                "user_ratings_total": place_result.get("user_ratings_total", 0),
+                'types': google_types_from_api, 
+                'place_id': place_result.get('place_id'), 
+                'business_status': place_result.get('business_status', ''),
+                'location': _parse_location(place_result),
+            })
+    return page_results
+
+
+def _fetch_next_page(next_page_token, api_key, deadline=None):
+    """
+    Polls the Text Search endpoint with `next_page_token` until the token becomes
+    valid (or NEXT_PAGE_TOKEN_MAX_WAIT elapses) and returns the decoded page.
+    Returns None if the request's deadline passes first.
+    """
+    params = {'pagetoken': next_page_token, 'key': api_key}
+    delay = NEXT_PAGE_TOKEN_INITIAL_DELAY
+    waited = 0.0
+    attempt = 0
+    while True:
+        if deadline is not None and deadline.remaining() <= delay:
+            print(f"⏱️ Deadline reached while waiting for the next_page_token ({waited:.1f}s). Ending pagination.")
+            return None
+        with span("pagination_wait"):
+            time.sleep(delay)
+        waited += delay
+        attempt += 1
+        response = http_client.get(PLACES_TEXT_SEARCH_URL, "places", params=params, timeout=_places_timeout(deadline))
+        response.raise_for_status()
+        places_data = response.json()
+        if places_data.get("status") != "INVALID_REQUEST" or waited >= NEXT_PAGE_TOKEN_MAX_WAIT:
+            if attempt > 1:
+                print(f"ℹ️ next_page_token accepted after {attempt} attempts ({waited:.1f}s).")
+            return places_data
+        delay = min(delay * 2, NEXT_PAGE_TOKEN_MAX_DELAY, NEXT_PAGE_TOKEN_MAX_WAIT - waited)
+
+
+def _places_timeout(deadline):
+    """(connect, read) timeout for a follow-up Places page, with the read cut to what is left of the deadline."""
+    if deadline is None:
+        return None
+    return (HTTP_CONNECT_TIMEOUT, max(deadline.cap(UPSTREAM_READ_TIMEOUTS["places"]), 0.1))
+
+
+def _places_search_params(city_name, api_key, type_, country_filter=None):
+    text_query, google_api_type_param = _build_places_query(city_name, type_, country_filter)
+    if country_filter and country_filter.strip():
+        print(f"ℹ️ Applying country filter: {country_filter.strip()}")
+    if not google_api_type_param:
+        print(f"⚠️ Unexpected type_ value: '{type_}'. Falling back to general search.")
     
     print(f"\n🔍 Google Places Search for type: '{type_}' with text query: \"{text_query}\" and API type parameter: '{google_api_type_param}'...")
 
-    all_places = []
     params = {'query': text_query, 'key': api_key}
     if google_api_type_param:
         params['type'] = google_api_type_param
@@ -54,76 +157,117 @@ def find_gluten_free_restaurants_places_api(city_name, api_key, type_, country_f
     # if country_filter and len(country_filter.strip()) == 2: # Simple check for 2-letter code
     #     params['region'] = country_filter.strip().lower()
     #     print(f"ℹ️ Also using region parameter for API: {params['region']}")
+    return params
+
+
+def _read_places_page(places_data, page_num):
+    """
+    Interprets one decoded Text Search page. Returns (page_results, next_page_token):
+    page_results is None when the page carried no usable results, and
+    next_page_token is None when pagination should stop.
+    """
+    if places_data.get("status") == "OK":
+        page_results = _parse_places_page(places_data)
+        print(f"✅ Page {page_num + 1}: Found {len(page_results)} operational establishments.")
+
+        next_page_token = places_data.get('next_page_token')
+        if not next_page_token:
+            print("ℹ️ No next_page_token found. Ending pagination.")
+        elif page_num >= PLACES_MAX_PAGES - 1:
+            print(f"ℹ️ Reached max_pages ({PLACES_MAX_PAGES}). Ending pagination.")
+            next_page_token = None
+        return page_results, next_page_token
+
+    if places_data.get("status") == "ZERO_RESULTS":
+        print(f"✅ Places API (Text Search) returned ZERO_RESULTS for page {page_num + 1} with current query.")
+    elif places_data.get("status") == "OVER_QUERY_LIMIT":
+        print(f"⚠️ Places API (Text Search) returned OVER_QUERY_LIMIT on page {page_num + 1}. Backing off.")
+        report_quota_exceeded("places")
+        if page_num == 0:
+            # Nothing found yet: an empty list here would look like "no places" to Gemini and the cache.
+            raise CircuitOpenError("places")
+    else:
+        print(f"⚠️ Places API (Text Search) returned status: {places_data.get('status')} on page {page_num + 1}")
+        if places_data.get("error_message"): print(f"   Error message: {places_data.get('error_message')}")
+    return None, None
 
 
-    url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
-    max_pages = 2 
+def iter_places_pages(city_name, api_key, type_, country_filter=None, deadline=None):
+    """
+    Yields the operational establishments of each Text Search page as soon as that
+    page arrives, so callers can start work on page 1 while page 2 is still pending.
+    Raises CircuitOpenError if Places is unavailable before the first page.
+    The first page is always fetched; later pages only within `deadline`.
+    """
+    if not api_key:
+        print("Google Places API key is missing. Cannot perform search.")
+        return
 
-    for page_num in range(max_pages):
+    yield from _iter_search_pages(_places_search_params(city_name, api_key, type_, country_filter), api_key, deadline)
+
+
+def _iter_search_pages(params, api_key, deadline=None):
+    next_page_token = None
+    for page_num in range(PLACES_MAX_PAGES):
         try:
-            current_params = params.copy() 
-            if page_num > 0 and 'pagetoken' in params:
-                current_params = {'pagetoken': params['pagetoken'], 'key': api_key}
+            if page_num == 0:
+                print(f"\n🔍 Making Google Places API request (Page 1) with params: {params}")
+                response = http_client.get(PLACES_TEXT_SEARCH_URL, "places", params=params)
+                print(f"🔍 Google Places API Response Status Code: {response.status_code} for page {page_num + 1}")
+                response.raise_for_status()
+                places_data = response.json()
+            else:
                 print(f"\n🔍 Fetching page {page_num + 1} from Google Places using pagetoken...")
-            elif page_num == 0:
-                print(f"\n🔍 Making Google Places API request (Page 1) with params: {current_params}")
-            else: 
-                print("Error: Attempting to fetch next page without a pagetoken.")
+                places_data = _fetch_next_page(next_page_token, api_key, deadline)
+                if places_data is None:
+                    break
+
+            page_results, next_page_token = _read_places_page(places_data, page_num)
+            if page_results is not None:
+                yield page_results
+            if not next_page_token:
                 break
-
-            response = requests.get(url, params=current_params)
-            print(f"🔍 Google Places API Response Status Code: {response.status_code} for page {page_num + 1}")
-            response.raise_for_status()
-            places_data = response.json()
-
-            if places_data.get("status") == "OK":
-                page_results = []
-                for place_result in places_data.get("results", []):
-                    google_types_from_api = place_result.get('types', [])
-                    if not isinstance(google_types_from_api, list): 
-                        google_types_from_api = []
-                    
-                    if place_result.get('business_status') == 'OPERATIONAL' and place_result.get('place_id'):
-                        page_results.append({
-                            "name": place_result.get("name"),
-                            "address": place_result.get("formatted_address"),
-                            "rating": place_result.get("rating", "N/A"),
-                            "user_ratings_total": place_result.get("user_ratings_total", 0),
-                            'types': google_types_from_api, 
-                            'place_id': place_result.get('place_id'), 
-                            'business_status': place_result.get('business_status', ''),
-                        })
-                all_places.extend(page_results)
-                print(f"✅ Page {page_num + 1}: Found {len(page_results)} operational establishments.")
-
-                next_page_token = places_data.get('next_page_token')
-                if next_page_token and page_num < max_pages - 1:
-                    params['pagetoken'] = next_page_token 
-                    params.pop('query', None) 
-                    params.pop('type', None)
-                    params.pop('region', None) # Also remove region if it was added for pagetoken use
-                    print(f"ℹ️ next_page_token found. Waiting briefly before fetching next page...")
-                    time.sleep(2)
-                else:
-                    if not next_page_token: print("ℹ️ No next_page_token found. Ending pagination.")
-                    elif page_num >= max_pages -1: print(f"ℹ️ Reached max_pages ({max_pages}). Ending pagination.")
-                    break 
-            
-            elif places_data.get("status") == "ZERO_RESULTS":
-                print(f"✅ Places API (Text Search) returned ZERO_RESULTS for page {page_num + 1} with current query.")
-                break 
-            else:
-                print(f"⚠️ Places API (Text Search) returned status: {places_data.get('status')} on page {page_num + 1}")
-                if places_data.get("error_message"): print(f"   Error message: {places_data.get('error_message')}")
-                break 
         
+        except CircuitOpenError:
+            if page_num == 0:
+                raise
+            print(f"⚠️ Places circuit is open. Returning the {page_num} page(s) already fetched.")
+            break
         except requests.exceptions.RequestException as e:
             print(f"❌ Error calling Google Places API (Text Search) on page {page_num + 1}: {e}")
             break 
         except json.JSONDecodeError:
             print(f"❌ Error decoding JSON response from Places API (Text Search) on page {page_num + 1}.")
             break 
-            
+
+
+def _log_places_search(city_name, country_filter, type_, all_places, final_places_list):
+    text_query, google_api_type_param = _build_places_query(city_name, type_, country_filter)
+    audit_log.log(
+        "places_search",
+        city=city_name,
+        country=country_filter,
+        type=type_,
+        text_query=text_query,
+        google_type=google_api_type_param,
+        collected=len(all_places),
+        unique=len(final_places_list),
+        duplicates_removed=len(all_places) - len(final_places_list),
+        places=[
+            {
+                "place_id": place.get('place_id'),
+                "name": place.get('name'),
+                "address": place.get('address'),
+                "types": place.get('types'),
+                "rating": place.get('rating'),
+                "user_ratings_total": place.get('user_ratings_total'),
+            }
+            for place in final_places_list
+        ],
+    )
+
+
+def _deduplicate_places(all_places):
     count_before_deduplication = len(all_places)
     print(f"\nℹ️ Total items collected before deduplication: {count_before_deduplication}")
 
@@ -138,192 +282,451 @@ def find_gluten_free_restaurants_places_api(city_name, api_key, type_, country_f
 
     if not final_places_list:
         print("No operational establishments found by Google Places API after deduplication.")
-    # else: # Keep console print minimal if saving to file
-        # print("\n--- Unique Results from Google Places API (After Deduplication by Place ID) ---") 
-        # for i, place in enumerate(final_places_list):
-        #     print(f"  {i+1}. Name: {place.get('name')}, Place ID: {place.get('place_id')}, Address: {place.get('address')}, Types: {place.get('types')}") 
-    
-    # File saving logic
-    file_output_path = "google_places_output.txt" # Renamed for clarity
-    if final_places_list or count_before_deduplication > 0 : 
-        with open(file_output_path, "w", encoding="utf-8") as f: 
-            f.write(f"Search City: {city_name}\n")
-            f.write(f"Search Country: {country_filter if country_filter else 'Not specified'}\n")
-            f.write(f"Search Type: {type_}\n")
-            f.write(f"Effective Text Query: {text_query}\n")
-            f.write(f"Google API Type Parameter: {google_api_type_param if google_api_type_param else 'None'}\n\n")
-            f.write(f"Total items collected before deduplication: {count_before_deduplication}\n")
-            f.write(f"Total unique operational establishments found after deduplication: {count_after_deduplication}\n")
-            f.write(f"Number of duplicate items removed: {items_removed_count}\n\n")
-            if final_places_list:
-                f.write("--- Unique Results from Google Places API (Deduplicated by Place ID) ---\n")
-                for i, place in enumerate(final_places_list):
-                    f.write(f"  {i+1}. Name: {place.get('name')}\n")
-                    f.write(f"     Place ID: {place.get('place_id')}\n")
-                    f.write(f"     Address: {place.get('address')}\n")
-                    f.write(f"     Types: {place.get('types')}\n")
-                    f.write(f"     Rating: {place.get('rating')}\n")
-                    f.write(f"     User Ratings Total: {place.get('user_ratings_total')}\n")
-                    f.write(f"     Business Status: {place.get('business_status')}\n\n")
-            else:
-                f.write("No operational establishments to list after deduplication.\n")
-        print(f"✅ Google Places API results saved to {file_output_path}")
-    else: 
-        with open(file_output_path, "w", encoding="utf-8") as f:
-            f.write(f"Search City: {city_name}\n")
-            f.write(f"Search Country: {country_filter if country_filter else 'Not specified'}\n")
-            f.write(f"Search Type: {type_}\n")
-            f.write(f"Effective Text Query: {text_query}\n")
-            f.write(f"Google API Type Parameter: {google_api_type_param if google_api_type_param else 'None'}\n\n")
-            f.write("No operational establishments found by Google Places API.\n")
-        print(f"✅ No results to save. {file_output_path} created with no results message.")
-    
     return final_places_list
 
-# --- get_gemini_description function remains as modified in the previous step ---
-def get_gemini_description(establishments_list, city_name, api_key, type_):
+
+# MODIFIED function signature
+def find_gluten_free_restaurants_places_api(city_name, api_key, type_, country_filter=None, deadline=None):
+    """
+    Searches for gluten-free establishments in a given city and optional country using Google Places API.
+    """
     if not api_key:
-        print("Gemini API key is missing. Cannot generate description.")
-        return "Error: Gemini API key missing."
-
-    if establishments_list:
-        establishment_details_for_prompt = []
-        for r_idx, r_val in enumerate(establishments_list):
-            google_types_list = r_val.get('types', [])
-            if not isinstance(google_types_list, list):
-                google_types_list = []
-            types_str = ", ".join(google_types_list)
-            # Include address as it might give context for GF assessment
-            detail = (f"Name: {r_val.get('name', 'N/A')}, "
-                      f"Address: {r_val.get('address', 'N/A')}, " # Added Address
-                      f"Google Types: [{types_str}]")
-            establishment_details_for_prompt.append(detail)
-
-        establishment_block_for_gemini = "\n".join([f"- {detail}" for detail in establishment_details_for_prompt])
-
-        # --- Define GF Status Categories for Gemini ---
-        gf_status_definitions = (
-            "Gluten-Free (GF) Status Definitions:\n"
-            "1. 'Dedicated GF': Classify as 'Dedicated GF' if the establishment's NAME contains the term 'gluten-free' or its direct regional language equivalents (e.g., 'glutenfrei', Glutenfreie, Sans gluten, Sin gluten, Senza glutine). Also use this if the name uses other strong indicators of being 100% gluten-free like 'celiac safe', 'entirely gluten-free', 'gluten-free kitchen', or their regional equivalents (e.g., 'glutenfrei Pur', 'Zöliakie sicher'), or if it's a brand you recognize from your training data as being exclusively gluten-free.\n"
-            "2. 'Offers GF': Classify as 'Offers GF' if the establishment is a standard type (e.g., restaurant, pizzeria, cafe) that doesn't explicitly claim to be fully dedicated, but its name (which might include terms like 'gluten-free options' or regional equivalents like 'glutenfreie Optionen / Speisen') or its Google Types suggest it is likely to have specific gluten-free options or a separate menu. This is the most common category for general establishments catering to GF needs. The initial search already used a 'gluten-free' keyword, so lean towards this if not 'Dedicated GF' or clearly 'Unclear'.\n"
-            "3. 'Unclear - Verify Directly': Classify as 'Unclear - Verify Directly' if the name and types provide insufficient information for a confident GF assessment, if it's a type of establishment where gluten is prevalent and cross-contamination is a high concern without explicit GF protocols (e.g., many standard bakeries not stating GF, some pizzerias), or if there's ambiguity. When in doubt, choose this status."
-        )
+        print("Google Places API key is missing. Cannot perform search.")
+        return [] 
 
-        # --- Define Establishment Type Filtering Instructions ---
-        establishment_type_filtering_instructions = ""
-        if type_ == 'restaurants':
-            establishment_type_filtering_instructions = (
-                "For the 'restaurants' category:\n"
-                "- Primary Match: Google Types includes 'restaurant'.\n"
-                "- Acceptable: If 'restaurant' is present, other types like 'cafe', 'bar', 'food' are fine.\n"
-                "- Caution: If types include 'bakery' but NOT 'restaurant', it's likely not a restaurant for this list.\n"
-                "- Fallback: If 'restaurant' isn't in Google Types, but the Name strongly implies a full-service restaurant (e.g., 'XYZ Diner', 'Steakhouse', 'Italian Kitchen'), it can be included.\n"
-                "- Regional Language: Names might use regional equivalents for 'restaurant' (e.g., 'Gasthaus', 'Wirtshaus', 'Pizzeria', 'Trattoria'). Consider these positive indicators.\n"
-                "- Exclude: Solely bakeries or cafes not operating as full restaurants."
-            )
-        elif type_ == 'cafes':
-            establishment_type_filtering_instructions = (
-                "For the 'cafes' category:\n"
-                "- Primary Match: Google Types includes 'cafe'.\n"
-                "- Acceptable: If 'cafe' is present, other types like 'restaurant', 'bakery', 'food' are fine.\n"
-                "- Also consider: If 'cafe' is absent, but types include 'bakery' AND the Name suggests a cafe setting (e.g., 'Artisan Bakery & Cafe'), include it.\n"
-                "- Fallback: If 'cafe' isn't in Google Types, but the Name or other types (e.g., 'coffee_shop', 'tea_room') strongly indicate a primary cafe function, include it.\n"
-                "- Regional Language: Names might use regional equivalents for 'cafe' (e.g., 'Kaffeehaus', 'Konditorei' with cafe service). Consider these positive indicators.\n"
-                "- Exclude: Formal restaurants without a clear cafe component, standalone bakeries/stores with no cafe service."
-            )
-        elif type_ == 'bakery':
-            establishment_type_filtering_instructions = (
-                "For the 'bakery' category:\n"
-                "- Primary Match: Google Types includes 'bakery'.\n"
-                "- Acceptable: If 'bakery' is present, other types like 'cafe', 'store', 'food' are common and fine.\n"
-                "- Regional Language: Names might use regional equivalents for 'bakery' (e.g., 'Bäckerei', 'Boulangerie', 'Panadería'). Consider these positive indicators.\n"
-                "- Exclude: If 'bakery' is NOT in Google Types, exclude unless the name is exceptionally and explicitly a bakery (e.g., '100% Glutenfrei Bäckerei Mustermann'). Prioritize the 'bakery' type tag."
-            )
-        else:
-            establishment_type_filtering_instructions = "Filter based on the general understanding of the requested establishment type."
-
-        # --- Construct the Main Prompt ---
-        prompt = (
-            f"You are a meticulous gluten-free dining investigator for users in {city_name}.\n"
-            f"The user has specifically requested establishments of type: '{type_}'.\n"
-            f"The initial list of places was found using a 'gluten-free' keyword search.\n\n"
-            f"Here is a list of potential establishments. Each item includes its 'Name', 'Address', and 'Google Types' array:\n"
-            f"{establishment_block_for_gemini}\n\n"
-            f"Your multi-step task for EACH establishment is:\n"
-            f"1. Assess Gluten-Free (GF) Status: Based on its Name, Address, and Google Types, and using your knowledge, classify its likely GF status according to the definitions below.\n"
-            f"{gf_status_definitions}\n\n"
-            f"2. Match Establishment Type: After determining the GF status, check if the establishment matches the user's requested primary establishment type ('{type_}') using the category-specific rules below.\n"
-            f"--- Rules for Matching Establishment Type: '{type_}' ---\n"
-            f"{establishment_type_filtering_instructions}\n"
-            f"--- End of Establishment Type Rules ---\n\n"
-            f"Output Formatting:\n"
-            f"Create a numbered list. For EACH establishment that you determine matches the requested establishment type ('{type_}'), provide its Name and your assessed GF Status in the format: '[Number]. [Establishment Name] - [[Assessed GF Status]]'.\n"
-            f"For example:\n"
-            f"1. Purely GF Eats - [Dedicated GF]\n"
-            f"2. City Pizzeria - [Offers GF Menu]\n"
-            f"3. The Corner Cafe - [Offers GF Menu]\n"
-            f"4. Old Mill Bakery - [Unclear - Verify Directly]\n\n"
-            f"IMPORTANT: SORT by GF Status. List all establishments with 'Dedicated GF' first, then 'Offers GF Menu', and finally 'Unclear - Verify Directly'.\n"
-            f"IMPORTANT: Only include establishments that match the requested type ('{type_}'). List all such matches with their GF status, including those classified as 'Unclear - Verify Directly'.\n"
-            f"If, after your detailed assessment, no establishments match the requested type OR if all potential matches have an 'Unclear - Verify Directly' status but you still listed them, that's fine. If there are truly no type matches at all, then return ONLY the message: 'No {type_} found matching your criteria in {city_name} after detailed review.'"
-        )
+    all_places = []
+    for page_results in iter_places_pages(city_name, api_key, type_, country_filter, deadline):
+        all_places.extend(page_results)
 
-    else: # No establishments_list provided
-        prompt = (
-            f"The user is looking for '{type_}' in {city_name}, but the initial search found no establishments.\n"
-            f"Please return ONLY the message: 'No {type_} found matching your criteria in {city_name}.'"
-        )
+    final_places_list = _deduplicate_places(all_places)
+    _log_places_search(city_name, country_filter, type_, all_places, final_places_list)
+    return final_places_list
 
-    print(f"\n🤖 Asking Gemini for type '{type_}' with NEW GF status assessment instructions...")
-    # print(f"GEMINI PROMPT (first 1000 chars):\n{prompt[:1000]}\n--------------------") # For debugging
 
-    gemini_api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent?key={api_key}"
-    payload = {
-        "contents": [{"parts": [{"text": prompt}]}],
-        "generationConfig": {
-            "temperature": 0.2, # Slightly higher for nuanced assessment but still rule-bound
-            "top_p": 0.95,
-            "max_output_tokens": 3000 # Increased for potentially more verbose status and names
-        }
+def find_gluten_free_nearby(lat, lng, radius_meters, api_key, type_):
+    """
+    Text Search restricted to a circle instead of a city name. Used to fill
+    the venue index for a region (see venue_index.py).
+    """
+    if not api_key:
+        print("Google Places API key is missing. Cannot perform search.")
+        return []
+
+    text_query, google_api_type_param = _build_places_query("", type_)
+    params = {
+        'query': text_query.rstrip().removesuffix(" in"),
+        'location': f"{lat},{lng}",
+        'radius': radius_meters,
+        'key': api_key,
     }
-    headers = {"Content-Type": "application/json"}
+    if google_api_type_param:
+        params['type'] = google_api_type_param
+    print(f"\n🔍 Google Places Search for type: '{type_}' within {radius_meters} m of {lat:.5f},{lng:.5f}...")
 
-    try:
-        response = requests.post(gemini_api_url, headers=headers, json=payload, timeout=120) # Increased timeout
-        response.raise_for_status()
-        gemini_data = response.json()
-
-        if gemini_data.get("candidates") and \
-           gemini_data["candidates"][0].get("content") and \
-           gemini_data["candidates"][0]["content"].get("parts") and \
-           gemini_data["candidates"][0]["content"]["parts"][0].get("text"):
-            generated_text = gemini_data["candidates"][0]["content"]["parts"][0].get("text")
-            print("✅ Gemini provided a response.")
-            # print(f"Gemini Raw Text:\n{generated_text}") # For debugging
-            return generated_text.strip()
-        elif gemini_data.get("promptFeedback") and gemini_data["promptFeedback"].get("blockReason"):
-            reason = gemini_data["promptFeedback"]["blockReason"]
-            safety_ratings = gemini_data["promptFeedback"].get("safetyRatings", [])
-            print(f"⚠️ Gemini API blocked the prompt. Reason: {reason}. SafetyRatings: {safety_ratings}")
-            return f"Gemini API blocked the prompt (Reason: {reason}). Please refine your search or contact support if this persists."
+    all_places = []
+    for page_results in _iter_search_pages(params, api_key):
+        all_places.extend(page_results)
+    final_places_list = _deduplicate_places(all_places)
+    audit_log.log(
+        "places_nearby_search",
+        lat=lat,
+        lng=lng,
+        radius=radius_meters,
+        type=type_,
+        text_query=params['query'],
+        google_type=google_api_type_param,
+        unique=len(final_places_list),
+    )
+    return final_places_list
+
+
+def _run_batch_item(search, places_api_key, gemini_api_key):
+    places_list = find_gluten_free_restaurants_places_api(
+        search["city"], places_api_key, type_=search["type"], country_filter=search["country"]
+    )
+    establishments = classify_establishments(places_list, search["city"], gemini_api_key, type_=search["type"])
+    if establishments is None:
+        return dict(search, error=f"Could not retrieve a detailed summary for {search['type']} in {search['city']}.", raw_data=places_list)
+    result = dict(search, establishments=establishments, raw_data=places_list)
+    if not establishments:
+        result["message"] = no_matches_message(search["type"], search["city"])
+    return result
+
+
+def find_gluten_free_establishments_batch(searches, places_api_key, gemini_api_key, max_workers=BATCH_MAX_WORKERS):
+    """
+    Runs many (city, country, type) searches with bounded concurrency.
+
+    `searches` is a list of dicts with 'city', optional 'country' and optional
+    'type' (default 'restaurants'). Identical searches (after normalisation of
+    case, whitespace and country aliases) run once. Upstream rate limits are
+    enforced by http_client. Returns one dict per input search, in input order,
+    with either 'establishments' and 'raw_data' or 'error'.
+    """
+    normalized = []
+    unique_searches = {}
+    for search in searches:
+        search = {
+            "city": (search.get("city") or "").strip(),
+            "country": (search.get("country") or "").strip() or None,
+            "type": search.get("type") or "restaurants",
+        }
+        key = normalize_search_key(search["city"], search["country"], search["type"])
+        normalized.append((key, search))
+        if search["city"]:
+            unique_searches.setdefault(key, search)
+
+    print(f"\n📦 Batch search: {len(searches)} items, {len(unique_searches)} unique, {max_workers} workers.")
+
+    results_by_key = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="places-batch") as executor:
+        futures = {
+            key: executor.submit(tracing.wrap(_run_batch_item), search, places_api_key, gemini_api_key)
+            for key, search in unique_searches.items()
+        }
+        for key, future in futures.items():
+            try:
+                results_by_key[key] = future.result()
+            except Exception as e:
+                print(f"❌ Batch item {key} failed: {e}")
+                results_by_key[key] = dict(unique_searches[key], error=f"Error: {e}")
+
+    results = []
+    for key, search in normalized:
+        if not search["city"]:
+            results.append(dict(search, error="Please provide a city name"))
         else:
-            print(f"⚠️ Gemini API returned an unexpected response structure for {type_} in {city_name}.")
-            # print(f"Full Gemini response for debugging: {json.dumps(gemini_data, indent=2)}")
-            return f"Error: Gemini returned an unexpected response for {city_name} ({type_})."
+            results.append(dict(results_by_key[key], city=search["city"], country=search["country"], type=search["type"]))
+    return results
+
+def find_and_describe_pipelined(city_name, places_api_key, gemini_api_key, type_, country_filter=None):
+    """
+    Non-blocking pagination mode: page 1 is handed to Gemini immediately while the
+    next_page_token is polled in this thread. Places that only appear on page 2
+    are classified in a second Gemini call and merged with the page-1 records.
+
+    Returns (places_list, establishments) just like calling
+    find_gluten_free_restaurants_places_api followed by classify_establishments.
+    """
+    final_places_list, classification = start_find_and_describe(
+        city_name, places_api_key, gemini_api_key, type_, country_filter
+    )
+    return final_places_list, classification.result()
+
+
+def start_find_and_describe(city_name, places_api_key, gemini_api_key, type_, country_filter=None, deadline=None):
+    """
+    The pipelined search without the final wait: returns (places_list, classification)
+    once pagination is over, where `classification` is a Future of the merged
+    establishment records. Callers with a deadline can stop waiting for it and
+    let it finish on the pipeline pool.
+    """
+    pages = iter_places_pages(city_name, places_api_key, type_, country_filter, deadline)
+    all_places = []
+    seen_place_ids = set()
+    classification_futures = []
+
+    for page_results in pages:
+        new_places = [place for place in page_results if place['place_id'] not in seen_place_ids]
+        all_places.extend(page_results)
+        seen_place_ids.update(place['place_id'] for place in new_places)
+        if new_places:
+            print(f"ℹ️ Sending {len(new_places)} places to Gemini while pagination continues.")
+            classification_futures.append(submit_classification(new_places, city_name, gemini_api_key, type_))
+
+    final_places_list = _deduplicate_places(all_places)
+    _log_places_search(city_name, country_filter, type_, all_places, final_places_list)
+
+    if not classification_futures:
+        classification_futures.append(submit_classification([], city_name, gemini_api_key, type_))
+    return final_places_list, _merged_classification(classification_futures)
+
+
+def submit_classification(establishments_list, city_name, api_key, type_):
+    """Runs classify_establishments on the pipeline pool. Returns its Future."""
+    return _pipeline_executor.submit(tracing.wrap(classify_establishments), establishments_list, city_name, api_key, type_)
+
+
+def _merged_classification(futures):
+    """A Future of merge_establishments over `futures`, resolved when the last of them is."""
+    if len(futures) == 1:
+        return futures[0]
+    merged = Future()
+    outstanding = [len(futures)]
+    lock = threading.Lock()
+
+    def on_done(_):
+        with lock:
+            outstanding[0] -= 1
+            if outstanding[0]:
+                return
+        try:
+            merged.set_result(merge_establishments([future.result() for future in futures]))
+        except Exception as e:
+            merged.set_exception(e)
+
+    for future in futures:
+        future.add_done_callback(on_done)
+    return merged
+
+
+def stream_find_and_describe(city_name, places_api_key, gemini_api_key, type_, country_filter=None):
+    """
+    Generator behind the streaming /get-restaurants endpoint. Yields event dicts:
+      {"event": "places", "raw_data": [...]}                    new places, as each page arrives
+      {"event": "establishment", "place_id": ..., "name": ..., "address": ..., "status": ...}
+                                                                each matching place as soon as it is classified
+      {"event": "done", "establishments": [...], "raw_data": [...]}  sorted records (None if Gemini failed) and final list
+    The next Places page is prefetched in the background while Gemini streams.
+    """
+    pages = iter_places_pages(city_name, places_api_key, type_, country_filter)
+    all_places = []
+    seen_place_ids = set()
+    page_establishments = []
+
+    next_page = _pipeline_executor.submit(tracing.wrap(next), pages, None)
+    while True:
+        page_results = next_page.result()
+        if page_results is None:
+            break
+        next_page = _pipeline_executor.submit(tracing.wrap(next), pages, None)
+
+        new_places = [place for place in page_results if place['place_id'] not in seen_place_ids]
+        all_places.extend(page_results)
+        seen_place_ids.update(place['place_id'] for place in new_places)
+        if not new_places:
+            continue
+
+        yield {"event": "places", "raw_data": new_places}
+        known, uncached = known_verdicts(new_places, type_)
+        establishments = establishment_records(new_places, known)
+        for record in establishments:
+            yield dict(record, event="establishment")
+        if not uncached:
+            page_establishments.append(establishments)
+            continue
+
+        places_by_id = {place['place_id']: place for place in uncached}
+        fresh_verdicts = {}
+        try:
+            for place_id, status in stream_gemini_verdicts(uncached, city_name, gemini_api_key, type_):
+                fresh_verdicts[place_id] = status
+                if status:
+                    record = establishment_record(places_by_id[place_id], status)
+                    establishments.append(record)
+                    yield dict(record, event="establishment")
+        except GeminiError as e:
+            print(f"❌ Gemini could not classify {type_} in {city_name}: {e}")
+            page_establishments.append(None)
+            continue
+        if place_store is not None:
+            place_store.record(fresh_verdicts, type_)
+        page_establishments.append(establishments)
+
+    final_places_list = _deduplicate_places(all_places)
+    _log_places_search(city_name, country_filter, type_, all_places, final_places_list)
+
+    establishments = merge_establishments(page_establishments) if page_establishments else []
+    yield {"event": "done", "establishments": establishments, "raw_data": final_places_list}
+
+
+# --- Gemini classification (JSON mode) ---
+# Pack establishments from concurrent requests into shared Gemini calls (see gemini_batcher.py).
+GEMINI_BATCHING = os.getenv('GEMINI_BATCHING', 'False').lower() not in ['false', '0', 'no']
+GEMINI_MAX_OUTPUT_TOKENS = int(os.getenv('GEMINI_MAX_OUTPUT_TOKENS', 3000))
+# Establishment lists whose estimated prompt exceeds this are split into parallel calls.
+GEMINI_PROMPT_TOKEN_BUDGET = int(os.getenv('GEMINI_PROMPT_TOKEN_BUDGET', 3000))
+GEMINI_GENERATION_CONFIG = {
+    "temperature": 0.2, # Slightly higher for nuanced assessment but still rule-bound
+    "top_p": 0.95,
+    "max_output_tokens": GEMINI_MAX_OUTPUT_TOKENS,
+    "responseMimeType": "application/json",
+    "responseSchema": CLASSIFICATION_RESPONSE_SCHEMA,
+}
+
+# Separate from _pipeline_executor: page classifications already run there and
+# would deadlock waiting on their own chunks in a saturated pool.
+_chunk_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('PIPELINE_MAX_WORKERS', 8)),
+    thread_name_prefix="gemini-chunks",
+)
+
+# Per-place_id verdicts survive across requests so only unseen venues reach Gemini.
+place_store = PlaceClassificationStore(PLACE_CACHE_DB_PATH, model=GEMINI_MODEL) if PLACE_CACHE_DB_PATH else None
+
+
+def build_gemini_prompt(establishments_list, city_name, type_):
+    """Builds the classification prompt (see prompts.build_classification_prompt), recording its size on the trace."""
+    with span("prompt_build") as span_attributes:
+        prompt = build_classification_prompt(establishments_list, city_name, type_)
+        span_attributes["chars"] = len(prompt)
+        span_attributes["estimated_tokens"] = estimate_tokens(prompt)
+    return prompt
+
+
+def known_verdicts(establishments_list, type_):
+    """
+    Returns (verdicts, uncached): what the local rules (gf_rules.py) and then
+    place_store already know, and the places still left for Gemini.
+    """
+    verdicts, undecided = classify_locally(establishments_list, type_)
+    if verdicts:
+        increment("local_rule_verdicts", len(verdicts))
+    uncached = undecided
+    if place_store is not None and undecided:
+        cached, uncached = place_store.split(undecided, type_)
+        verdicts.update(cached)
+    if not uncached:
+        print(f"✅ All {len(establishments_list)} places already classified. Skipping Gemini.")
+    elif len(uncached) < len(establishments_list):
+        print(f"ℹ️ {len(establishments_list) - len(uncached)} places classified locally or from cache, {len(uncached)} sent to Gemini.")
+    return verdicts, uncached
+
+
+def provisional_establishments(establishments_list, type_):
+    """
+    Establishment records for what is known without waiting for Gemini: the
+    local rules and place_store (which also holds the pages already classified
+    by this search). Used for partial responses when the deadline passes.
+    """
+    verdicts, undecided = classify_locally(establishments_list, type_)
+    if place_store is not None and undecided:
+        cached, _ = place_store.split(undecided, type_)
+        verdicts.update(cached)
+    return establishment_records(establishments_list, verdicts)
+
+
+def _places_by_prompt_id(establishments_list):
+    return {str(index): place for index, place in enumerate(establishments_list)}
+
+
+def classify_establishments(establishments_list, city_name, api_key, type_):
+    """
+    Returns the establishments that match `type_` as records
+    ({"place_id", "name", "address", "status"}) sorted by GF status, or None
+    if Gemini could not classify them. Only places that neither the local
+    rules nor place_store can decide are sent to Gemini.
+    """
+    if not api_key:
+        print("Gemini API key is missing. Cannot classify establishments.")
+        return None
+    if not establishments_list:
+        return []
+
+    verdicts, uncached = known_verdicts(establishments_list, type_)
+    if uncached:
+        try:
+            fresh_verdicts = _classify_with_gemini(uncached, city_name, api_key, type_)
+        except GeminiError as e:
+            print(f"❌ Gemini could not classify {type_} in {city_name}: {e}")
+            # Verdicts from the chunks that succeeded are still good per place; the search itself is not complete.
+            if isinstance(e, PartialClassificationError) and place_store is not None:
+                place_store.record(e.verdicts, type_)
+            return None
+        if place_store is not None:
+            place_store.record(fresh_verdicts, type_)
+        verdicts.update(fresh_verdicts)
+    return establishment_records(establishments_list, verdicts)
+
+
+def _classify_with_gemini(establishments_list, city_name, api_key, type_):
+    """
+    Returns {place_id: status or None} for `establishments_list`. Lists whose
+    prompt or answer would exceed the token budget are split into chunks
+    classified in parallel; GeminiError is raised if any chunk fails
+    (PartialClassificationError when some chunks did answer).
+    """
+    if GEMINI_BATCHING:
+        from gemini_batcher import classify_batched
+        return classify_batched(establishments_list, city_name, api_key, type_)
+
+    chunks = split_for_token_budget(
+        establishments_list, type_, GEMINI_PROMPT_TOKEN_BUDGET, GEMINI_GENERATION_CONFIG["max_output_tokens"]
+    )
+    if len(chunks) == 1:
+        return _classify_chunk(establishments_list, city_name, api_key, type_)
+    print(f"ℹ️ Splitting {len(establishments_list)} places into {len(chunks)} parallel Gemini calls to stay within the token budget.")
+    futures = [
+        _chunk_executor.submit(tracing.wrap(_classify_chunk), chunk, city_name, api_key, type_)
+        for chunk in chunks
+    ]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except GeminiError as e:
+            results.append(e)
+    return merge_chunk_verdicts(results)
+
+
+def _classify_chunk(establishments_list, city_name, api_key, type_):
+    """One Gemini call. Returns {place_id: status or None}; raises GeminiError."""
+    prompt = build_gemini_prompt(establishments_list, city_name, type_)
+
+    print(f"\n🤖 Asking Gemini to classify {len(establishments_list)} places for type '{type_}'...")
+    gemini_data = get_backend(api_key).generate(prompt, GEMINI_GENERATION_CONFIG)
+    return verdicts_from_gemini_response(gemini_data, establishments_list)
+
+
+def gemini_response_text(gemini_data):
+    """The generated text of a decoded generateContent response; raises GeminiError if blocked or empty."""
+    record_gemini_usage(gemini_data)
+    block_reason = (gemini_data.get("promptFeedback") or {}).get("blockReason")
+    if block_reason:
+        raise GeminiError(f"Gemini API blocked the prompt (Reason: {block_reason}).")
+    try:
+        return gemini_data["candidates"][0]["content"]["parts"][0]["text"]
+    except (KeyError, IndexError, TypeError):
+        raise GeminiError("Gemini returned an unexpected response structure.") from None
+
+
+def verdicts_from_gemini_response(gemini_data, establishments_list):
+    verdicts = parse_classifications(gemini_response_text(gemini_data), _places_by_prompt_id(establishments_list))
+    print(f"✅ Gemini classified {len(verdicts)} of {len(establishments_list)} places.")
+    return verdicts
+
+
+def stream_gemini_verdicts(establishments_list, city_name, api_key, type_):
+    """
+    Streaming counterpart of _classify_with_gemini built on streamGenerateContent.
+    Yields (place_id, status or None) as soon as each element of Gemini's JSON
+    array has been generated. Raises GeminiError on failure.
+    """
+    if not api_key:
+        raise GeminiError("Gemini API key missing.")
+
+    prompt = build_gemini_prompt(establishments_list, city_name, type_)
+    print(f"\n🤖 Streaming Gemini assessment for type '{type_}' ({len(establishments_list)} places)...")
+
+    places_by_id = _places_by_prompt_id(establishments_list)
+    reader = JSONArrayReader()
+    for chunk in get_backend(api_key).stream_generate(prompt, GEMINI_GENERATION_CONFIG):
+        record_gemini_usage(chunk)
+        if chunk.get("promptFeedback", {}).get("blockReason"):
+            raise GeminiError(f"Gemini API blocked the prompt (Reason: {chunk['promptFeedback']['blockReason']}).")
+        text = "".join(
+            part.get("text", "")
+            for candidate in chunk.get("candidates", [])
+            for part in candidate.get("content", {}).get("parts", [])
+        )
+        yield from verdicts_from_items(reader.feed(text), places_by_id).items()
+    print("✅ Gemini finished streaming its response.")
 
-    except requests.exceptions.Timeout:
-        print(f"❌ Timeout error calling Gemini API for {type_} in {city_name}.")
-        return f"Error: The request to Gemini API timed out for {city_name} ({type_}). Please try again."
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Error calling Gemini API for {type_} in {city_name}: {e}")
-        return f"Error: Could not connect to Gemini API for {city_name} ({type_})."
-    except json.JSONDecodeError:
-        print(f"❌ Error decoding JSON response from Gemini API for {type_} in {city_name}.")
-        return f"Error: Could not decode Gemini's response for {city_name} ({type_})."
 
+def record_gemini_usage(gemini_data):
+    """Adds Gemini's reported token counts to the request trace and /metrics counters."""
+    usage = gemini_data.get("usageMetadata")
+    if not usage:
+        return
+    increment("gemini_prompt_tokens", usage.get("promptTokenCount", 0))
+    increment("gemini_output_tokens", usage.get("candidatesTokenCount", 0))
 
 # --- Main Execution (for testing this file directly) ---
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    GOOGLE_PLACES_API_KEY = os.getenv('GOOGLE_PLACES_API_KEY')
+    GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
     if not GOOGLE_PLACES_API_KEY or not GEMINI_API_KEY:
         print("\nAPI keys missing. Please set them in .env or directly for testing.")
     else:
@@ -350,14 +753,19 @@ if __name__ == "__main__":
 
             if places_from_google is not None: # Check if list is not None
                 print(f"\n--- Calling Gemini with {len(places_from_google)} places for GF Status Assessment ---")
-                gemini_output = get_gemini_description(
+                establishments = classify_establishments(
                     places_from_google,
                     target_city,
                     GEMINI_API_KEY,
                     type_=selected_test_type
                 )
                 print("\n--- Gemini's Output (Name - [GF Status]) ---")
-                print(gemini_output)
+                if establishments is None:
+                    print("Gemini could not classify the establishments.")
+                elif not establishments:
+                    print(no_matches_message(selected_test_type, target_city))
+                for i, record in enumerate(establishments or [], start=1):
+                    print(f"{i}. {record['name']} - [{record['status']}]")
 
                 # Add the advisory note here for testing purposes
                 print("\n--- ADVISORY NOTE (App-Generated) ---")
@@ -0,0 +1,208 @@
+import asyncio
+import json
+
+import httpx
+
+import async_http_client
+from http_client import CircuitOpenError, HTTP_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUTS
+from tracing import span
+import find_places
+from find_places import (
+    PLACES_MAX_PAGES,
+    PLACES_TEXT_SEARCH_URL,
+    NEXT_PAGE_TOKEN_INITIAL_DELAY,
+    NEXT_PAGE_TOKEN_MAX_DELAY,
+    NEXT_PAGE_TOKEN_MAX_WAIT,
+    GEMINI_GENERATION_CONFIG,
+    GEMINI_PROMPT_TOKEN_BUDGET,
+    _places_search_params,
+    _read_places_page,
+    _deduplicate_places,
+    _log_places_search,
+    build_gemini_prompt,
+    verdicts_from_gemini_response,
+)
+from classification import (
+    GeminiError,
+    PartialClassificationError,
+    establishment_records,
+    merge_chunk_verdicts,
+    merge_establishments,
+)
+from prompts import split_for_token_budget
+from llm import get_backend
+
+
+async def _fetch_next_page(next_page_token, api_key, deadline=None):
+    params = {'pagetoken': next_page_token, 'key': api_key}
+    delay = NEXT_PAGE_TOKEN_INITIAL_DELAY
+    waited = 0.0
+    attempt = 0
+    while True:
+        if deadline is not None and deadline.remaining() <= delay:
+            print(f"⏱️ Deadline reached while waiting for the next_page_token ({waited:.1f}s). Ending pagination.")
+            return None
+        with span("pagination_wait"):
+            await asyncio.sleep(delay)
+        waited += delay
+        attempt += 1
+        timeout = None
+        if deadline is not None:
+            timeout = httpx.Timeout(max(deadline.cap(UPSTREAM_READ_TIMEOUTS["places"]), 0.1), connect=HTTP_CONNECT_TIMEOUT)
+        response = await async_http_client.get(PLACES_TEXT_SEARCH_URL, "places", params=params, timeout=timeout)
+        response.raise_for_status()
+        places_data = response.json()
+        if places_data.get("status") != "INVALID_REQUEST" or waited >= NEXT_PAGE_TOKEN_MAX_WAIT:
+            if attempt > 1:
+                print(f"ℹ️ next_page_token accepted after {attempt} attempts ({waited:.1f}s).")
+            return places_data
+        delay = min(delay * 2, NEXT_PAGE_TOKEN_MAX_DELAY, NEXT_PAGE_TOKEN_MAX_WAIT - waited)
+
+
+async def iter_places_pages(city_name, api_key, type_, country_filter=None, deadline=None):
+    """Async generator version of find_places.iter_places_pages."""
+    if not api_key:
+        print("Google Places API key is missing. Cannot perform search.")
+        return
+
+    params = _places_search_params(city_name, api_key, type_, country_filter)
+
+    next_page_token = None
+    for page_num in range(PLACES_MAX_PAGES):
+        try:
+            if page_num == 0:
+                print(f"\n🔍 Making Google Places API request (Page 1) with params: {params}")
+                response = await async_http_client.get(PLACES_TEXT_SEARCH_URL, "places", params=params)
+                print(f"🔍 Google Places API Response Status Code: {response.status_code} for page {page_num + 1}")
+                response.raise_for_status()
+                places_data = response.json()
+            else:
+                print(f"\n🔍 Fetching page {page_num + 1} from Google Places using pagetoken...")
+                places_data = await _fetch_next_page(next_page_token, api_key, deadline)
+                if places_data is None:
+                    break
+
+            page_results, next_page_token = _read_places_page(places_data, page_num)
+            if page_results is not None:
+                yield page_results
+            if not next_page_token:
+                break
+
+        except CircuitOpenError:
+            if page_num == 0:
+                raise
+            print(f"⚠️ Places circuit is open. Returning the {page_num} page(s) already fetched.")
+            break
+        except httpx.HTTPError as e:
+            print(f"❌ Error calling Google Places API (Text Search) on page {page_num + 1}: {e}")
+            break
+        except json.JSONDecodeError:
+            print(f"❌ Error decoding JSON response from Places API (Text Search) on page {page_num + 1}.")
+            break
+
+
+async def find_gluten_free_restaurants_places_api(city_name, api_key, type_, country_filter=None, deadline=None):
+    if not api_key:
+        print("Google Places API key is missing. Cannot perform search.")
+        return []
+
+    all_places = []
+    async for page_results in iter_places_pages(city_name, api_key, type_, country_filter, deadline):
+        all_places.extend(page_results)
+
+    final_places_list = _deduplicate_places(all_places)
+    _log_places_search(city_name, country_filter, type_, all_places, final_places_list)
+    return final_places_list
+
+
+async def _classify_with_gemini(establishments_list, city_name, api_key, type_):
+    if find_places.GEMINI_BATCHING:
+        from gemini_batcher import classify_batched
+        # The batcher merges calls across requests on its own thread; wait for it off the loop.
+        return await asyncio.to_thread(classify_batched, establishments_list, city_name, api_key, type_)
+
+    chunks = split_for_token_budget(
+        establishments_list, type_, GEMINI_PROMPT_TOKEN_BUDGET, GEMINI_GENERATION_CONFIG["max_output_tokens"]
+    )
+    if len(chunks) == 1:
+        return await _classify_chunk(establishments_list, city_name, api_key, type_)
+    print(f"ℹ️ Splitting {len(establishments_list)} places into {len(chunks)} parallel Gemini calls to stay within the token budget.")
+    results = await asyncio.gather(
+        *(_classify_chunk(chunk, city_name, api_key, type_) for chunk in chunks), return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, GeminiError):
+            raise result
+    return merge_chunk_verdicts(results)
+
+
+async def _classify_chunk(establishments_list, city_name, api_key, type_):
+    prompt = build_gemini_prompt(establishments_list, city_name, type_)
+
+    print(f"\n🤖 Asking Gemini to classify {len(establishments_list)} places for type '{type_}'...")
+    gemini_data = await get_backend(api_key).agenerate(prompt, GEMINI_GENERATION_CONFIG)
+    return verdicts_from_gemini_response(gemini_data, establishments_list)
+
+
+async def classify_establishments(establishments_list, city_name, api_key, type_):
+    """Async find_places.classify_establishments: local rules and cached verdicts first, Gemini for the rest."""
+    if not api_key:
+        print("Gemini API key is missing. Cannot classify establishments.")
+        return None
+    if not establishments_list:
+        return []
+
+    # place_store is SQLite: its reads and writes run on a worker thread, not on the loop.
+    place_store = find_places.place_store
+    verdicts, uncached = await asyncio.to_thread(find_places.known_verdicts, establishments_list, type_)
+    if uncached:
+        try:
+            fresh_verdicts = await _classify_with_gemini(uncached, city_name, api_key, type_)
+        except GeminiError as e:
+            print(f"❌ Gemini could not classify {type_} in {city_name}: {e}")
+            if isinstance(e, PartialClassificationError) and place_store is not None:
+                await asyncio.to_thread(place_store.record, e.verdicts, type_)
+            return None
+        if place_store is not None:
+            await asyncio.to_thread(place_store.record, fresh_verdicts, type_)
+        verdicts.update(fresh_verdicts)
+    return establishment_records(establishments_list, verdicts)
+
+
+async def find_and_describe_pipelined(city_name, places_api_key, gemini_api_key, type_, country_filter=None):
+    """
+    Async find_places.find_and_describe_pipelined: each page is classified in
+    its own task while the next_page_token is still being polled.
+    """
+    final_places_list, classification = await start_find_and_describe(
+        city_name, places_api_key, gemini_api_key, type_, country_filter
+    )
+    return final_places_list, await classification
+
+
+async def start_find_and_describe(city_name, places_api_key, gemini_api_key, type_, country_filter=None, deadline=None):
+    """Async find_places.start_find_and_describe: returns (places_list, Task of the merged establishment records)."""
+    all_places = []
+    seen_place_ids = set()
+    classification_tasks = []
+
+    async for page_results in iter_places_pages(city_name, places_api_key, type_, country_filter, deadline):
+        new_places = [place for place in page_results if place['place_id'] not in seen_place_ids]
+        all_places.extend(page_results)
+        seen_place_ids.update(place['place_id'] for place in new_places)
+        if new_places:
+            print(f"ℹ️ Sending {len(new_places)} places to Gemini while pagination continues.")
+            classification_tasks.append(asyncio.create_task(
+                classify_establishments(new_places, city_name, gemini_api_key, type_)
+            ))
+
+    final_places_list = _deduplicate_places(all_places)
+    _log_places_search(city_name, country_filter, type_, all_places, final_places_list)
+
+    if not classification_tasks:
+        return final_places_list, asyncio.create_task(classify_establishments([], city_name, gemini_api_key, type_=type_))
+    return final_places_list, asyncio.create_task(_merged_classification(classification_tasks))
+
+
+async def _merged_classification(classification_tasks):
+    return merge_establishments(list(await asyncio.gather(*classification_tasks)))
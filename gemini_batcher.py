@@ -0,0 +1,185 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from find_places import GEMINI_GENERATION_CONFIG, gemini_response_text
+from llm import get_backend
+from classification import GeminiError, decode_classifications, verdicts_from_items
+from prompts import (
+    GF_STATUS_DEFINITIONS,
+    ESTABLISHMENT_TYPE_FILTERING_INSTRUCTIONS,
+    DEFAULT_TYPE_FILTERING_INSTRUCTIONS,
+    CLASSIFICATION_OUTPUT_INSTRUCTIONS,
+    encode_establishments,
+)
+
+# How long the dispatcher waits for more requests to share a Gemini call.
+GEMINI_BATCH_WINDOW_MS = float(os.getenv('GEMINI_BATCH_WINDOW_MS', 40))
+# Upper bound on establishments packed into one call, to keep the JSON output
+# well inside GEMINI_MAX_OUTPUT_TOKENS (about 12 output tokens per place).
+GEMINI_BATCH_MAX_PLACES = int(os.getenv('GEMINI_BATCH_MAX_PLACES', 150))
+GEMINI_BATCH_MAX_CONCURRENT_CALLS = int(os.getenv('GEMINI_BATCH_MAX_CONCURRENT_CALLS', 4))
+
+class _PendingClassification:
+    def __init__(self, establishments_list, city_name, type_):
+        self.establishments_list = establishments_list
+        self.city_name = city_name
+        self.type_ = type_
+        self.future = Future()
+
+
+def build_batch_prompt(pending):
+    """
+    One prompt for several (city, type, establishments) requests. The GF status
+    definitions are included once, and type rules once per distinct type.
+    Establishments are addressed by short IDs ('r<request>.<index>').
+    """
+    type_rules = []
+    for type_ in sorted({item.type_ for item in pending}):
+        rules = ESTABLISHMENT_TYPE_FILTERING_INSTRUCTIONS.get(type_, DEFAULT_TYPE_FILTERING_INSTRUCTIONS)
+        type_rules.append(f"--- Rules for Matching Establishment Type: '{type_}' ---\n{rules}")
+
+    request_blocks = []
+    for request_index, item in enumerate(pending):
+        lines, shared_suffix = encode_establishments(item.establishments_list, id_prefix=f"r{request_index}.")
+        location = f"{item.city_name} (all addresses end in '{shared_suffix}')" if shared_suffix else item.city_name
+        request_blocks.append("\n".join([f"Request r{request_index}: type '{item.type_}' in {location}"] + lines))
+
+    return (
+        "You are a meticulous gluten-free dining investigator.\n"
+        "Below are several independent requests. Each lists establishments found with a 'gluten-free' keyword search, "
+        "one per line as: ID | Name | Address | Google Types.\n\n"
+        "For EACH establishment:\n"
+        "1. Assess its likely Gluten-Free (GF) status from its Name, Address, Google Types and your knowledge, using these definitions "
+        "('Offers GF' is reported as 'Offers GF Menu'):\n"
+        f"{GF_STATUS_DEFINITIONS}\n\n"
+        "2. Decide whether it matches the establishment type requested by ITS request, using these rules:\n"
+        + "\n".join(type_rules) + "\n--- End of Establishment Type Rules ---\n\n"
+        + CLASSIFICATION_OUTPUT_INSTRUCTIONS + "\n\n"
+        + "\n\n".join(request_blocks)
+    )
+
+
+class GeminiClassificationBatcher:
+    """
+    Micro-batches concurrent classification requests into shared Gemini calls.
+
+    classify() blocks like a single Gemini call and returns the same
+    {place_id: status} verdicts, raising GeminiError on failure. Requests arriving within GEMINI_BATCH_WINDOW_MS of each other are
+    packed into one structured-output call and the results split back out.
+    """
+
+    def __init__(self, api_key, window_ms=GEMINI_BATCH_WINDOW_MS, max_places=GEMINI_BATCH_MAX_PLACES):
+        self.api_key = api_key
+        self.window_seconds = window_ms / 1000.0
+        self.max_places = max_places
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=GEMINI_BATCH_MAX_CONCURRENT_CALLS, thread_name_prefix="gemini-batch")
+        self._dispatcher = None
+        self._dispatcher_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "requests": 0,
+            "establishments": 0,
+            "prompt_tokens": 0,
+            "output_tokens": 0,
+            "errors": 0,
+        }
+
+    def _ensure_dispatcher(self):
+        # Started lazily so the thread is created in the serving process, not
+        # in a gunicorn master that later forks.
+        if self._dispatcher is not None and self._dispatcher.is_alive():
+            return
+        with self._dispatcher_lock:
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._dispatcher = threading.Thread(target=self._run, name="gemini-batch-dispatcher", daemon=True)
+                self._dispatcher.start()
+
+    def classify(self, establishments_list, city_name, type_):
+        item = _PendingClassification(establishments_list, city_name, type_)
+        self._ensure_dispatcher()
+        self._queue.put(item)
+        return item.future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            place_count = len(batch[0].establishments_list)
+            deadline = time.monotonic() + self.window_seconds
+            while place_count < self.max_places:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if place_count + len(item.establishments_list) > self.max_places:
+                    # Too big to share this call; it starts the next batch instead.
+                    self._executor.submit(self._dispatch, batch)
+                    batch, place_count = [], 0
+                    deadline = time.monotonic() + self.window_seconds
+                batch.append(item)
+                place_count += len(item.establishments_list)
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch):
+        try:
+            results = self._call_gemini(batch)
+        except Exception as e:
+            print(f"❌ Batched Gemini classification failed for {len(batch)} requests: {e}")
+            with self._stats_lock:
+                self.stats["errors"] += 1
+            for item in batch:
+                item.future.set_exception(GeminiError(f"Could not classify establishments for {item.city_name} ({item.type_}): {e}"))
+            return
+        for request_index, item in enumerate(batch):
+            places_by_id = {
+                f"r{request_index}.{place_index}": place
+                for place_index, place in enumerate(item.establishments_list)
+            }
+            item.future.set_result(verdicts_from_items(results.get(request_index, []), places_by_id))
+
+    def _call_gemini(self, batch):
+        prompt = build_batch_prompt(batch)
+        establishment_count = sum(len(item.establishments_list) for item in batch)
+        print(f"\n🤖 Batched Gemini call: {len(batch)} requests, {establishment_count} establishments.")
+        gemini_data = get_backend(self.api_key).generate(prompt, GEMINI_GENERATION_CONFIG)
+
+        text = gemini_response_text(gemini_data)
+        usage = gemini_data.get("usageMetadata", {})
+        with self._stats_lock:
+            self.stats["calls"] += 1
+            self.stats["requests"] += len(batch)
+            self.stats["establishments"] += establishment_count
+            self.stats["prompt_tokens"] += usage.get("promptTokenCount", 0)
+            self.stats["output_tokens"] += usage.get("candidatesTokenCount", 0)
+
+        # Objects are grouped by the request part of their 'r<request>.<index>' ID.
+        results = {}
+        for record in decode_classifications(text):
+            request_part = str(record.get("id", "") if isinstance(record, dict) else "").lstrip("r").partition(".")[0]
+            if request_part.isdigit():
+                results.setdefault(int(request_part), []).append(record)
+        return results
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(api_key):
+    batcher = _batchers.get(api_key)
+    if batcher is None:
+        with _batchers_lock:
+            batcher = _batchers.setdefault(api_key, GeminiClassificationBatcher(api_key))
+    return batcher
+
+
+def classify_batched(establishments_list, city_name, api_key, type_):
+    """Drop-in for a single Gemini classification call that shares the call with concurrent requests."""
+    return get_batcher(api_key).classify(establishments_list, city_name, type_)
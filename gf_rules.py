@@ -0,0 +1,114 @@
+import os
+import re
+
+from prompts import GF_STATUS_CODES
+
+# Decide clear-cut places locally and only send the ambiguous ones to Gemini.
+GF_LOCAL_RULES = os.getenv('GF_LOCAL_RULES', 'True').lower() not in ['false', '0', 'no']
+
+DEDICATED_GF = GF_STATUS_CODES["D"]
+
+# Names that say the whole venue is gluten-free: 'gluten-free' and its regional
+# equivalents from GF_STATUS_DEFINITIONS, plus the usual celiac-safe wordings.
+# Spaces match any run of spaces, hyphens or underscores.
+DEDICATED_GF_TERMS = [
+    "gluten free", "glutenfree", "celiac safe", "coeliac safe",
+    "glutenfrei", "glutenfreie", "glutenfreies", "glutenfreier", "zöliakie sicher",
+    "sans gluten", "sin gluten", "sin tacc", "senza glutine", "sense gluten",
+    "sem glúten", "sem gluten", "glutenvrij", "glutenfri", "glutenfritt",
+    "gluteeniton", "gluteenittomat", "bezglutenowa", "bezglutenowy", "bezglutenowe",
+    "bezlepková", "bezlepkové", "bezlepkový", "gluténmentes", "glutensiz",
+    "fără gluten", "без глютена", "безглютеновая", "χωρίς γλουτένη", "グルテンフリー",
+]
+
+# ...unless the name qualifies it ('Pizza Roma - gluten-free options'); those
+# are 'Offers GF Menu' or unclear, which stays Gemini's call.
+QUALIFIER_TERMS = [
+    "option", "options", "optionen", "menu", "menü", "speisen", "friendly", "available",
+    "choices", "opciones", "opzioni", "disponible",
+]
+
+# Google types that settle the type question on their own.
+PRIMARY_GOOGLE_TYPES = {
+    'restaurants': {"restaurant"},
+    'cafes': {"cafe"},
+    'bakery': {"bakery"},
+}
+
+# Regional words that make a name explicitly a bakery (ESTABLISHMENT_TYPE_FILTERING_INSTRUCTIONS).
+BAKERY_NAME_TERMS = [
+    "bakery", "bakehouse", "bäckerei", "backstube", "backhaus", "boulangerie", "pâtisserie",
+    "patisserie", "panadería", "panaderia", "pastelería", "panificio", "forno", "pasticceria",
+    "bakkerij", "bageri", "leipomo", "piekarnia", "pekárna", "cukrászda", "konditorei",
+]
+# Regional words that make a name explicitly a restaurant.
+RESTAURANT_NAME_TERMS = [
+    "restaurant", "ristorante", "restaurante", "trattoria", "osteria", "pizzeria", "gasthaus",
+    "gasthof", "wirtshaus", "brasserie", "bistro", "diner", "steakhouse", "grill", "kitchen",
+    "taverna", "ravintola", "restauracja",
+]
+
+
+def _compile_terms(terms):
+    """One case-insensitive alternation for a term list, longest terms first, on word boundaries."""
+    patterns = [
+        r"[\s\-_]*".join(re.escape(word) for word in term.split())
+        for term in sorted(terms, key=len, reverse=True)
+    ]
+    return re.compile(r"(?<!\w)(?:" + "|".join(patterns) + r")(?!\w)", re.IGNORECASE)
+
+
+_DEDICATED_GF_RE = _compile_terms(DEDICATED_GF_TERMS)
+_QUALIFIER_RE = _compile_terms(QUALIFIER_TERMS)
+_BAKERY_NAME_RE = _compile_terms(BAKERY_NAME_TERMS)
+_RESTAURANT_NAME_RE = _compile_terms(RESTAURANT_NAME_TERMS)
+
+
+def gf_status_from_name(name):
+    """'Dedicated GF' when the name itself says the venue is gluten-free, else None (undecided)."""
+    if not name or not _DEDICATED_GF_RE.search(name) or _QUALIFIER_RE.search(name):
+        return None
+    return DEDICATED_GF
+
+
+def type_match_from_types(place, type_):
+    """
+    Applies the type rules that depend only on Google types and explicit
+    names: True (matches), False (does not match) or None (undecided).
+    """
+    google_types = set(place.get('types') or [])
+    name = place.get('name') or ''
+    primary_types = PRIMARY_GOOGLE_TYPES.get(type_)
+    if primary_types is None:
+        return None
+    if google_types & primary_types:
+        return True
+    if type_ == 'bakery' and not _BAKERY_NAME_RE.search(name):
+        return False
+    if (type_ == 'restaurants' and "bakery" in google_types and "cafe" not in google_types
+            and not _RESTAURANT_NAME_RE.search(name)):
+        return False
+    return None
+
+
+def classify_locally(establishments_list, type_):
+    """
+    Returns (verdicts, undecided). `verdicts` maps place_id to 'Dedicated GF'
+    for matching places whose name settles their status, or None for places
+    that cannot match `type_`; everything else is left for Gemini.
+    """
+    if not GF_LOCAL_RULES:
+        return {}, list(establishments_list)
+    verdicts = {}
+    undecided = []
+    for place in establishments_list:
+        matches_type = type_match_from_types(place, type_)
+        if matches_type is False:
+            verdicts[place['place_id']] = None
+            continue
+        status = gf_status_from_name(place.get('name'))
+        if matches_type and status:
+            verdicts[place['place_id']] = status
+        else:
+            undecided.append(place)
+    return verdicts, undecided
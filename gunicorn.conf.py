@@ -0,0 +1,12 @@
+import gc
+
+# Import the app once in the master and fork the workers from it, so they start
+# without re-importing anything and share its memory copy-on-write. This is safe
+# because importing app.py opens no connections or threads (see app.create_app).
+preload_app = True
+
+
+def when_ready(server):
+    # Keep the garbage collector from touching (and so copying) the objects the
+    # master created while importing the app.
+    gc.freeze()
@@ -0,0 +1,145 @@
+import gzip
+import hashlib
+import os
+
+from cache import TTLCache
+from tracing import increment
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; without it responses are only gzip-compressed.
+    brotli = None
+
+HTTP_COMPRESSION = os.getenv('HTTP_COMPRESSION', 'True').lower() not in ['false', '0', 'no']
+# Bodies smaller than this are sent as they are: compressing them saves less than it costs.
+HTTP_COMPRESSION_MIN_BYTES = int(os.getenv('HTTP_COMPRESSION_MIN_BYTES', 1024))
+HTTP_GZIP_LEVEL = int(os.getenv('HTTP_GZIP_LEVEL', 6))
+HTTP_BROTLI_QUALITY = int(os.getenv('HTTP_BROTLI_QUALITY', 5))
+# Compressed bodies are kept by content hash, so a cached search result is compressed once.
+HTTP_COMPRESSED_CACHE_ENTRIES = int(os.getenv('HTTP_COMPRESSED_CACHE_ENTRIES', 256))
+# Browsers and CDNs may reuse a complete search result this long without asking again.
+HTTP_CACHE_MAX_AGE_SECONDS = int(os.getenv('HTTP_CACHE_MAX_AGE_SECONDS', 600))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/", "application/javascript")
+NO_STORE = "no-store"
+
+_compressed_bodies = TTLCache(maxsize=HTTP_COMPRESSED_CACHE_ENTRIES, ttl=60 * 60, stale_ttl=0)
+
+
+def cache_control(max_age=HTTP_CACHE_MAX_AGE_SECONDS, stale_while_revalidate=0):
+    """A public Cache-Control value; stale-while-revalidate lets a CDN answer from its copy while it refetches."""
+    value = f"public, max-age={max_age}"
+    if stale_while_revalidate:
+        value += f", stale-while-revalidate={stale_while_revalidate}"
+    return value
+
+
+def content_digest(body):
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def etag_for(digest, encoding=None):
+    """Strong ETag of one representation: the compressed variants carry the encoding as a suffix."""
+    return f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header names `etag`, the ETag of the representation being sent."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding):
+    """'br', 'gzip' or None, from an Accept-Encoding header (q=0 means 'not acceptable')."""
+    accepted = set()
+    for item in (accept_encoding or "").lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body, encoding, digest):
+    key = (digest, encoding)
+    compressed = _compressed_bodies.get(key)
+    if compressed is None:
+        if encoding == "br":
+            compressed = brotli.compress(body, quality=HTTP_BROTLI_QUALITY)
+        else:
+            compressed = gzip.compress(body, compresslevel=HTTP_GZIP_LEVEL, mtime=0)
+        _compressed_bodies.set(key, compressed)
+    return compressed
+
+
+def prepare_response(method, status, body, content_type, request_headers, headers=None):
+    """
+    Applies conditional GETs and compression to a fully built response.
+    `request_headers` maps lower-case header names to values. Returns
+    (status, body, headers): a 200 GET/HEAD whose ETag matches If-None-Match
+    becomes an empty 304, and bodies of at least HTTP_COMPRESSION_MIN_BYTES of
+    a text type are sent gzip- or brotli-encoded when the client accepts it.
+    Responses marked Cache-Control: no-store get neither an ETag nor a 304.
+    """
+    headers = dict(headers or {})
+    cacheable = method in ("GET", "HEAD") and status == 200 and headers.get("Cache-Control") != NO_STORE
+    encoding = None
+    if HTTP_COMPRESSION and len(body) >= HTTP_COMPRESSION_MIN_BYTES and content_type.startswith(COMPRESSIBLE_TYPES):
+        encoding = choose_encoding(request_headers.get("accept-encoding"))
+        headers["Vary"] = "Accept-Encoding"
+
+    digest = content_digest(body) if cacheable or encoding else None
+    if cacheable:
+        headers["ETag"] = etag_for(digest, encoding)
+        # Only the variant chosen for this request counts: a cached gzip body is no use to a client that now wants br.
+        if etag_matches(request_headers.get("if-none-match"), headers["ETag"]):
+            increment("http_not_modified")
+            return 304, b"", headers
+    if encoding:
+        body = compress(body, encoding, digest)
+        headers["Content-Encoding"] = encoding
+        increment(f"http_compressed_{encoding}")
+    return status, body, headers
+
+
+def init_app(app):
+    """Registers prepare_response on every buffered Flask response (streams are sent as they are)."""
+    from flask import request
+
+    @app.after_request
+    def _http_cache(response):
+        if response.is_streamed or response.direct_passthrough or "Content-Encoding" in response.headers:
+            return response
+        status, body, headers = prepare_response(
+            request.method,
+            response.status_code,
+            response.get_data(),
+            response.mimetype or "",
+            {name.lower(): value for name, value in request.headers.items()},
+            {"Cache-Control": response.headers.get("Cache-Control")} if "Cache-Control" in response.headers else None,
+        )
+        response.status_code = status
+        response.set_data(body)
+        for name, value in headers.items():
+            response.headers[name] = value
+        if status == 304:
+            response.headers.pop("Content-Type", None)
+        return response
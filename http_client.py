@@ -0,0 +1,186 @@
+import email.utils
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limit import get_rate_limiter, get_rate_limit_stats, get_circuit_breaker, report_quota_exceeded
+from tracing import LatencyHistogram, span, increment
+
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 4))
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 16))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 3))
+HTTP_BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', 0.5))
+HTTP_BACKOFF_MAX = float(os.getenv('HTTP_BACKOFF_MAX', 8.0))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Read timeouts per upstream. Gemini keeps the generous 120s the original
+# requests.post call used; Text Search pages normally return well under a second.
+UPSTREAM_READ_TIMEOUTS = {
+    "places": float(os.getenv('PLACES_READ_TIMEOUT', 10)),
+    "gemini": float(os.getenv('GEMINI_READ_TIMEOUT', 120)),
+    "news": float(os.getenv('NEWS_READ_TIMEOUT', 10)),
+}
+DEFAULT_READ_TIMEOUT = 30.0
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+    def __init__(self, upstream, retry_after=0.0):
+        super().__init__(f"{upstream} is temporarily unavailable (circuit open)")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+latency_histograms = {}
+retry_counts = {}
+_stats_lock = threading.Lock()
+
+
+def get_session(url):
+    """Returns the long-lived, connection-pooled session for the URL's host."""
+    host = urlsplit(url).netloc
+    session = _sessions.get(host)
+    if session is not None:
+        return session
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+    return session
+
+
+def _histogram_for(upstream):
+    histogram = latency_histograms.get(upstream)
+    if histogram is None:
+        with _stats_lock:
+            histogram = latency_histograms.setdefault(upstream, LatencyHistogram())
+    return histogram
+
+
+def _retry_after_seconds(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+def _backoff_delay(attempt, response=None):
+    """Full-jitter exponential backoff, overridden by the server's Retry-After."""
+    if response is not None:
+        retry_after = _retry_after_seconds(response)
+        if retry_after is not None:
+            return min(retry_after, HTTP_BACKOFF_MAX)
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+
+def request(method, url, upstream, timeout=None, max_retries=HTTP_MAX_RETRIES, **kwargs):
+    """
+    Sends a request through the pooled session for the URL's host.
+    429 and 5xx responses and connection failures (including connect timeouts)
+    are retried with jittered exponential backoff; read timeouts are not, since
+    the upstream may still be working on the first attempt. Once retries are exhausted the last response
+    is returned (or the last exception re-raised), so callers keep using
+    raise_for_status() and requests' exception types.
+
+    Final outcomes feed the upstream's circuit breaker; while it is open the
+    call fails fast with CircuitOpenError. 429 responses also slow the
+    upstream's token bucket.
+    """
+    if timeout is None:
+        timeout = (HTTP_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUTS.get(upstream, DEFAULT_READ_TIMEOUT))
+    session = get_session(url)
+    histogram = _histogram_for(upstream)
+    limiter = get_rate_limiter(upstream)
+    breaker = get_circuit_breaker(upstream)
+    if not breaker.allow():
+        raise CircuitOpenError(upstream, breaker.retry_after())
+
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        started = time.perf_counter()
+        increment(f"{upstream}_requests")
+        try:
+            with span(upstream, attempt=attempt) as span_attributes:
+                try:
+                    response = session.request(method, url, timeout=timeout, **kwargs)
+                except requests.exceptions.ConnectionError:
+                    span_attributes["status"] = "connection_error"
+                    raise
+                span_attributes["status"] = response.status_code
+                span_attributes["response_bytes"] = int(response.headers.get("Content-Length", 0) or 0)
+        except requests.exceptions.ConnectionError:
+            histogram.observe(time.perf_counter() - started)
+            if attempt >= max_retries:
+                breaker.record_failure()
+                raise
+            delay = _backoff_delay(attempt)
+        except requests.exceptions.RequestException:
+            histogram.observe(time.perf_counter() - started)
+            breaker.record_failure()
+            raise
+        else:
+            histogram.observe(time.perf_counter() - started)
+            if response.status_code == 429 and limiter is not None:
+                limiter.on_rate_limited()
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= max_retries:
+                record_outcome(upstream, response)
+                return response
+            delay = _backoff_delay(attempt, response)
+            response.close()
+            print(f"⚠️ {upstream} returned HTTP {response.status_code}. Retrying in {delay:.2f}s (attempt {attempt + 1}/{max_retries})...")
+
+        with _stats_lock:
+            retry_counts[upstream] = retry_counts.get(upstream, 0) + 1
+        time.sleep(delay)
+        attempt += 1
+
+
+def record_outcome(upstream, response):
+    """Feeds the final response of a call into the upstream's circuit breaker."""
+    if response.status_code == 429:
+        report_quota_exceeded(upstream, _retry_after_seconds(response))
+    elif response.status_code >= 500:
+        get_circuit_breaker(upstream).record_failure()
+    else:
+        get_circuit_breaker(upstream).record_success()
+
+
+def get(url, upstream, **kwargs):
+    return request("GET", url, upstream, **kwargs)
+
+
+def post(url, upstream, **kwargs):
+    return request("POST", url, upstream, **kwargs)
+
+
+def get_upstream_stats():
+    rate_limits = get_rate_limit_stats()
+    return {
+        upstream: dict(
+            histogram.snapshot(),
+            retries=retry_counts.get(upstream, 0),
+            rate_limit=rate_limits.get(upstream),
+        )
+        for upstream, histogram in latency_histograms.items()
+    }
@@ -0,0 +1,376 @@
+import asyncio
+import collections
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+import http_client
+from http_client import CircuitOpenError
+import tracing
+from tracing import increment
+from classification import GeminiError, PRODUCT_GF_VALUES
+from prompts import GF_STATUS_CODES
+
+# "gemini" calls the Gemini REST API; "fake" answers locally and deterministically (see FakeBackend).
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini').lower()
+# JSON mode with a response schema needs a 1.5-generation model or later.
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', "gemini-1.5-flash-latest")
+GEMINI_API_ROOT = os.getenv('GEMINI_API_ROOT', "https://generativelanguage.googleapis.com")
+
+# Hedged requests: when a call has not answered within the recent p95 latency,
+# an identical second call is sent and whichever answers first is used.
+LLM_HEDGING = os.getenv('LLM_HEDGING', 'False').lower() not in ['false', '0', 'no']
+LLM_HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', 0.95))
+# No hedging until this many calls have been timed, and never sooner than LLM_HEDGE_MIN_DELAY_MS.
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', 20))
+LLM_HEDGE_MIN_DELAY_MS = float(os.getenv('LLM_HEDGE_MIN_DELAY_MS', 500))
+LLM_HEDGE_MAX_WORKERS = int(os.getenv('LLM_HEDGE_MAX_WORKERS', 16))
+LLM_LATENCY_WINDOW = 200
+
+_PROMPT_ID_RE = re.compile(r"^- ((?:r\d+\.)?\d+) \|", re.M)
+
+
+class LatencyWindow:
+    """The durations of the last `size` successful calls, for percentile estimates."""
+
+    def __init__(self, size=LLM_LATENCY_WINDOW):
+        self._samples = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None while there are too few samples."""
+        with self._lock:
+            sample_count = len(self._samples)
+        if sample_count < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return max(self.percentile(LLM_HEDGE_PERCENTILE), LLM_HEDGE_MIN_DELAY_MS / 1000.0)
+
+
+# Hedged calls run here so the caller can wait for whichever finishes first.
+_hedge_executor = ThreadPoolExecutor(max_workers=LLM_HEDGE_MAX_WORKERS, thread_name_prefix="llm-hedge")
+
+
+class LLMBackend:
+    """
+    One model behind a generateContent-style interface. generate() and
+    agenerate() take a prompt and a generationConfig and return the decoded
+    Gemini response ({"candidates": [...], "usageMetadata": {...}});
+    stream_generate() yields the same shape once per streamed chunk. All
+    three raise GeminiError when the model cannot be reached or answers with
+    an error. Backends are long-lived: get_backend() hands out one per model.
+    """
+
+    name = "base"
+
+    def __init__(self, model, hedging=LLM_HEDGING):
+        self.model = model
+        self.hedging = hedging
+        self.latencies = LatencyWindow()
+        # Backends are shared by every request thread, so the counters are updated under a lock.
+        self._counters_lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def _count_call(self):
+        with self._counters_lock:
+            self.calls += 1
+
+    def _generate(self, prompt, generation_config):
+        raise NotImplementedError
+
+    async def _agenerate(self, prompt, generation_config):
+        return await asyncio.to_thread(self._generate, prompt, generation_config)
+
+    def stream_generate(self, prompt, generation_config):
+        yield self.generate(prompt, generation_config)
+
+    def _timed(self, call):
+        started = time.perf_counter()
+        result = call()
+        self.latencies.observe(time.perf_counter() - started)
+        return result
+
+    async def _atimed(self, call):
+        started = time.perf_counter()
+        result = await call()
+        self.latencies.observe(time.perf_counter() - started)
+        return result
+
+    def generate(self, prompt, generation_config):
+        self._count_call()
+        call = lambda: self._timed(lambda: self._generate(prompt, generation_config))
+        delay = self.latencies.hedge_delay() if self.hedging else None
+        if delay is None:
+            return call()
+
+        # The hedge delay counts from when the primary starts running, not from when it
+        # was queued: time spent waiting for a free pool thread says nothing about Gemini.
+        started = threading.Event()
+
+        def primary_call():
+            started.set()
+            return call()
+
+        primary = _hedge_executor.submit(tracing.wrap(primary_call))
+        started.wait()
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        backup = self._start_hedge(delay, lambda: _hedge_executor.submit(tracing.wrap(call)))
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except GeminiError as e:
+                    error = e
+                    continue
+                if future is backup:
+                    self._hedge_won()
+                # The slower call cannot be interrupted; it finishes on the hedge pool.
+                return result
+        raise error
+
+    async def agenerate(self, prompt, generation_config):
+        self._count_call()
+        call = lambda: self._atimed(lambda: self._agenerate(prompt, generation_config))
+        delay = self.latencies.hedge_delay() if self.hedging else None
+        if delay is None:
+            return await call()
+
+        primary = asyncio.ensure_future(call())
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        backup = self._start_hedge(delay, lambda: asyncio.ensure_future(call()))
+        pending = {primary, backup}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    # task.exception() raises CancelledError for a cancelled task, so check that first.
+                    if task.cancelled():
+                        continue
+                    if isinstance(task.exception(), GeminiError):
+                        error = task.exception()
+                        continue
+                    if task is backup and task.exception() is None:
+                        self._hedge_won()
+                    return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        if error is None:
+            raise asyncio.CancelledError()
+        raise error
+
+    def _start_hedge(self, delay, submit):
+        with self._counters_lock:
+            self.hedged += 1
+        increment("llm_hedged")
+        print(f"ℹ️ {self.model} has not answered after {delay:.2f}s (p{LLM_HEDGE_PERCENTILE * 100:.0f}). Sending a hedged request.")
+        return submit()
+
+    def _hedge_won(self):
+        with self._counters_lock:
+            self.hedge_wins += 1
+        increment("llm_hedge_wins")
+
+    def stats(self):
+        p50 = self.latencies.percentile(0.5)
+        p95 = self.latencies.percentile(0.95)
+        return {
+            "backend": self.name,
+            "model": self.model,
+            "calls": self.calls,
+            "hedging": self.hedging,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "p50_seconds": round(p50, 3) if p50 is not None else None,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+        }
+
+
+class GeminiBackend(LLMBackend):
+    """
+    The Gemini REST API through the pooled http_client / async_http_client
+    sessions (upstream "gemini", so retries, rate limits and the circuit
+    breaker apply). The key is sent in the x-goog-api-key header rather than
+    the query string, so it does not end up in URLs, logs or traces.
+    """
+
+    name = "gemini"
+
+    def __init__(self, api_key, model=GEMINI_MODEL, api_root=GEMINI_API_ROOT, hedging=LLM_HEDGING):
+        super().__init__(model, hedging=hedging)
+        self.model_url = f"{api_root}/v1beta/models/{model}"
+        self.headers = {"Content-Type": "application/json", "x-goog-api-key": api_key or ""}
+
+    @staticmethod
+    def _payload(prompt, generation_config):
+        # The REST API accepts the SDK's snake_case field names too.
+        return {"contents": [{"parts": [{"text": prompt}]}], "generationConfig": generation_config}
+
+    def _generate(self, prompt, generation_config):
+        try:
+            response = http_client.post(
+                f"{self.model_url}:generateContent", "gemini",
+                headers=self.headers, json=self._payload(prompt, generation_config),
+            )
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.Timeout as e:
+            raise GeminiError("The request to Gemini API timed out.") from e
+        except requests.exceptions.RequestException as e:
+            raise GeminiError(f"Could not connect to Gemini API: {e}") from e
+        except json.JSONDecodeError as e:
+            raise GeminiError("Could not decode Gemini's response.") from e
+
+    async def _agenerate(self, prompt, generation_config):
+        # httpx is only needed by the async server, so the Flask app does not pay for it at startup.
+        import httpx
+        import async_http_client
+        try:
+            response = await async_http_client.post(
+                f"{self.model_url}:generateContent", "gemini",
+                headers=self.headers, json=self._payload(prompt, generation_config),
+            )
+            response.raise_for_status()
+            return response.json()
+        except httpx.TimeoutException as e:
+            raise GeminiError("The request to Gemini API timed out.") from e
+        except (httpx.HTTPError, CircuitOpenError) as e:
+            raise GeminiError(f"Could not connect to Gemini API: {e}") from e
+        except json.JSONDecodeError as e:
+            raise GeminiError("Could not decode Gemini's response.") from e
+
+    def stream_generate(self, prompt, generation_config):
+        """streamGenerateContent over server-sent events. Not hedged: the first chunk is already early."""
+        self._count_call()
+        try:
+            with http_client.post(
+                f"{self.model_url}:streamGenerateContent?alt=sse", "gemini",
+                headers=self.headers, json=self._payload(prompt, generation_config), stream=True,
+            ) as response:
+                response.raise_for_status()
+                for raw_line in response.iter_lines(decode_unicode=True):
+                    if raw_line and raw_line.startswith("data:"):
+                        yield json.loads(raw_line[len("data:"):].strip())
+        except requests.exceptions.Timeout as e:
+            raise GeminiError("The request to Gemini API timed out.") from e
+        except requests.exceptions.RequestException as e:
+            raise GeminiError(f"Could not connect to Gemini API: {e}") from e
+        except json.JSONDecodeError as e:
+            raise GeminiError("Could not decode Gemini's streamed response.") from e
+
+
+def _stable_index(value, modulo):
+    return int(hashlib.sha1(value.encode()).hexdigest(), 16) % modulo
+
+
+def fake_classifications(prompt):
+    """The classification objects the fake backend answers a single-request or batched prompt with."""
+    codes = list(GF_STATUS_CODES)
+    return [
+        {"id": place_id, "gf": codes[_stable_index(place_id, len(codes))], "match": True}
+        for place_id in _PROMPT_ID_RE.findall(prompt)
+    ]
+
+
+def fake_product(prompt):
+    """The product answer the fake backend gives for a /check-product prompt."""
+    barcode = prompt.split(":", 1)[-1].split()[0] if ":" in prompt else prompt
+    return {
+        "isGlutenFree": PRODUCT_GF_VALUES[_stable_index(barcode, len(PRODUCT_GF_VALUES))],
+        "productName": f"Fake product {barcode}",
+        "brand": None,
+        "suggestion": "Answered by the local fake LLM backend.",
+    }
+
+
+class FakeBackend(LLMBackend):
+    """
+    Deterministic local stand-in for offline development, benchmarks and load
+    tests: the same prompt always gets the same answer, shaped by the response
+    schema in the generation config (classification array or product object).
+    `latency_ms` (LLM_FAKE_LATENCY_MS) simulates a slow model.
+    """
+
+    name = "fake"
+
+    def __init__(self, model=GEMINI_MODEL, latency_ms=None, hedging=LLM_HEDGING):
+        super().__init__(model, hedging=hedging)
+        self.latency_ms = float(os.getenv('LLM_FAKE_LATENCY_MS', 0)) if latency_ms is None else latency_ms
+
+    def _answer(self, prompt, generation_config):
+        schema = generation_config.get("responseSchema") or generation_config.get("response_schema") or {}
+        answer = fake_classifications(prompt) if schema.get("type") == "ARRAY" else fake_product(prompt)
+        text = json.dumps(answer)
+        usage = {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4}
+        usage["totalTokenCount"] = usage["promptTokenCount"] + usage["candidatesTokenCount"]
+        return {"candidates": [{"content": {"parts": [{"text": text}]}}], "usageMetadata": usage}
+
+    def _generate(self, prompt, generation_config):
+        time.sleep(self.latency_ms / 1000.0)
+        return self._answer(prompt, generation_config)
+
+    async def _agenerate(self, prompt, generation_config):
+        await asyncio.sleep(self.latency_ms / 1000.0)
+        return self._answer(prompt, generation_config)
+
+    def stream_generate(self, prompt, generation_config):
+        self._count_call()
+        time.sleep(self.latency_ms / 1000.0)
+        answer = self._answer(prompt, generation_config)
+        text = answer["candidates"][0]["content"]["parts"][0]["text"]
+        chunk_size = max(1, len(text) // 4 + 1)
+        for start in range(0, len(text), chunk_size):
+            yield {"candidates": [{"content": {"parts": [{"text": text[start:start + chunk_size]}]}}]}
+        yield {"candidates": [], "usageMetadata": answer["usageMetadata"]}
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(api_key, model=GEMINI_MODEL):
+    """The process-wide backend for `model` (created on first use and reused by every request)."""
+    key = (LLM_BACKEND, api_key, model)
+    backend = _backends.get(key)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(key)
+            if backend is None:
+                if LLM_BACKEND == "fake":
+                    backend = FakeBackend(model)
+                elif LLM_BACKEND == "gemini":
+                    backend = GeminiBackend(api_key, model)
+                else:
+                    raise ValueError(f"Unknown LLM_BACKEND {LLM_BACKEND!r}; expected 'gemini' or 'fake'.")
+                _backends[key] = backend
+    return backend
+
+
+def get_backend_stats():
+    return [backend.stats() for backend in list(_backends.values())]
@@ -0,0 +1,223 @@
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from news_sources import configured_feeds, fetch_feed
+
+# Leave empty to keep articles in memory only (they are refetched after a restart).
+NEWS_DB_PATH = os.getenv('NEWS_DB_PATH', 'news.db')
+NEWS_REFRESH_INTERVAL_SECONDS = float(os.getenv('NEWS_REFRESH_INTERVAL_SECONDS', 30 * 60))
+NEWS_MAX_ARTICLES = int(os.getenv('NEWS_MAX_ARTICLES', 30))
+NEWS_FETCH_MAX_WORKERS = int(os.getenv('NEWS_FETCH_MAX_WORKERS', 4))
+# Articles older than this are pruned from the store.
+NEWS_RETENTION_DAYS = float(os.getenv('NEWS_RETENTION_DAYS', 90))
+
+
+class NewsStore:
+    """
+    SQLite record of the articles seen in every feed, keyed by normalized URL,
+    plus each feed's ETag / Last-Modified validators for conditional GETs.
+    """
+
+    def __init__(self, db_path, retention_days=NEWS_RETENTION_DAYS):
+        self.db_path = db_path
+        self.retention_seconds = retention_days * 24 * 60 * 60
+        self._local = threading.local()
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                with conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS news_articles ("
+                        " url TEXT PRIMARY KEY,"
+                        " title TEXT NOT NULL,"
+                        " date TEXT,"
+                        " published_at REAL,"
+                        " content TEXT,"
+                        " source TEXT,"
+                        " fetched_at REAL NOT NULL)"
+                    )
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS news_feeds ("
+                        " url TEXT PRIMARY KEY,"
+                        " etag TEXT,"
+                        " last_modified TEXT,"
+                        " checked_at REAL NOT NULL)"
+                    )
+                self._initialized = True
+        return conn
+
+    def validators(self, feed_url):
+        row = self._connect().execute(
+            "SELECT etag, last_modified FROM news_feeds WHERE url = ?", (feed_url,)
+        ).fetchone()
+        return row if row else (None, None)
+
+    def save_feed(self, feed_url, articles, etag, last_modified):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO news_feeds (url, etag, last_modified, checked_at) VALUES (?, ?, ?, ?)",
+                (feed_url, etag, last_modified, now),
+            )
+            for article in articles or []:
+                # The first feed to report a URL keeps it; later copies only refresh the text.
+                conn.execute(
+                    "INSERT INTO news_articles (url, title, date, published_at, content, source, fetched_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(url) DO UPDATE SET title = excluded.title, content = excluded.content",
+                    (article['url'], article['title'], article['date'], article['published_at'],
+                     article['content'], article['source'], now),
+                )
+
+    def latest(self, limit):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "DELETE FROM news_articles WHERE COALESCE(published_at, fetched_at) < ?",
+                (time.time() - self.retention_seconds,),
+            )
+        rows = conn.execute(
+            "SELECT url, title, date, published_at, content, source FROM news_articles "
+            "ORDER BY COALESCE(published_at, fetched_at) DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return [
+            {"url": url, "title": title, "date": date, "published_at": published_at, "content": content, "source": source}
+            for url, title, date, published_at, content, source in rows
+        ]
+
+
+class NewsAggregator:
+    """
+    Serves /get-news from memory. A background thread fetches all configured
+    feeds concurrently every `interval` seconds with conditional GETs, so an
+    unchanged feed costs a 304, and rebuilds the in-memory article list from
+    the store (or, without one, from the articles fetched so far), newest
+    first and deduplicated by URL. Page views never wait for a feed server.
+    Like BackgroundRefresher, the thread is started lazily in each process.
+    """
+
+    def __init__(self, store=None, feeds=None, interval=NEWS_REFRESH_INTERVAL_SECONDS,
+                 max_articles=NEWS_MAX_ARTICLES, max_workers=NEWS_FETCH_MAX_WORKERS):
+        self.store = store
+        self.feeds = feeds if feeds is not None else configured_feeds()
+        self.interval = interval
+        self.max_articles = max_articles
+        self.max_workers = max_workers
+        self._articles = []
+        self._memory = {}
+        self._validators = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self.refreshed_at = None
+        self.refreshes = 0
+        self.not_modified = 0
+        self.fetched = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                if self.store is not None and not self._articles:
+                    try:
+                        self._articles = self.store.latest(self.max_articles)
+                    except sqlite3.Error as e:
+                        print(f"⚠️ News store read failed: {e}")
+                threading.Thread(target=self._run, name="news-refresh", daemon=True).start()
+
+    def articles(self):
+        """The current article list: what the store held at startup, then the latest refresh."""
+        self._ensure_started()
+        return self._articles
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ News refresh failed: {e}")
+            time.sleep(self.interval)
+
+    def _validators_for(self, feed_url):
+        if self.store is not None:
+            try:
+                return self.store.validators(feed_url)
+            except sqlite3.Error as e:
+                print(f"⚠️ News store read failed: {e}")
+        return self._validators.get(feed_url, (None, None))
+
+    def _refresh_feed(self, feed):
+        etag, last_modified = self._validators_for(feed['url'])
+        try:
+            articles, etag, last_modified = fetch_feed(feed, etag, last_modified)
+        except requests.exceptions.RequestException as e:
+            self.failed += 1
+            print(f"⚠️ Could not fetch news feed {feed['name']}: {e}")
+            return
+        if articles is None:
+            self.not_modified += 1
+            return
+        self.fetched += 1
+        with self._lock:
+            self._validators[feed['url']] = (etag, last_modified)
+            if self.store is None:
+                for article in articles:
+                    self._memory.setdefault(article['url'], article)
+        if self.store is not None:
+            try:
+                self.store.save_feed(feed['url'], articles, etag, last_modified)
+            except sqlite3.Error as e:
+                print(f"⚠️ News store write failed: {e}")
+
+    def refresh(self):
+        """Fetches every feed concurrently, then swaps in the rebuilt article list."""
+        started = time.perf_counter()
+        if self.feeds:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.feeds)), thread_name_prefix="news-fetch") as executor:
+                list(executor.map(self._refresh_feed, self.feeds))
+        articles = None
+        if self.store is not None:
+            try:
+                articles = self.store.latest(self.max_articles)
+            except sqlite3.Error as e:
+                print(f"⚠️ News store read failed: {e}")
+        if articles is None:
+            with self._lock:
+                articles = sorted(self._memory.values(), key=lambda article: article['published_at'] or 0, reverse=True)
+                self._memory = {article['url']: article for article in articles[:self.max_articles]}
+            articles = articles[:self.max_articles]
+        self._articles = articles
+        self.refreshed_at = time.time()
+        self.refreshes += 1
+        print(f"📰 News refreshed: {len(articles)} articles from {len(self.feeds)} feeds ({time.perf_counter() - started:.1f}s).")
+
+    def stats(self):
+        return {
+            "feeds": len(self.feeds),
+            "articles": len(self._articles),
+            "refreshed_at": self.refreshed_at,
+            "refreshes": self.refreshes,
+            "fetched": self.fetched,
+            "not_modified": self.not_modified,
+            "failed": self.failed,
+        }
+
+
+news_aggregator = NewsAggregator(NewsStore(NEWS_DB_PATH) if NEWS_DB_PATH else None)
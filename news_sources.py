@@ -1,110 +1,151 @@
-import feedparser
+import calendar
 import datetime
-from typing import List, Dict
+import html
+import os
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+
+import http_client
 
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def get_gluten_free_news() -> List[Dict]:
-    """Fetches the latest gluten-free related news using RSS feeds."""
-    # Using the RSS feed from Gluten Free Living
-    feed_url = 'https://www.glutenfreeliving.com/feed/'
-    
+DEFAULT_NEWS_FEEDS = [
+    {"name": "Gluten Free Living", "url": "https://www.glutenfreeliving.com/feed/"},
+    {"name": "Beyond Celiac", "url": "https://www.beyondceliac.org/feed/"},
+    {"name": "Celiac Disease Foundation", "url": "https://celiac.org/feed/"},
+]
+NEWS_MAX_ARTICLES_PER_FEED = int(os.getenv('NEWS_MAX_ARTICLES_PER_FEED', 10))
+NEWS_SUMMARY_MAX_CHARS = 300
+
+# Query parameters that only track where a click came from; they are dropped
+# so the same article linked from two feeds is stored once.
+TRACKING_PARAMETERS = {"fbclid", "gclid", "mc_cid", "mc_eid", "ref", "source"}
+ALLOWED_URL_SCHEMES = {"http", "https"}
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def configured_feeds():
+    """
+    Feeds from NEWS_FEEDS ("Name|https://...,Name|https://..." or bare URLs),
+    or DEFAULT_NEWS_FEEDS when it is not set.
+    """
+    value = os.getenv('NEWS_FEEDS', '').strip()
+    if not value:
+        return list(DEFAULT_NEWS_FEEDS)
+    feeds = []
+    for item in value.split(','):
+        name, _, url = item.strip().rpartition('|')
+        if url:
+            feeds.append({"name": name.strip() or urlsplit(url).netloc, "url": url.strip()})
+    return feeds
+
+
+def normalize_article_url(url):
+    """
+    Lower-case scheme and host, no fragment, tracking parameters or trailing slash.
+    Returns None for anything but an absolute http(s) URL (javascript:, data:, relative links).
+    """
+    parts = urlsplit(url.strip())
+    if parts.scheme.lower() not in ALLOWED_URL_SCHEMES or not parts.netloc:
+        return None
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMETERS
+    ]
+    return urlunsplit((
+        parts.scheme.lower(),
+        parts.netloc.lower(),
+        parts.path.rstrip('/') or '/',
+        urlencode(query),
+        "",
+    ))
+
+
+def _plain_text(value, max_chars=NEWS_SUMMARY_MAX_CHARS):
+    """
+    Feed HTML as plain text. Entities are decoded before tags are stripped, so
+    escaped markup (&lt;img onerror=...&gt;) is removed too, and any angle
+    brackets left over are escaped.
+    """
+    text = html.unescape(value or "")
+    previous = None
+    while previous != text:
+        previous, text = text, _TAG_RE.sub(" ", text)
+    text = " ".join(text.split())
+    if len(text) > max_chars:
+        text = text[:max_chars].rsplit(" ", 1)[0] + "…"
+    return text.replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _published_timestamp(entry):
+    parsed = entry.get('published_parsed') or entry.get('updated_parsed')
+    return calendar.timegm(parsed) if parsed else None
+
+
+def parse_feed_entries(content, feed):
+    """Articles ({"title", "url", "date", "published_at", "content", "source"}) from a feed document."""
+    import feedparser  # Only the background refresh parses feeds; keep it out of app startup.
+    parsed = feedparser.parse(content)
+    if parsed.bozo and not parsed.entries:
+        logger.warning(f"Feed parsing error for {feed['name']}: {parsed.bozo_exception}")
+        return []
+
     articles = []
-    
-    try:
-        logger.info("Fetching news feed")
-        feed = feedparser.parse(feed_url)
-        
-        if feed.bozo:
-            logger.warning(f"Feed parsing error: {feed.bozo_exception}")
-            return []
-        
-        logger.info(f"Found {len(feed.entries)} articles in feed")
-        
-        for entry in feed.entries[:10]:  # Get top 10 articles
-            try:
-                article = {
-                    'title': entry.title,
-                    'url': entry.link,
-                    'date': entry.published if hasattr(entry, 'published') else datetime.datetime.now().strftime("%B %d, %Y"),
-                    'source': 'Gluten Free Living'
-                }
-                articles.append(article)
-                logger.info(f"Added article: {article['title']}")
-            except Exception as e:
-                logger.error(f"Error processing feed entry: {str(e)}")
-                logger.error(f"Feed entry: {str(entry)[:500]}")
-    except Exception as e:
-        logger.error(f"Error fetching feed: {str(e)}")
-        import traceback
-        logger.error(f"Full traceback: {traceback.format_exc()}")
-    
-    logger.info(f"Total articles found: {len(articles)}")
+    for entry in parsed.entries[:NEWS_MAX_ARTICLES_PER_FEED]:
+        if not entry.get('title') or not entry.get('link'):
+            continue
+        url = normalize_article_url(entry.link)
+        if url is None:
+            continue
+        published_at = _published_timestamp(entry)
+        published = (
+            datetime.datetime.fromtimestamp(published_at, datetime.timezone.utc) if published_at
+            else datetime.datetime.now(datetime.timezone.utc)
+        )
+        articles.append({
+            'title': _plain_text(entry.title, max_chars=200),
+            'url': url,
+            'date': published.strftime("%B %d, %Y"),
+            'published_at': published_at,
+            'content': _plain_text(entry.get('summary')),
+            'source': feed['name'],
+        })
     return articles
-    
-    try:
-        logger.info(f"Fetching news from {source['name']}")
-        response = requests.get(source['url'])
-        logger.info(f"Response status code: {response.status_code}")
-        
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            logger.info(f"Page content length: {len(response.text)}")
-            
-            items = soup.select(source['selector'])
-            logger.info(f"Found {len(items)} items using selector '{source['selector']}'")
-            
-            if len(items) == 0:
-                logger.warning(f"No items found with selector '{source['selector']}'")
-                logger.warning(f"HTML content preview: {response.text[:500]}")
-            
-            for item in items[:10]:  # Get top 10 articles
-                try:
-                    logger.info(f"Processing item: {str(item)[:100]}")
-                    
-                    title = item.select_one(source.get('title_selector', 'h2'))
-                    if title:
-                        title = title.text.strip()
-                        logger.info(f"Found title: {title}")
-                    else:
-                        logger.warning(f"No title found using selector '{source.get('title_selector', 'h2')}'")
-                        
-                    link = item.select_one(source.get('link_selector', 'a'))
-                    if link:
-                        link = link['href']
-                        logger.info(f"Found link: {link}")
-                    else:
-                        logger.warning(f"No link found using selector '{source.get('link_selector', 'a')}'")
-                        
-                    if title and link:
-                        date = datetime.datetime.now().strftime("%B %d, %Y")
-                        
-                        # If the link is relative, make it absolute
-                        if not link.startswith('http'):
-                            link = source['url'].split('/')[0] + '//' + source['url'].split('/')[2] + link
-                            logger.info(f"Converted relative link to absolute: {link}")
-                        
-                        article = {
-                            'title': title,
-                            'url': link,
-                            'date': date,
-                            'source': source['name']
-                        }
-                        articles.append(article)
-                        logger.info(f"Successfully added article: {title}")
-                except Exception as e:
-                    logger.error(f"Error processing article: {str(e)}")
-                    logger.error(f"Article HTML: {str(item)[:500]}")
-        else:
-            logger.error(f"Failed to fetch from {source['name']}: Status code {response.status_code}")
-            logger.error(f"Response content: {response.text[:500]}")
-    except Exception as e:
-        logger.error(f"Error fetching from {source['name']}: {str(e)}")
-        import traceback
-        logger.error(f"Full traceback: {traceback.format_exc()}")
-    
-    logger.info(f"Total articles found: {len(articles)}")
+
+
+def fetch_feed(feed, etag=None, last_modified=None):
+    """
+    Conditional GET of one feed. Returns (articles, etag, last_modified);
+    articles is None when the feed is unchanged (HTTP 304).
+    Raises requests exceptions for unreachable feeds and HTTP errors.
+    """
+    headers = {"User-Agent": "gluten-free-finder news aggregator"}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    response = http_client.get(feed['url'], "news", headers=headers)
+    if response.status_code == 304:
+        return None, etag, last_modified
+    response.raise_for_status()
+    articles = parse_feed_entries(response.content, feed)
+    logger.info(f"Found {len(articles)} articles in {feed['name']}")
+    return articles, response.headers.get("ETag"), response.headers.get("Last-Modified")
+
+
+def get_gluten_free_news():
+    """Fetches every configured feed once, without caching. The app serves news_aggregator instead."""
+    articles = []
+    for feed in configured_feeds():
+        try:
+            feed_articles, _, _ = fetch_feed(feed)
+            articles.extend(feed_articles)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error fetching feed {feed['name']}: {e}")
     return articles
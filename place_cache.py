@@ -0,0 +1,131 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Bump whenever the classification prompt or the meaning of a stored verdict
+# changes (prompts.py, classification.py, gf_rules.py), so stale verdicts are
+# re-assessed instead of served.
+#   2: JSON mode with a response schema
+#   3: compact prompt with numeric prompt IDs and status codes
+#   4: local rules decide clear-cut places before Gemini
+PLACE_CLASSIFICATION_PROMPT_VERSION = "4"
+PLACE_CACHE_DB_PATH = os.getenv('PLACE_CACHE_DB_PATH', 'place_classifications.db')
+PLACE_CACHE_TTL_DAYS = float(os.getenv('PLACE_CACHE_TTL_DAYS', 30))
+
+
+class PlaceClassificationStore:
+    """
+    Persistent per-place_id record of Gemini's verdicts.
+
+    A venue's GF status does not depend on what the user searched for, so it
+    is stored once per place_id. Whether it matches a requested type
+    ('restaurants', 'cafes', ...) does, so those verdicts are kept per type in
+    `type_matches`. A place counts as cached for a type only when both are
+    known and were produced by the current model and prompt version.
+    """
+
+    def __init__(self, db_path, model, prompt_version=PLACE_CLASSIFICATION_PROMPT_VERSION, ttl_days=PLACE_CACHE_TTL_DAYS):
+        self.db_path = db_path
+        self.model = model
+        self.prompt_version = prompt_version
+        self.ttl_seconds = ttl_days * 24 * 60 * 60
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                with conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS place_classifications ("
+                        " place_id TEXT PRIMARY KEY,"
+                        " gf_status TEXT,"
+                        " type_matches TEXT NOT NULL DEFAULT '{}',"
+                        " model TEXT NOT NULL,"
+                        " prompt_version TEXT NOT NULL,"
+                        " classified_at REAL NOT NULL)"
+                    )
+                self._initialized = True
+        return conn
+
+    def _load(self, place_ids):
+        if not place_ids:
+            return {}
+        placeholders = ",".join("?" * len(place_ids))
+        rows = self._connect().execute(
+            f"SELECT place_id, gf_status, type_matches, model, prompt_version, classified_at "
+            f"FROM place_classifications WHERE place_id IN ({placeholders})",
+            list(place_ids),
+        ).fetchall()
+        oldest_allowed = time.time() - self.ttl_seconds
+        records = {}
+        for place_id, gf_status, type_matches, model, prompt_version, classified_at in rows:
+            if model != self.model or prompt_version != self.prompt_version or classified_at < oldest_allowed:
+                continue
+            records[place_id] = {"gf_status": gf_status, "type_matches": json.loads(type_matches)}
+        return records
+
+    def split(self, establishments_list, type_):
+        """
+        Returns (cached, uncached). `cached` maps place_id to the stored GF
+        status, or None when the place is known not to match `type_`.
+        """
+        try:
+            records = self._load([place['place_id'] for place in establishments_list])
+        except sqlite3.Error as e:
+            print(f"⚠️ Place classification cache read failed: {e}")
+            return {}, list(establishments_list)
+
+        cached = {}
+        uncached = []
+        for place in establishments_list:
+            record = records.get(place['place_id'])
+            matches = record["type_matches"].get(type_) if record else None
+            if matches is False:
+                cached[place['place_id']] = None
+            elif matches and record["gf_status"]:
+                cached[place['place_id']] = record["gf_status"]
+            else:
+                uncached.append(place)
+        self.hits += len(cached)
+        self.misses += len(uncached)
+        return cached, uncached
+
+    def record(self, verdicts, type_):
+        """
+        Stores verdicts for one type. `verdicts` maps place_id to the assessed GF
+        status, or None for places Gemini said do not match `type_`.
+        """
+        if not verdicts:
+            return
+        now = time.time()
+        try:
+            existing = self._load(list(verdicts))
+            with self._connect() as conn:
+                for place_id, gf_status in verdicts.items():
+                    record = existing.get(place_id, {"gf_status": None, "type_matches": {}})
+                    record["type_matches"][type_] = gf_status is not None
+                    conn.execute(
+                        "INSERT OR REPLACE INTO place_classifications "
+                        "(place_id, gf_status, type_matches, model, prompt_version, classified_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (place_id, gf_status or record["gf_status"], json.dumps(record["type_matches"]),
+                         self.model, self.prompt_version, now),
+                    )
+        except sqlite3.Error as e:
+            print(f"⚠️ Place classification cache write failed: {e}")
+
+    def stats(self):
+        return {"path": self.db_path, "hits": self.hits, "misses": self.misses}
+
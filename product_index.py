@@ -0,0 +1,271 @@
+import argparse
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from product_pack import PackedProductIndex, build_packed_index
+
+PRODUCT_INDEX_DB_PATH = os.getenv('PRODUCT_INDEX_DB_PATH', 'products.db')
+# Read-only memory-mapped dump built with `python product_index.py <dump> --pack <path>`.
+PRODUCT_PACK_PATH = os.getenv('PRODUCT_PACK_PATH', '')
+# Gemini answers are re-checked after this long; bulk-loaded rows never expire.
+PRODUCT_GEMINI_TTL_DAYS = float(os.getenv('PRODUCT_GEMINI_TTL_DAYS', 30))
+LOAD_BATCH_SIZE = 10000
+
+GLUTEN_FREE_LABEL_TAGS = {"en:gluten-free", "en:no-gluten", "en:without-gluten", "en:crossed-grain-symbol"}
+GLUTEN_ALLERGEN_TAGS = {"en:gluten"}
+
+
+def normalize_barcode(barcode):
+    """
+    ASCII digits only, with UPC-A (12 digits) and GTIN-14 codes mapped onto their
+    EAN-13 form so the same product scanned either way shares one key.
+    """
+    # str.isdigit() also accepts other scripts' digits (Arabic-Indic, superscripts), which the packed index cannot store.
+    digits = "".join(ch for ch in str(barcode or "") if "0" <= ch <= "9")
+    if len(digits) == 12:
+        digits = "0" + digits
+    elif len(digits) == 14 and digits.startswith("0"):
+        digits = digits[1:]
+    return digits
+
+
+def _split_tags(value):
+    if isinstance(value, list):
+        return {tag.strip() for tag in value if tag}
+    return {tag.strip() for tag in (value or "").split(",") if tag.strip()}
+
+
+def gluten_status_from_tags(labels_tags, allergens_tags, traces_tags=None):
+    """Maps Open Food Facts label/allergen tags onto the scanner's isGlutenFree values."""
+    if _split_tags(labels_tags) & GLUTEN_FREE_LABEL_TAGS:
+        return "Yes"
+    if _split_tags(allergens_tags) & GLUTEN_ALLERGEN_TAGS:
+        return "No"
+    if _split_tags(traces_tags) & GLUTEN_ALLERGEN_TAGS:
+        return "No"
+    return "Cannot Determine"
+
+
+class ProductIndex:
+    """
+    Barcode -> product verdict store on SQLite. Rows live on disk (a WITHOUT
+    ROWID table clustered on the barcode), so millions of products cost page
+    cache rather than worker RAM, and a lookup is a single B-tree probe.
+
+    With `pack_path`, bulk data is read from a memory-mapped packed file
+    instead (see product_pack.py) and SQLite only holds Gemini answers.
+    """
+
+    def __init__(self, db_path=PRODUCT_INDEX_DB_PATH, gemini_ttl_days=PRODUCT_GEMINI_TTL_DAYS, pack_path=PRODUCT_PACK_PATH):
+        self.db_path = db_path
+        self.pack = None
+        if pack_path:
+            try:
+                self.pack = PackedProductIndex(pack_path)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Could not open packed product index {pack_path}: {e}")
+        self.gemini_ttl_seconds = gemini_ttl_days * 24 * 60 * 60
+        self._local = threading.local()
+        self._initialized = False
+        self._init_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                with conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS products ("
+                        " barcode TEXT PRIMARY KEY,"
+                        " is_gluten_free TEXT NOT NULL,"
+                        " product_name TEXT,"
+                        " brand TEXT,"
+                        " suggestion TEXT,"
+                        " source TEXT NOT NULL,"
+                        " expires_at REAL"
+                        ") WITHOUT ROWID"
+                    )
+                self._initialized = True
+        return conn
+
+    def lookup(self, barcode):
+        """Returns the scanner-shaped dict for `barcode` (plus 'source'), or None."""
+        barcode = normalize_barcode(barcode)
+        # Bulk verdicts come first; SQLite fills in Gemini answers for products the dump could not settle.
+        packed = self.pack.lookup(barcode) if self.pack is not None else None
+        if packed is not None and packed["isGlutenFree"] != "Cannot Determine":
+            self.hits += 1
+            return dict(packed, suggestion=None, source="dump")
+        stored = self._lookup_stored(barcode)
+        if stored is not None:
+            self.hits += 1
+            if packed is not None:
+                stored["productName"] = stored["productName"] or packed["productName"]
+                stored["brand"] = stored["brand"] or packed["brand"]
+            return stored
+        if packed is not None:
+            self.hits += 1
+            return dict(packed, suggestion=None, source="dump")
+        self.misses += 1
+        return None
+
+    def _lookup_stored(self, barcode):
+        try:
+            row = self._connect().execute(
+                "SELECT is_gluten_free, product_name, brand, suggestion, source, expires_at "
+                "FROM products WHERE barcode = ?",
+                (barcode,),
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️ Product index read failed for {barcode}: {e}")
+            return None
+        if row is None or (row[5] is not None and row[5] <= time.time()):
+            return None
+        return {
+            "isGlutenFree": row[0],
+            "productName": row[1],
+            "brand": row[2],
+            "suggestion": row[3],
+            "source": row[4],
+        }
+
+    def store_gemini_result(self, barcode, result):
+        """Writes Gemini's answer back with a TTL. Bulk-loaded verdicts are only filled in, never overwritten."""
+        barcode = normalize_barcode(barcode)
+        if not barcode:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO products (barcode, is_gluten_free, product_name, brand, suggestion, source, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?, 'gemini', ?) "
+                    "ON CONFLICT(barcode) DO UPDATE SET "
+                    " is_gluten_free = excluded.is_gluten_free,"
+                    " product_name = COALESCE(excluded.product_name, products.product_name),"
+                    " brand = COALESCE(excluded.brand, products.brand),"
+                    " suggestion = excluded.suggestion, source = 'gemini', expires_at = excluded.expires_at "
+                    "WHERE products.source = 'gemini' OR products.is_gluten_free = 'Cannot Determine'",
+                    (
+                        barcode,
+                        result.get("isGlutenFree") or "Cannot Determine",
+                        result.get("productName"),
+                        result.get("brand"),
+                        result.get("suggestion"),
+                        time.time() + self.gemini_ttl_seconds,
+                    ),
+                )
+        except sqlite3.Error as e:
+            print(f"⚠️ Product index write failed for {barcode}: {e}")
+
+    def load_rows(self, rows):
+        """
+        Bulk-loads (barcode, is_gluten_free, product_name, brand) tuples in
+        batched transactions. Returns the number of rows written.
+        """
+        conn = self._connect()
+        conn.execute("PRAGMA synchronous=OFF")
+        written = 0
+        batch = []
+        insert = (
+            "INSERT OR REPLACE INTO products (barcode, is_gluten_free, product_name, brand, suggestion, source, expires_at) "
+            "VALUES (?, ?, ?, ?, NULL, 'dump', NULL)"
+        )
+        try:
+            for barcode, is_gluten_free, product_name, brand in rows:
+                barcode = normalize_barcode(barcode)
+                if not barcode:
+                    continue
+                batch.append((barcode, is_gluten_free, product_name or None, brand or None))
+                if len(batch) >= LOAD_BATCH_SIZE:
+                    with conn:
+                        conn.executemany(insert, batch)
+                    written += len(batch)
+                    batch = []
+                    print(f"ℹ️ Loaded {written} products...")
+            if batch:
+                with conn:
+                    conn.executemany(insert, batch)
+                written += len(batch)
+        finally:
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return written
+
+    def stats(self):
+        return {
+            "path": self.db_path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "pack": self.pack.stats() if self.pack is not None else None,
+        }
+
+
+product_index = ProductIndex() if PRODUCT_INDEX_DB_PATH else None
+
+
+def _open_text(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace", newline="")
+    return open(path, "r", encoding="utf-8", errors="replace", newline="")
+
+
+def iter_open_food_facts_rows(path):
+    """
+    Streams (barcode, is_gluten_free, product_name, brand) from an Open Food
+    Facts export: the tab-separated CSV dump or the JSONL dump, optionally gzipped.
+    """
+    csv.field_size_limit(sys.maxsize)
+    is_jsonl = ".jsonl" in os.path.basename(path) or ".json" in os.path.basename(path)
+    with _open_text(path) as f:
+        if is_jsonl:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    product = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                yield (
+                    product.get("code"),
+                    gluten_status_from_tags(product.get("labels_tags"), product.get("allergens_tags"), product.get("traces_tags")),
+                    product.get("product_name"),
+                    product.get("brands"),
+                )
+        else:
+            for product in csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+                yield (
+                    product.get("code"),
+                    gluten_status_from_tags(product.get("labels_tags"), product.get("allergens_tags"), product.get("traces_tags")),
+                    product.get("product_name"),
+                    product.get("brands"),
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load an Open Food Facts export into the barcode index used by /check-product.")
+    parser.add_argument("dump", help="Path to en.openfoodfacts.org.products.csv(.gz) or openfoodfacts-products.jsonl(.gz)")
+    parser.add_argument("--db", default=PRODUCT_INDEX_DB_PATH, help=f"SQLite index to write (default: {PRODUCT_INDEX_DB_PATH})")
+    parser.add_argument("--pack", help="Write a memory-mapped packed file (for PRODUCT_PACK_PATH) instead of loading SQLite")
+    args = parser.parse_args()
+
+    started = time.time()
+    if args.pack:
+        rows = ((normalize_barcode(code), *rest) for code, *rest in iter_open_food_facts_rows(args.dump))
+        count = build_packed_index(rows, args.pack)
+        target = args.pack
+    else:
+        count = ProductIndex(args.db, pack_path="").load_rows(iter_open_food_facts_rows(args.dump))
+        target = args.db
+    print(f"✅ Loaded {count} products into {target} in {time.time() - started:.1f}s")
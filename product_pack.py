@@ -0,0 +1,142 @@
+import mmap
+import os
+import sqlite3
+import struct
+
+# Layout of a .gfpk file (all integers little-endian):
+#   header   MAGIC, record count (uint64), key width (uint32), 4 reserved bytes
+#   keys     count * key_width bytes: sorted barcodes, NUL-padded on the right
+#   offsets  (count + 1) * uint64: start of each record in the heap, plus its end
+#   heap     per record: status (uint8), name length (uint16), name, brand length (uint16), brand
+MAGIC = b"GFPK0001"
+HEADER = struct.Struct("<8sQI4x")
+KEY_WIDTH = 14
+OFFSET = struct.Struct("<Q")
+FIELD_LENGTH = struct.Struct("<H")
+STATUS_CODES = {"Cannot Determine": 0, "Yes": 1, "No": 2}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+MAX_FIELD_BYTES = 0xFFFF
+
+
+def _pack_key(barcode):
+    key = barcode.encode("ascii")
+    if not key or len(key) > KEY_WIDTH:
+        return None
+    return key.ljust(KEY_WIDTH, b"\0")
+
+
+def _encode_field(value):
+    data = (value or "").encode("utf-8")[:MAX_FIELD_BYTES]
+    return FIELD_LENGTH.pack(len(data)) + data
+
+
+def _packed_records(rows):
+    for barcode, is_gluten_free, product_name, brand in rows:
+        key = _pack_key(barcode) if barcode else None
+        if key is None:
+            continue
+        yield key, bytes((STATUS_CODES.get(is_gluten_free, 0),)) + _encode_field(product_name) + _encode_field(brand)
+
+
+def build_packed_index(rows, path):
+    """
+    Writes (barcode, is_gluten_free, product_name, brand) rows to `path` in
+    the packed format. Barcodes must already be normalized; later duplicates
+    win. Rows are sorted in a scratch SQLite file next to `path` and streamed
+    out of it in barcode order, so a full Open Food Facts dump never has to
+    fit in memory. The file is written next to `path` and renamed into place,
+    so workers that have the old file mapped keep reading a consistent copy.
+    Returns the number of records written.
+    """
+    scratch_path = f"{path}.build.db"
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(scratch_path):
+        os.remove(scratch_path)
+    conn = sqlite3.connect(scratch_path)
+    try:
+        # A throwaway file: nothing to recover if the build is interrupted.
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("CREATE TABLE records (barcode BLOB PRIMARY KEY, record BLOB NOT NULL) WITHOUT ROWID")
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO records (barcode, record) VALUES (?, ?)", _packed_records(rows))
+        (count,) = conn.execute("SELECT COUNT(*) FROM records").fetchone()
+
+        # Keys, offsets and heap are consecutive sections, each written by its own ordered scan.
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, count, KEY_WIDTH))
+            for (key,) in conn.execute("SELECT barcode FROM records ORDER BY barcode"):
+                f.write(key)
+            offset = 0
+            for (length,) in conn.execute("SELECT length(record) FROM records ORDER BY barcode"):
+                f.write(OFFSET.pack(offset))
+                offset += length
+            f.write(OFFSET.pack(offset))
+            for (record,) in conn.execute("SELECT record FROM records ORDER BY barcode"):
+                f.write(record)
+    finally:
+        conn.close()
+        os.remove(scratch_path)
+    os.replace(tmp_path, path)
+    return count
+
+
+class PackedProductIndex:
+    """
+    Read-only barcode lookups on a memory-mapped .gfpk file. Nothing is
+    copied into the Python heap, so every gunicorn worker shares the one
+    page-cache copy of the file; a lookup is a binary search over the
+    fixed-width key block.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.key_width = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a packed product index")
+        self._keys_start = HEADER.size
+        self._offsets_start = self._keys_start + self.count * self.key_width
+        self._heap_start = self._offsets_start + (self.count + 1) * OFFSET.size
+
+    def _find(self, key):
+        width, base = self.key_width, self._keys_start
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            start = base + mid * width
+            probe = self._mm[start:start + width]
+            if probe < key:
+                low = mid + 1
+            elif probe > key:
+                high = mid
+            else:
+                return mid
+        return None
+
+    def lookup(self, barcode):
+        """Returns {'isGlutenFree', 'productName', 'brand'} for a normalized barcode, or None."""
+        key = _pack_key(barcode) if barcode else None
+        if key is None or len(key) != self.key_width:
+            return None
+        index = self._find(key)
+        if index is None:
+            return None
+        position = self._heap_start + OFFSET.unpack_from(self._mm, self._offsets_start + index * OFFSET.size)[0]
+        status = self._mm[position]
+        position += 1
+        fields = []
+        for _ in range(2):
+            (length,) = FIELD_LENGTH.unpack_from(self._mm, position)
+            position += FIELD_LENGTH.size
+            fields.append(self._mm[position:position + length].decode("utf-8", errors="replace") or None)
+            position += length
+        return {"isGlutenFree": STATUS_NAMES.get(status, "Cannot Determine"), "productName": fields[0], "brand": fields[1]}
+
+    def close(self):
+        self._mm.close()
+
+    def stats(self):
+        return {"path": self.path, "records": self.count, "bytes": len(self._mm)}
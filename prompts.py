@@ -1,3 +1,6 @@
+import functools
+
+
 def get_restaurants_prompt(city: str, type_: str = "restaurants") -> str:
     """
     Generate a prompt for finding gluten-free establishments in a specific city,
@@ -44,4 +47,162 @@ def get_restaurants_prompt(city: str, type_: str = "restaurants") -> str:
         -   The city name within the list items.
         -   Any introductory, concluding, or explanatory sentences.
         -   If, after checking both primary and secondary search criteria against your knowledge, you have no relevant {establishment_type_singular} names to list for {city}, you MUST return only the single word: None
-"""
\ No newline at end of file
+"""
+
+
+# Labels Gemini assigns, in the order results are listed.
+GF_STATUS_LABELS = ["Dedicated GF", "Offers GF Menu", "Unclear - Verify Directly"]
+# One-letter codes Gemini answers with in JSON mode; output tokens are the slow part of a call.
+GF_STATUS_CODES = {"D": "Dedicated GF", "O": "Offers GF Menu", "U": "Unclear - Verify Directly"}
+
+# --- Define GF Status Categories for Gemini ---
+GF_STATUS_DEFINITIONS = (
+    "Gluten-Free (GF) Status Definitions:\n"
+    "1. 'Dedicated GF': Classify as 'Dedicated GF' if the establishment's NAME contains the term 'gluten-free' or its direct regional language equivalents (e.g., 'glutenfrei', Glutenfreie, Sans gluten, Sin gluten, Senza glutine). Also use this if the name uses other strong indicators of being 100% gluten-free like 'celiac safe', 'entirely gluten-free', 'gluten-free kitchen', or their regional equivalents (e.g., 'glutenfrei Pur', 'Zöliakie sicher'), or if it's a brand you recognize from your training data as being exclusively gluten-free.\n"
+    "2. 'Offers GF': Classify as 'Offers GF' if the establishment is a standard type (e.g., restaurant, pizzeria, cafe) that doesn't explicitly claim to be fully dedicated, but its name (which might include terms like 'gluten-free options' or regional equivalents like 'glutenfreie Optionen / Speisen') or its Google Types suggest it is likely to have specific gluten-free options or a separate menu. This is the most common category for general establishments catering to GF needs. The initial search already used a 'gluten-free' keyword, so lean towards this if not 'Dedicated GF' or clearly 'Unclear'.\n"
+    "3. 'Unclear - Verify Directly': Classify as 'Unclear - Verify Directly' if the name and types provide insufficient information for a confident GF assessment, if it's a type of establishment where gluten is prevalent and cross-contamination is a high concern without explicit GF protocols (e.g., many standard bakeries not stating GF, some pizzerias), or if there's ambiguity. When in doubt, choose this status."
+)
+
+# --- Define Establishment Type Filtering Instructions ---
+ESTABLISHMENT_TYPE_FILTERING_INSTRUCTIONS = {
+    'restaurants': (
+        "For the 'restaurants' category:\n"
+        "- Primary Match: Google Types includes 'restaurant'.\n"
+        "- Acceptable: If 'restaurant' is present, other types like 'cafe', 'bar', 'food' are fine.\n"
+        "- Caution: If types include 'bakery' but NOT 'restaurant', it's likely not a restaurant for this list.\n"
+        "- Fallback: If 'restaurant' isn't in Google Types, but the Name strongly implies a full-service restaurant (e.g., 'XYZ Diner', 'Steakhouse', 'Italian Kitchen'), it can be included.\n"
+        "- Regional Language: Names might use regional equivalents for 'restaurant' (e.g., 'Gasthaus', 'Wirtshaus', 'Pizzeria', 'Trattoria'). Consider these positive indicators.\n"
+        "- Exclude: Solely bakeries or cafes not operating as full restaurants."
+    ),
+    'cafes': (
+        "For the 'cafes' category:\n"
+        "- Primary Match: Google Types includes 'cafe'.\n"
+        "- Acceptable: If 'cafe' is present, other types like 'restaurant', 'bakery', 'food' are fine.\n"
+        "- Also consider: If 'cafe' is absent, but types include 'bakery' AND the Name suggests a cafe setting (e.g., 'Artisan Bakery & Cafe'), include it.\n"
+        "- Fallback: If 'cafe' isn't in Google Types, but the Name or other types (e.g., 'coffee_shop', 'tea_room') strongly indicate a primary cafe function, include it.\n"
+        "- Regional Language: Names might use regional equivalents for 'cafe' (e.g., 'Kaffeehaus', 'Konditorei' with cafe service). Consider these positive indicators.\n"
+        "- Exclude: Formal restaurants without a clear cafe component, standalone bakeries/stores with no cafe service."
+    ),
+    'bakery': (
+        "For the 'bakery' category:\n"
+        "- Primary Match: Google Types includes 'bakery'.\n"
+        "- Acceptable: If 'bakery' is present, other types like 'cafe', 'store', 'food' are common and fine.\n"
+        "- Regional Language: Names might use regional equivalents for 'bakery' (e.g., 'Bäckerei', 'Boulangerie', 'Panadería'). Consider these positive indicators.\n"
+        "- Exclude: If 'bakery' is NOT in Google Types, exclude unless the name is exceptionally and explicitly a bakery (e.g., '100% Glutenfrei Bäckerei Mustermann'). Prioritize the 'bakery' type tag."
+    ),
+}
+DEFAULT_TYPE_FILTERING_INSTRUCTIONS = "Filter based on the general understanding of the requested establishment type."
+
+
+# --- Compact classification prompt ---
+# Google adds these to nearly every result; they never decide a type match.
+UNINFORMATIVE_GOOGLE_TYPES = {"point_of_interest", "establishment", "food"}
+# Rough chars-per-token ratio for Gemini's tokenizer on mixed-language place data.
+CHARS_PER_TOKEN = 4
+# Expected JSON output per establishment: {"id": "12", "gf": "O", "match": true}.
+OUTPUT_TOKENS_PER_ESTABLISHMENT = 12
+
+
+CLASSIFICATION_OUTPUT_INSTRUCTIONS = (
+    "Return a JSON array with exactly one object per establishment ID: "
+    "{\"id\": ID, \"gf\": status code, \"match\": true/false}, where the status code is "
+    + ", ".join(f"'{code}' for '{label}'" for code, label in GF_STATUS_CODES.items())
+    + " and match says whether it is of the requested type."
+)
+
+
+# `type_` comes straight from the query string, so the cache is bounded: the
+# known types stay cached and arbitrary values cannot grow it without limit.
+CLASSIFICATION_INSTRUCTIONS_CACHE_SIZE = 32
+
+
+@functools.lru_cache(maxsize=CLASSIFICATION_INSTRUCTIONS_CACHE_SIZE)
+def classification_instructions(type_):
+    """
+    The static part of the classification prompt for one establishment type,
+    built once per process for the common types. It is the prompt prefix, so
+    calls for the same type share it verbatim.
+    """
+    type_rules = ESTABLISHMENT_TYPE_FILTERING_INSTRUCTIONS.get(type_, DEFAULT_TYPE_FILTERING_INSTRUCTIONS)
+    return (
+        "You are a meticulous gluten-free dining investigator.\n"
+        f"The user has requested establishments of type: '{type_}'. The places below were found with a 'gluten-free' keyword search.\n\n"
+        "For EACH establishment:\n"
+        "1. Assess its likely Gluten-Free (GF) status from its Name, Address, Google Types and your knowledge, "
+        "using these definitions ('Offers GF' is reported as 'Offers GF Menu'):\n"
+        f"{GF_STATUS_DEFINITIONS}\n\n"
+        f"2. Decide whether it matches the requested type ('{type_}'):\n"
+        f"--- Rules for Matching Establishment Type: '{type_}' ---\n"
+        f"{type_rules}\n"
+        "--- End of Establishment Type Rules ---\n\n"
+        + CLASSIFICATION_OUTPUT_INSTRUCTIONS + "\n"
+    )
+
+
+def _common_address_suffix(establishments_list):
+    """Trailing address parts shared by every place (', Berlin, Germany'), stated once instead of per line."""
+    split_addresses = [[part.strip() for part in (place.get('address') or '').split(',')] for place in establishments_list]
+    if len(split_addresses) < 2:
+        return []
+    suffix = []
+    # Never strip a whole address: the street part always stays on the line.
+    max_parts = min(len(parts) for parts in split_addresses) - 1
+    while len(suffix) < max_parts:
+        candidates = {parts[-1 - len(suffix)] for parts in split_addresses}
+        if len(candidates) != 1 or not next(iter(candidates)):
+            break
+        suffix.insert(0, candidates.pop())
+    return suffix
+
+
+def encode_establishments(establishments_list, id_prefix=""):
+    """
+    One line per place: 'ID | Name | Address | types'. IDs are `id_prefix`
+    plus the place's index, uninformative Google types are dropped, and an
+    address suffix shared by all places is returned separately.
+    Returns (lines, shared_address_suffix).
+    """
+    suffix = _common_address_suffix(establishments_list)
+    lines = []
+    for index, place in enumerate(establishments_list):
+        google_types_list = place.get('types', [])
+        if not isinstance(google_types_list, list):
+            google_types_list = []
+        types = ",".join(t for t in google_types_list if t not in UNINFORMATIVE_GOOGLE_TYPES)
+        address_parts = [part.strip() for part in (place.get('address') or 'N/A').split(',')]
+        if suffix:
+            address_parts = address_parts[:-len(suffix)]
+        lines.append(f"- {id_prefix}{index} | {place.get('name', 'N/A')} | {', '.join(address_parts)} | {types}")
+    return lines, ", ".join(suffix)
+
+
+def build_classification_prompt(establishments_list, city_name, type_):
+    """JSON-mode classification prompt; establishments are addressed by their index in the list."""
+    lines, shared_suffix = encode_establishments(establishments_list)
+    location = f"{city_name} (all addresses end in '{shared_suffix}')" if shared_suffix else city_name
+    return (
+        classification_instructions(type_)
+        + f"\nEstablishments in {location}, one per line as: ID | Name | Address | Google Types\n"
+        + "\n".join(lines)
+    )
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_for_token_budget(establishments_list, type_, prompt_token_budget, max_output_tokens):
+    """
+    Splits a list so each chunk's prompt stays within `prompt_token_budget`
+    and its expected JSON answer within `max_output_tokens`. Chunks are of
+    near-equal size so they finish together when classified in parallel.
+    """
+    if not establishments_list:
+        return []
+    lines, _ = encode_establishments(establishments_list)
+    place_tokens = sum(estimate_tokens(line) + 1 for line in lines)
+    room_per_chunk = max(prompt_token_budget - estimate_tokens(classification_instructions(type_)), 1)
+    places_per_output = max(max_output_tokens // OUTPUT_TOKENS_PER_ESTABLISHMENT, 1)
+    chunk_count = max(-(-place_tokens // room_per_chunk), -(-len(establishments_list) // places_per_output), 1)
+    chunk_size = -(-len(establishments_list) // chunk_count)
+    return [establishments_list[start:start + chunk_size] for start in range(0, len(establishments_list), chunk_size)]
@@ -0,0 +1,241 @@
+import asyncio
+import os
+import threading
+import time
+
+# Per-upstream request quotas in requests per second. 0 disables limiting.
+UPSTREAM_QPS = {
+    "places": float(os.getenv('PLACES_QPS', 10)),
+    "gemini": float(os.getenv('GEMINI_QPS', 5)),
+}
+# On a 429 / OVER_QUERY_LIMIT the rate is multiplied by this factor (never below
+# RATE_LIMIT_MIN_FRACTION of the quota), then climbs back to the full quota
+# linearly over RATE_LIMIT_RECOVERY_SECONDS.
+RATE_LIMIT_DECREASE_FACTOR = float(os.getenv('RATE_LIMIT_DECREASE_FACTOR', 0.5))
+RATE_LIMIT_MIN_FRACTION = float(os.getenv('RATE_LIMIT_MIN_FRACTION', 0.1))
+RATE_LIMIT_RECOVERY_SECONDS = float(os.getenv('RATE_LIMIT_RECOVERY_SECONDS', 30))
+# Consecutive failed calls that open an upstream's circuit, and how long it stays open.
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_COOLDOWN_SECONDS = float(os.getenv('CIRCUIT_COOLDOWN_SECONDS', 30))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `rate` tokens are added per second up to `capacity`;
+    acquire() blocks until a token is available.
+
+    The rate adapts to the upstream: on_rate_limited() cuts it when the quota
+    pushes back, and it recovers to the configured rate over `recovery_seconds`.
+    """
+
+    def __init__(self, rate, capacity=None, decrease_factor=RATE_LIMIT_DECREASE_FACTOR,
+                 min_fraction=RATE_LIMIT_MIN_FRACTION, recovery_seconds=RATE_LIMIT_RECOVERY_SECONDS):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = rate * min_fraction
+        self.decrease_factor = decrease_factor
+        self.recovery_per_second = rate / recovery_seconds if recovery_seconds > 0 else float("inf")
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.throttled = 0
+        self.rate_decreases = 0
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + elapsed * self.recovery_per_second)
+        self._updated = now
+
+    def on_rate_limited(self):
+        """Backs off after the upstream reported its quota exceeded."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            # Drop the burst allowance too, so queued callers feel the new rate at once.
+            self._tokens = min(self._tokens, 1)
+            self.rate_decreases += 1
+
+    def try_acquire(self):
+        """Takes a token without waiting. Returns 0 on success, otherwise the seconds until one is available."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.acquired += 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        waited = False
+        while True:
+            wait_seconds = self.try_acquire()
+            if not wait_seconds:
+                if waited:
+                    with self._lock:
+                        self.throttled += 1
+                return
+            waited = True
+            time.sleep(wait_seconds)
+
+    async def acquire_async(self):
+        """acquire() for event-loop callers: waits with asyncio.sleep instead of blocking the thread."""
+        waited = False
+        while True:
+            wait_seconds = self.try_acquire()
+            if not wait_seconds:
+                if waited:
+                    with self._lock:
+                        self.throttled += 1
+                return
+            waited = True
+            await asyncio.sleep(wait_seconds)
+
+    def stats(self):
+        return {
+            "rate": round(self.rate, 3),
+            "max_rate": self.max_rate,
+            "capacity": self.capacity,
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "rate_decreases": self.rate_decreases,
+        }
+
+
+class CircuitBreaker:
+    """
+    Per-upstream circuit breaker.
+
+    closed: calls flow; `failure_threshold` consecutive failures open it.
+    open: calls are rejected for `cooldown` seconds.
+    half_open: after the cooldown one probe call is let through; its success
+    closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, cooldown=CIRCUIT_COOLDOWN_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._failures = 0
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+        self.half_open_probes = 0
+
+    def _refresh(self, now):
+        if self.state == "open" and now >= self._open_until:
+            self.state = "half_open"
+            self._probe_in_flight = False
+
+    def allow(self):
+        """Returns True if a call may go out now (taking the half-open probe slot if needed)."""
+        with self._lock:
+            self._refresh(time.monotonic())
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self.half_open_probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def available(self):
+        """Like allow() but without taking the probe slot: would a new search get through?"""
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self.state == "closed" or (self.state == "half_open" and not self._probe_in_flight)
+
+    def retry_after(self):
+        with self._lock:
+            return max(self._open_until - time.monotonic(), 0.0) if self.state == "open" else 0.0
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                print(f"✅ {self.name} circuit closed again.")
+            self.state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self._open(self.cooldown)
+
+    def trip(self, cooldown=None):
+        """Opens the circuit immediately, e.g. on an explicit quota-exhausted answer."""
+        with self._lock:
+            self._open(self.cooldown if cooldown is None else max(cooldown, self.cooldown))
+
+    def _open(self, cooldown):
+        if self.state != "open":
+            self.opened += 1
+            print(f"⚠️ {self.name} circuit opened for {cooldown:.0f}s.")
+        self.state = "open"
+        self._open_until = time.monotonic() + cooldown
+        self._probe_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            self._refresh(time.monotonic())
+            return {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "half_open_probes": self.half_open_probes,
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(upstream):
+    """Returns the shared TokenBucket for `upstream`, or None if it is not rate limited."""
+    limiter = _limiters.get(upstream)
+    if limiter is not None:
+        return limiter
+    qps = UPSTREAM_QPS.get(upstream, 0)
+    if qps <= 0:
+        return None
+    with _limiters_lock:
+        return _limiters.setdefault(upstream, TokenBucket(qps))
+
+
+_breakers = {}
+
+
+def get_circuit_breaker(upstream):
+    breaker = _breakers.get(upstream)
+    if breaker is not None:
+        return breaker
+    with _limiters_lock:
+        return _breakers.setdefault(upstream, CircuitBreaker(upstream))
+
+
+def report_quota_exceeded(upstream, retry_after=None):
+    """
+    Called when `upstream` says its quota is exhausted (HTTP 429 or Places'
+    OVER_QUERY_LIMIT): slows this process's limiter and opens the circuit so
+    other requests stop spending calls on it.
+    """
+    limiter = get_rate_limiter(upstream)
+    if limiter is not None:
+        limiter.on_rate_limited()
+    get_circuit_breaker(upstream).trip(retry_after)
+
+
+def get_rate_limit_stats():
+    stats = {upstream: limiter.stats() for upstream, limiter in _limiters.items()}
+    for upstream, breaker in _breakers.items():
+        stats.setdefault(upstream, {})["circuit"] = breaker.stats()
+    return stats
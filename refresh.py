@@ -0,0 +1,138 @@
+import heapq
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REFRESH_ENABLED = os.getenv('REFRESH_ENABLED', 'True').lower() not in ['false', '0', 'no']
+# An entry that expired less than this long ago is served at once while it is refreshed.
+SEARCH_CACHE_SWR_SECONDS = int(os.getenv('SEARCH_CACHE_SWR_SECONDS', 60 * 60))
+REFRESH_MAX_WORKERS = int(os.getenv('REFRESH_MAX_WORKERS', 2))
+# The scheduler re-runs the REFRESH_TOP_N most requested searches that expire
+# within REFRESH_AHEAD_SECONDS, checking every REFRESH_INTERVAL_SECONDS.
+REFRESH_TOP_N = int(os.getenv('REFRESH_TOP_N', 20))
+REFRESH_AHEAD_SECONDS = int(os.getenv('REFRESH_AHEAD_SECONDS', 15 * 60))
+REFRESH_INTERVAL_SECONDS = float(os.getenv('REFRESH_INTERVAL_SECONDS', 60))
+# Request counts are multiplied by this every interval so popularity follows recent traffic.
+REFRESH_POPULARITY_DECAY = float(os.getenv('REFRESH_POPULARITY_DECAY', 0.5))
+REFRESH_MAX_TRACKED_KEYS = 5000
+
+
+class BackgroundRefresher:
+    """
+    Re-runs searches off the request path.
+
+    schedule() queues one refresh per key on a small thread pool (a key that
+    is already queued or running is skipped). record_request() counts how often
+    each key is asked for; a scheduler thread periodically refreshes the most
+    requested keys whose cache entries are about to expire, so popular cities
+    never reach the point where a user has to wait for the upstreams.
+    Threads are started lazily in each process, so a gunicorn --preload master
+    never hands dead threads to its workers.
+    """
+
+    def __init__(self, refresh_fn, expiry_fn, max_workers=REFRESH_MAX_WORKERS, top_n=REFRESH_TOP_N,
+                 ahead_seconds=REFRESH_AHEAD_SECONDS, interval=REFRESH_INTERVAL_SECONDS,
+                 decay=REFRESH_POPULARITY_DECAY):
+        self.refresh_fn = refresh_fn
+        self.expiry_fn = expiry_fn
+        self.max_workers = max_workers
+        self.top_n = top_n
+        self.ahead_seconds = ahead_seconds
+        self.interval = interval
+        self.decay = decay
+        self._executor = None
+        self._scheduler = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._popularity = {}
+        self.scheduled = 0
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.proactive = 0
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="cache-refresh")
+                self._scheduler = threading.Thread(target=self._run_scheduler, name="cache-refresh-scheduler", daemon=True)
+                self._pending = set()
+                self._pid = os.getpid()
+                self._scheduler.start()
+
+    def record_request(self, key, *args):
+        self._ensure_started()
+        with self._lock:
+            count, _ = self._popularity.get(key, (0.0, None))
+            self._popularity[key] = (count + 1, args)
+            if len(self._popularity) > REFRESH_MAX_TRACKED_KEYS:
+                coldest = min(self._popularity, key=lambda k: self._popularity[k][0])
+                del self._popularity[coldest]
+
+    def schedule(self, key, *args):
+        """Queues a refresh of `key` unless one is already pending. Returns True if queued."""
+        self._ensure_started()
+        with self._lock:
+            if key in self._pending:
+                self.skipped += 1
+                return False
+            self._pending.add(key)
+            self.scheduled += 1
+        self._executor.submit(self._refresh, key, args)
+        return True
+
+    def _refresh(self, key, args):
+        started = time.perf_counter()
+        try:
+            self.refresh_fn(key, *args)
+            self.completed += 1
+            print(f"🔄 Refreshed '{key}' in the background ({time.perf_counter() - started:.1f}s).")
+        except Exception as e:
+            self.failed += 1
+            print(f"⚠️ Background refresh of '{key}' failed: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def hottest(self):
+        with self._lock:
+            ranked = heapq.nlargest(self.top_n, self._popularity.items(), key=lambda item: item[1][0])
+        return [(key, args) for key, (count, args) in ranked]
+
+    def _run_scheduler(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh_expiring()
+            except Exception as e:
+                print(f"⚠️ Refresh scheduler pass failed: {e}")
+
+    def refresh_expiring(self):
+        """One scheduler pass: refresh hot keys expiring within `ahead_seconds`, then decay popularity."""
+        deadline = time.time() + self.ahead_seconds
+        for key, args in self.hottest():
+            expires_at = self.expiry_fn(key)
+            if expires_at is not None and expires_at <= deadline and self.schedule(key, *args):
+                self.proactive += 1
+        with self._lock:
+            self._popularity = {
+                key: (count * self.decay, args)
+                for key, (count, args) in self._popularity.items()
+                if count * self.decay >= 0.05
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "tracked_keys": len(self._popularity),
+                "scheduled": self.scheduled,
+                "proactive": self.proactive,
+                "completed": self.completed,
+                "failed": self.failed,
+                "skipped": self.skipped,
+            }
@@ -0,0 +1,218 @@
+import asyncio
+import fcntl
+import hashlib
+import os
+import threading
+import time
+
+from tracing import increment
+
+SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', 'True').lower() not in ['false', '0', 'no']
+# Directory for per-key lock files shared by the gunicorn workers on one host.
+# Empty keeps coalescing within each worker process.
+SINGLE_FLIGHT_LOCK_DIR = os.getenv('SINGLE_FLIGHT_LOCK_DIR', '')
+# How long a worker waits for another worker's search before running its own.
+SINGLE_FLIGHT_LOCK_TIMEOUT = float(os.getenv('SINGLE_FLIGHT_LOCK_TIMEOUT', 150))
+LOCK_POLL_INTERVAL = 0.05
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class KeyFileLock:
+    """
+    Exclusive flock() on `<lock_dir>/<sha1(key)>.lock`. The holder unlinks the
+    file on release; a waiter that wakes up holding an unlinked file retries,
+    so stale lock files never pile up.
+    """
+
+    def __init__(self, lock_dir, key):
+        self.path = os.path.join(lock_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".lock")
+        self._fd = None
+        self.contended = False
+
+    def acquire(self, timeout):
+        """Returns True once the lock is held, False if `timeout` seconds pass first."""
+        deadline = time.monotonic() + timeout
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    self.contended = True
+                    if time.monotonic() >= deadline:
+                        os.close(fd)
+                        return False
+                    time.sleep(LOCK_POLL_INTERVAL)
+            try:
+                current = os.stat(self.path)
+            except FileNotFoundError:
+                current = None
+            opened = os.fstat(fd)
+            if current is not None and (current.st_dev, current.st_ino) == (opened.st_dev, opened.st_ino):
+                self._fd = fd
+                return True
+            os.close(fd)
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        os.close(self._fd)
+        self._fd = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution.
+
+    The first caller for a key (the leader) runs `fn`; callers arriving while
+    it runs wait and receive the same result, or the same exception. With a
+    `lock_dir` the leader also takes a per-key file lock so leaders in other
+    worker processes queue behind it; once they get the lock they call
+    `recheck()` (typically a shared-cache lookup) before running `fn` themselves.
+
+    With a `deadline`, no caller waits on another one past it: when it runs
+    out first, `on_timeout()` (typically a stale or partial answer) is returned.
+    """
+
+    def __init__(self, lock_dir=SINGLE_FLIGHT_LOCK_DIR, lock_timeout=SINGLE_FLIGHT_LOCK_TIMEOUT):
+        self.lock_dir = lock_dir
+        self.lock_timeout = lock_timeout
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+        self.cross_worker_waits = 0
+        self.cross_worker_hits = 0
+
+    def _lock_wait(self, deadline):
+        return self.lock_timeout if deadline is None else min(self.lock_timeout, deadline.remaining())
+
+    def _follower_wait(self, deadline, on_timeout):
+        return deadline.remaining() if deadline is not None and on_timeout is not None else None
+
+    def _deadline_passed(self, key, deadline, on_timeout):
+        if deadline is None or on_timeout is None or not deadline.expired():
+            return False
+        increment("single_flight_deadline_timeouts")
+        print(f"⏱️ Deadline reached while waiting for the search for '{key}' already in flight.")
+        return True
+
+    def do(self, key, fn, recheck=None, deadline=None, on_timeout=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if not leader:
+            increment("single_flight_followers")
+            if not call.done.wait(self._follower_wait(deadline, on_timeout)):
+                self._deadline_passed(key, deadline, on_timeout)
+                return on_timeout()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_leader(key, fn, recheck, deadline, on_timeout)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _run_leader(self, key, fn, recheck, deadline=None, on_timeout=None):
+        if not self.lock_dir:
+            return fn()
+        file_lock = KeyFileLock(self.lock_dir, key)
+        locked = file_lock.acquire(self._lock_wait(deadline))
+        try:
+            if file_lock.contended:
+                self.cross_worker_waits += 1
+                if recheck is not None:
+                    result = recheck()
+                    if result is not None:
+                        self.cross_worker_hits += 1
+                        increment("single_flight_cross_worker_hits")
+                        return result
+            if not locked and self._deadline_passed(key, deadline, on_timeout):
+                return on_timeout()
+            if not locked:
+                print(f"⚠️ Timed out waiting for another worker's search for '{key}'. Running it here.")
+            return fn()
+        finally:
+            file_lock.release()
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls)
+        return {
+            "in_flight": in_flight,
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "cross_worker_waits": self.cross_worker_waits,
+            "cross_worker_hits": self.cross_worker_hits,
+        }
+
+
+class AsyncSingleFlight(SingleFlight):
+    """SingleFlight for coroutines: followers await the leader's task; file locks are taken off the loop."""
+
+    async def do(self, key, fn, recheck=None, deadline=None, on_timeout=None):
+        task = self._calls.get(key)
+        if task is not None:
+            self.followers += 1
+            increment("single_flight_followers")
+            try:
+                return await asyncio.wait_for(asyncio.shield(task), self._follower_wait(deadline, on_timeout))
+            except asyncio.TimeoutError:
+                self._deadline_passed(key, deadline, on_timeout)
+                return await asyncio.to_thread(on_timeout)
+        self.leaders += 1
+        task = asyncio.ensure_future(self._run_leader(key, fn, recheck, deadline, on_timeout))
+        self._calls[key] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if self._calls.get(key) is task:
+                del self._calls[key]
+
+    async def _run_leader(self, key, fn, recheck, deadline=None, on_timeout=None):
+        if not self.lock_dir:
+            return await fn()
+        file_lock = KeyFileLock(self.lock_dir, key)
+        locked = await asyncio.to_thread(file_lock.acquire, self._lock_wait(deadline))
+        try:
+            if file_lock.contended:
+                self.cross_worker_waits += 1
+                if recheck is not None:
+                    result = await asyncio.to_thread(recheck)
+                    if result is not None:
+                        self.cross_worker_hits += 1
+                        increment("single_flight_cross_worker_hits")
+                        return result
+            if not locked and self._deadline_passed(key, deadline, on_timeout):
+                return await asyncio.to_thread(on_timeout)
+            if not locked:
+                print(f"⚠️ Timed out waiting for another worker's search for '{key}'. Running it here.")
+            return await fn()
+        finally:
+            file_lock.release()
@@ -0,0 +1,136 @@
+"""
+http_client against a local stub server: retries, Retry-After, the circuit
+breaker on 429 and connection reuse. Run from the repository root:
+
+    python -m pytest tests
+"""
+import socket
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import requests
+
+import http_client
+from http_client import CircuitOpenError
+from rate_limit import get_circuit_breaker
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so the client can keep the connection alive between requests.
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.client_address, time.monotonic()))
+            status, headers = server.script.pop(0) if server.script else (200, {})
+        body = b'{"ok": true}'
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer:
+    """Answers GETs with the scripted (status, headers) in order, then 200s."""
+
+    def __init__(self):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.httpd.script = []
+        self.httpd.requests = []
+        self.httpd.lock = threading.Lock()
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def script(self, *responses):
+        self.httpd.script.extend(responses)
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _unused_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class HTTPClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        # A fresh upstream name per test: breakers and retry counts are process-wide.
+        self.upstream = f"stub-{self.id().rsplit('.', 1)[-1]}"
+        patcher = mock.patch.multiple(http_client, HTTP_BACKOFF_BASE=0.01, HTTP_BACKOFF_MAX=2.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_retries_retryable_status(self):
+        self.server.script((503, {}), (502, {}))
+        response = http_client.get(self.server.url, self.upstream)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(http_client.retry_counts[self.upstream], 2)
+
+    def test_returns_last_response_when_retries_run_out(self):
+        self.server.script((500, {}), (500, {}), (500, {}))
+        response = http_client.get(self.server.url, self.upstream, max_retries=2)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_does_not_retry_client_errors(self):
+        self.server.script((404, {}))
+        response = http_client.get(self.server.url, self.upstream)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_honours_retry_after(self):
+        self.server.script((503, {"Retry-After": "1"}))
+        response = http_client.get(self.server.url, self.upstream)
+        self.assertEqual(response.status_code, 200)
+        (_, _, first), (_, _, second) = self.server.requests
+        self.assertGreaterEqual(second - first, 0.9)
+
+    def test_retries_connection_errors(self):
+        url = f"http://127.0.0.1:{_unused_port()}/"
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            http_client.get(url, self.upstream, max_retries=2)
+        self.assertEqual(http_client.retry_counts[self.upstream], 2)
+
+    def test_429_opens_the_circuit(self):
+        self.server.script((429, {"Retry-After": "60"}))
+        response = http_client.get(self.server.url, self.upstream, max_retries=0)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(get_circuit_breaker(self.upstream).state, "open")
+        with self.assertRaises(CircuitOpenError) as raised:
+            http_client.get(self.server.url, self.upstream)
+        self.assertGreater(raised.exception.retry_after, 0)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_reuses_pooled_session_and_connection(self):
+        self.assertIs(http_client.get_session(self.server.url), http_client.get_session(self.server.url + "other"))
+        for _ in range(5):
+            http_client.get(self.server.url, self.upstream).content
+        client_addresses = {address for _, address, _ in self.server.requests}
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(len(client_addresses), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
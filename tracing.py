@@ -0,0 +1,253 @@
+import bisect
+import contextlib
+import contextvars
+import os
+import re
+import threading
+import time
+import uuid
+
+# Upper bounds (seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'True').lower() not in ['false', '0', 'no']
+# Prints one timing summary line per request when enabled.
+TRACE_LOG_REQUESTS = os.getenv('TRACE_LOG_REQUESTS', 'True').lower() not in ['false', '0', 'no']
+
+_TRACE_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{8,64}$")
+
+
+class LatencyHistogram:
+    """Latency histogram with Prometheus-style upper bounds (per-bucket, non-cumulative counts)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += 1
+            self.sum += seconds
+
+    def snapshot(self):
+        with self._lock:
+            labels = [f"le_{bound}" for bound in self.buckets] + ["le_inf"]
+            return {
+                "count": self.total,
+                "sum_seconds": round(self.sum, 4),
+                "buckets": dict(zip(labels, self.counts)),
+            }
+
+    def prometheus_lines(self, name, labels=""):
+        with self._lock:
+            counts, total, total_sum = list(self.counts), self.total, self.sum
+        label_prefix = f"{labels}," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label_prefix}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{label_prefix}le="+Inf"}} {total}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {total_sum:.6f}")
+        lines.append(f"{name}_count{suffix} {total}")
+        return lines
+
+
+class Trace:
+    """Timed spans and attributes collected for one request."""
+
+    def __init__(self, trace_id=None, name=""):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []
+        self.attributes = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name, start, duration, attributes):
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "start_ms": round((start - self.started) * 1000, 2),
+                "duration_ms": round(duration * 1000, 2),
+                **attributes,
+            })
+
+    def add_attributes(self, **attributes):
+        with self._lock:
+            for key, value in attributes.items():
+                if isinstance(value, (int, float)) and isinstance(self.attributes.get(key), (int, float)):
+                    self.attributes[key] += value
+                else:
+                    self.attributes[key] = value
+
+    def stage_totals(self):
+        """Total milliseconds per span name, in first-seen order."""
+        totals = {}
+        with self._lock:
+            for span_data in self.spans:
+                totals[span_data["name"]] = totals.get(span_data["name"], 0.0) + span_data["duration_ms"]
+        return totals
+
+    def server_timing(self):
+        entries = [f"{name};dur={duration:.1f}" for name, duration in self.stage_totals().items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_metrics_lock = threading.Lock()
+stage_histograms = {}
+request_histograms = {}
+request_counts = {}
+counters = {}
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def _stage_histogram(name):
+    histogram = stage_histograms.get(name)
+    if histogram is None:
+        with _metrics_lock:
+            histogram = stage_histograms.setdefault(name, LatencyHistogram())
+    return histogram
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """
+    Times a stage. The duration feeds the per-stage histogram behind /metrics
+    and, when a request is being traced, is added to its spans. The yielded
+    dict can be filled with attributes (status codes, sizes) inside the block.
+    """
+    if not TRACING_ENABLED:
+        yield attributes
+        return
+    start = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        duration = time.perf_counter() - start
+        _stage_histogram(name).observe(duration)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(name, start, duration, attributes)
+
+
+def increment(counter_name, amount=1):
+    """Adds to a process-wide counter and to the current trace's attributes."""
+    with _metrics_lock:
+        counters[counter_name] = counters.get(counter_name, 0) + amount
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_attributes(**{counter_name: amount})
+
+
+def wrap(fn):
+    """Binds `fn` to the caller's trace so it can run on an executor thread."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def begin_request(incoming_trace_id, path):
+    """Starts a trace for an incoming request. Returns the token to pass to end_request, or None."""
+    if not TRACING_ENABLED:
+        return None
+    trace_id = incoming_trace_id if incoming_trace_id and _TRACE_ID_PATTERN.match(incoming_trace_id) else None
+    return _current_trace.set(Trace(trace_id, name=path))
+
+
+def finish_request(method, route, status_code):
+    """
+    Records the current request's latency and status under `route` and logs
+    its summary line. Returns the response headers to add ({} when untraced).
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return {}
+    elapsed = time.perf_counter() - trace.started
+    with _metrics_lock:
+        key = (route, status_code)
+        request_counts[key] = request_counts.get(key, 0) + 1
+        histogram = request_histograms.setdefault(route, LatencyHistogram())
+    histogram.observe(elapsed)
+    if TRACE_LOG_REQUESTS and route not in ("/metrics", "/static/<path:filename>"):
+        stages = " ".join(f"{name}={duration:.0f}ms" for name, duration in trace.stage_totals().items())
+        extras = " ".join(f"{key}={value}" for key, value in trace.attributes.items())
+        print(f"⏱️ trace={trace.trace_id} {method} {route} {status_code} total={elapsed * 1000:.0f}ms {stages} {extras}".rstrip())
+    return {"Server-Timing": trace.server_timing(), "X-Trace-Id": trace.trace_id}
+
+
+def end_request(token):
+    if token is not None:
+        _current_trace.reset(token)
+
+
+def init_app(app):
+    """Registers per-request trace setup and Server-Timing / X-Trace-Id headers on a Flask app."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_trace():
+        g.trace_token = begin_request(request.headers.get("X-Request-ID", ""), request.path)
+
+    @app.after_request
+    def _finish_trace(response):
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        response.headers.update(finish_request(request.method, route, response.status_code))
+        return response
+
+    @app.teardown_request
+    def _end_trace(exc):
+        end_request(g.pop("trace_token", None))
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def render_prometheus(upstream_histograms=None, gauges=None):
+    """
+    Prometheus text exposition of request, stage and upstream latencies plus
+    counters. `gauges` is a flat {metric_name: value} dict of extra values.
+    """
+    lines = [
+        "# TYPE gf_http_requests_total counter",
+    ]
+    with _metrics_lock:
+        request_count_items = sorted(request_counts.items())
+        request_histogram_items = sorted(request_histograms.items())
+        stage_items = sorted(stage_histograms.items())
+        counter_items = sorted(counters.items())
+    for (route, status), count in request_count_items:
+        lines.append(f'gf_http_requests_total{{route="{_escape_label(route)}",status="{status}"}} {count}')
+
+    lines.append("# TYPE gf_http_request_duration_seconds histogram")
+    for route, histogram in request_histogram_items:
+        lines.extend(histogram.prometheus_lines("gf_http_request_duration_seconds", f'route="{_escape_label(route)}"'))
+
+    lines.append("# TYPE gf_stage_duration_seconds histogram")
+    for stage, histogram in stage_items:
+        lines.extend(histogram.prometheus_lines("gf_stage_duration_seconds", f'stage="{_escape_label(stage)}"'))
+
+    lines.append("# TYPE gf_upstream_request_duration_seconds histogram")
+    for upstream, histogram in sorted((upstream_histograms or {}).items()):
+        lines.extend(histogram.prometheus_lines("gf_upstream_request_duration_seconds", f'upstream="{_escape_label(upstream)}"'))
+
+    for counter_name, value in counter_items:
+        lines.append(f"# TYPE gf_{counter_name}_total counter")
+        lines.append(f"gf_{counter_name}_total {value}")
+
+    for gauge_name, value in sorted((gauges or {}).items()):
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, (int, float)):
+            lines.append(f"gf_{gauge_name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,298 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+# Leave empty to disable the index and /nearby.
+VENUE_INDEX_DB_PATH = os.getenv('VENUE_INDEX_DB_PATH', 'venue_index.db')
+# A region whose last Places search is older than this is searched again.
+VENUE_COVERAGE_TTL_DAYS = float(os.getenv('VENUE_COVERAGE_TTL_DAYS', 7))
+NEARBY_DEFAULT_RADIUS_METERS = 1500
+NEARBY_MAX_RADIUS_METERS = int(os.getenv('NEARBY_MAX_RADIUS_METERS', 5000))
+# Venues are stored under a 9-character geohash (~5 m); coverage is tracked per
+# 5-character cell (~4.9 x 4.9 km at the equator, narrower towards the poles).
+VENUE_GEOHASH_PRECISION = 9
+COVERAGE_GEOHASH_PRECISION = 5
+# Queries read at most this many geohash buckets, choosing coarser ones for wide radii.
+MAX_QUERY_CELLS = 16
+
+EARTH_RADIUS_METERS = 6371000
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_BASE32_INDEX = {char: index for index, char in enumerate(_BASE32)}
+
+
+def geohash_encode(lat, lng, precision=VENUE_GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value, interval = (lng, lng_range) if even else (lat, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = bit_count = 0
+    return "".join(chars)
+
+
+def geohash_bounds(geohash):
+    """(south, west, north, east) of a geohash cell."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = _BASE32_INDEX[char]
+        for shift in range(4, -1, -1):
+            interval = lng_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if bits >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+
+def cell_size_degrees(precision):
+    """(height, width) in degrees of a geohash cell of `precision` characters."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def distance_meters(lat1, lng1, lat2, lng2):
+    """Haversine distance."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _bounding_box(lat, lng, radius_meters):
+    d_lat = math.degrees(radius_meters / EARTH_RADIUS_METERS)
+    d_lng = d_lat / max(math.cos(math.radians(lat)), 0.01)
+    return max(lat - d_lat, -90.0), lng - d_lng, min(lat + d_lat, 90.0), lng + d_lng
+
+
+def covering_cells(lat, lng, radius_meters, precision):
+    """The geohash cells of `precision` characters that overlap the circle's bounding box."""
+    south, west, north, east = _bounding_box(lat, lng, radius_meters)
+    height, width = cell_size_degrees(precision)
+    cells = set()
+    row = south
+    while True:
+        column = west
+        while True:
+            wrapped = (column + 180.0) % 360.0 - 180.0
+            cells.add(geohash_encode(min(row, 90.0 - 1e-9), wrapped, precision))
+            if column >= east:
+                break
+            column = min(column + width, east)
+        if row >= north:
+            break
+        row = min(row + height, north)
+    return cells
+
+
+def coverage_regions(lat, lng, radius_meters):
+    """The coverage cells a /nearby circle touches."""
+    return covering_cells(lat, lng, radius_meters, COVERAGE_GEOHASH_PRECISION)
+
+
+def region_center(cell):
+    """(lat, lng, radius_meters) of the circle around a coverage cell, for a Places location search."""
+    south, west, north, east = geohash_bounds(cell)
+    lat, lng = (south + north) / 2, (west + east) / 2
+    return lat, lng, math.ceil(distance_meters(lat, lng, north, east))
+
+
+class VenueIndex:
+    """
+    SQLite index of classified venues by location.
+
+    Every search that classifies places records their coordinates here under a
+    geohash, together with their GF status and the establishment types they
+    were found to match, so /nearby can answer from a few prefix range scans.
+    `coverage` remembers when each region was last searched with a Places
+    location search, per type, so the caller knows which regions to refresh.
+    """
+
+    def __init__(self, db_path, coverage_ttl_days=VENUE_COVERAGE_TTL_DAYS):
+        self.db_path = db_path
+        self.coverage_ttl_seconds = coverage_ttl_days * 24 * 60 * 60
+        self._local = threading.local()
+        self._initialized = False
+        self._init_lock = threading.Lock()
+        self.queries = 0
+        self.recorded = 0
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                with conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS venues ("
+                        " place_id TEXT PRIMARY KEY,"
+                        " geohash TEXT NOT NULL,"
+                        " lat REAL NOT NULL,"
+                        " lng REAL NOT NULL,"
+                        " name TEXT,"
+                        " address TEXT,"
+                        " gf_status TEXT NOT NULL,"
+                        " types TEXT NOT NULL,"
+                        " updated_at REAL NOT NULL)"
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS venues_geohash ON venues (geohash)")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS coverage ("
+                        " cell TEXT NOT NULL,"
+                        " type TEXT NOT NULL,"
+                        " searched_at REAL NOT NULL,"
+                        " PRIMARY KEY (cell, type))"
+                    )
+                self._initialized = True
+        return conn
+
+    def record(self, places_list, establishments, type_):
+        """
+        Stores the result of one classified search. Places in `establishments`
+        gain `type_`; other places in `places_list` lose it, and venues left
+        without any matching type are dropped. Places without coordinates are skipped.
+        """
+        located = {place['place_id']: place for place in places_list if place.get('location')}
+        if not located:
+            return
+        statuses = {record["place_id"]: record["status"] for record in establishments}
+        now = time.time()
+        try:
+            conn = self._connect()
+            placeholders = ",".join("?" * len(located))
+            existing = dict(conn.execute(
+                f"SELECT place_id, types FROM venues WHERE place_id IN ({placeholders})", list(located)
+            ).fetchall())
+            with conn:
+                for place_id, place in located.items():
+                    types = set(json.loads(existing[place_id])) if place_id in existing else set()
+                    if place_id in statuses:
+                        types.add(type_)
+                    else:
+                        types.discard(type_)
+                    if not types:
+                        conn.execute("DELETE FROM venues WHERE place_id = ?", (place_id,))
+                        continue
+                    lat, lng = place['location']['lat'], place['location']['lng']
+                    conn.execute(
+                        "INSERT INTO venues (place_id, geohash, lat, lng, name, address, gf_status, types, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT(place_id) DO UPDATE SET geohash = excluded.geohash, lat = excluded.lat, "
+                        "lng = excluded.lng, name = excluded.name, address = excluded.address, "
+                        "gf_status = CASE WHEN ? THEN excluded.gf_status ELSE venues.gf_status END, "
+                        "types = excluded.types, updated_at = excluded.updated_at",
+                        (place_id, geohash_encode(lat, lng), lat, lng, place.get('name'), place.get('address'),
+                         statuses.get(place_id, ""), json.dumps(sorted(types)), now, place_id in statuses),
+                    )
+            self.recorded += len(statuses)
+        except sqlite3.Error as e:
+            print(f"⚠️ Venue index write failed: {e}")
+
+    def nearby(self, lat, lng, radius_meters, type_=None, limit=50):
+        """Venues within `radius_meters`, nearest first, optionally only those matching `type_`."""
+        south, west, north, east = _bounding_box(lat, lng, radius_meters)
+        precision = VENUE_GEOHASH_PRECISION
+        while precision > 1:
+            height, width = cell_size_degrees(precision)
+            if (math.ceil((north - south) / height) + 1) * (math.ceil((east - west) / width) + 1) <= MAX_QUERY_CELLS:
+                break
+            precision -= 1
+        cells = covering_cells(lat, lng, radius_meters, precision)
+        where = " OR ".join("(geohash >= ? AND geohash < ?)" for _ in cells)
+        bounds = [value for cell in sorted(cells) for value in (cell, cell + "{")]
+        self.queries += 1
+        try:
+            rows = self._connect().execute(
+                f"SELECT place_id, name, address, gf_status, types, lat, lng FROM venues WHERE {where}", bounds
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"⚠️ Venue index read failed: {e}")
+            return []
+        venues = []
+        for place_id, name, address, gf_status, types, venue_lat, venue_lng in rows:
+            types = json.loads(types)
+            if type_ is not None and type_ not in types:
+                continue
+            distance = distance_meters(lat, lng, venue_lat, venue_lng)
+            if distance <= radius_meters:
+                venues.append({
+                    "place_id": place_id,
+                    "name": name,
+                    "address": address,
+                    "status": gf_status,
+                    "types": types,
+                    "location": {"lat": venue_lat, "lng": venue_lng},
+                    "distance_meters": round(distance),
+                })
+        venues.sort(key=lambda venue: venue["distance_meters"])
+        return venues[:limit]
+
+    def stale_regions(self, cells, type_):
+        """The coverage cells among `cells` that were never searched for `type_`, or not recently."""
+        placeholders = ",".join("?" * len(cells))
+        try:
+            searched = dict(self._connect().execute(
+                f"SELECT cell, searched_at FROM coverage WHERE type = ? AND cell IN ({placeholders})",
+                [type_, *cells],
+            ).fetchall())
+        except sqlite3.Error as e:
+            print(f"⚠️ Venue index read failed: {e}")
+            return []
+        oldest_allowed = time.time() - self.coverage_ttl_seconds
+        return sorted(cell for cell in cells if searched.get(cell, 0) < oldest_allowed)
+
+    def coverage_expiry(self, cell, type_):
+        try:
+            row = self._connect().execute(
+                "SELECT searched_at FROM coverage WHERE cell = ? AND type = ?", (cell, type_)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] + self.coverage_ttl_seconds if row else None
+
+    def mark_covered(self, cell, type_):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO coverage (cell, type, searched_at) VALUES (?, ?, ?)",
+                    (cell, type_, time.time()),
+                )
+        except sqlite3.Error as e:
+            print(f"⚠️ Venue index write failed: {e}")
+
+    def stats(self):
+        try:
+            conn = self._connect()
+            venues = conn.execute("SELECT COUNT(*) FROM venues").fetchone()[0]
+            regions = conn.execute("SELECT COUNT(*) FROM coverage").fetchone()[0]
+        except sqlite3.Error:
+            venues = regions = None
+        return {"path": self.db_path, "venues": venues, "covered_regions": regions,
+                "queries": self.queries, "recorded": self.recorded}
+
+
+venue_index = VenueIndex(VENUE_INDEX_DB_PATH) if VENUE_INDEX_DB_PATH else None